@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+  Compare parse time and peak memory of the streaming .cell tokenizer against
+  the old whole-file regex parser.
+
+  usage: python benchmarks/cell_parse.py [num_atoms] [repeats]
+"""
+import os, sys
+import re
+import time
+import tempfile
+import resource
+import multiprocessing
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from castepy.input.cell import tokenize_cell
+
+def regex_parse_cell(cell):
+  """
+    The original Cell.parse_cell block/keyword split, kept here as the reference.
+  """
+  block_re = re.compile(r"%block (.*?)\n(.*?\n{0,})%endblock (.*?)\n", re.I | re.S | re.M)
+
+  blocks = {}
+  otherdict = {}
+
+  cell = cell.replace("\r\n", "\n")
+
+  for name, content, _ in block_re.findall(cell):
+    blocks[name.upper()] = [l.strip() for l in content.split('\n') if len(l.strip()) > 0]
+
+  cell_sans_blocks = block_re.sub("", cell)
+  for o in re.split("\n\s{0,}", cell_sans_blocks):
+    o_s = o.strip()
+    if len(o_s) > 0:
+      o_split = re.split("[\s:]+", o_s, maxsplit=1)
+
+      if len(o_split) == 2:
+        otherdict[o_split[0]] = o_split[1]
+      else:
+        otherdict[o_split[0]] = None
+
+  return blocks, otherdict
+
+def regex_path(path):
+  return regex_parse_cell(open(path).read())
+
+def stream_path(path):
+  blocks = {}
+  otherdict = {}
+
+  with open(path) as f:
+    for kind, name, value in tokenize_cell(f):
+      if kind == 'block':
+        blocks[name] = value
+      else:
+        otherdict[name] = value
+
+  return blocks, otherdict
+
+def write_cell(path, num_atoms):
+  """
+    Write a random cubic supercell with num_atoms atoms.
+  """
+  size = 2.5 * num_atoms ** (1.0/3.0)
+  positions = numpy.random.random((num_atoms, 3)) * size
+  species = ['C', 'H', 'O', 'N']
+
+  with open(path, "w") as f:
+    f.write("%BLOCK LATTICE_CART\n")
+    f.write("ang\n")
+    for row in numpy.diag([size]*3):
+      f.write("%f %f %f\n" % tuple(row))
+    f.write("%ENDBLOCK LATTICE_CART\n\n")
+
+    f.write("%BLOCK POSITIONS_ABS\n")
+    for n, p in enumerate(positions):
+      f.write("%s %f %f %f\n" % (species[n % 4], p[0], p[1], p[2]))
+    f.write("%ENDBLOCK POSITIONS_ABS\n\n")
+
+    f.write("kpoint_mp_grid 1 1 1\n")
+    f.write("fix_all_cell : true\n")
+    f.write("symmetry_generate\n")
+
+def _measure(args):
+  func, path, repeats = args
+
+  base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+  times = []
+  for n in range(repeats):
+    t0 = time.time()
+    func(path)
+    times.append(time.time() - t0)
+
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+  return min(times), (peak - base) / 1024.0
+
+def measure(func, path, repeats):
+  """
+    Run in a fresh process so that the peak RSS belongs to this parser alone.
+  """
+  pool = multiprocessing.Pool(1)
+  try:
+    return pool.map(_measure, [(func, path, repeats)])[0]
+  finally:
+    pool.close()
+    pool.join()
+
+if __name__ == "__main__":
+  num_atoms = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+  repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+  fd, path = tempfile.mkstemp(suffix=".cell")
+  os.close(fd)
+
+  try:
+    write_cell(path, num_atoms)
+
+    if regex_path(path) != stream_path(path):
+      raise Exception("Streaming tokenizer and regex parser disagree")
+
+    print "%d atoms, %.1f MB" % (num_atoms, os.path.getsize(path) / 1024.0**2)
+    print "%-10s %12s %14s" % ("parser", "time (s)", "peak RSS (MB)")
+
+    for name, func in [("regex", regex_path), ("stream", stream_path)]:
+      t, mem = measure(func, path, repeats)
+      print "%-10s %12.4f %14.1f" % (name, t, mem)
+  finally:
+    os.remove(path)
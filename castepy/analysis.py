@@ -0,0 +1,403 @@
+import copy
+import numpy
+import multiprocessing
+
+from atoms import AtomsView, species_indices
+from periodic import NeighbourIndex
+from radii import bond_cutoffs
+from output.bonds import BondsResult
+import geometry
+
+def frames(source):
+  """
+    Generate (species, positions, lattice) for every structure in source: a Cell, an
+    AtomsView, a Trajectory, a GeomFile or any iterable of those or of GeomFrames.
+  """
+  if hasattr(source, 'ions'):
+    source = source.ions
+
+  if isinstance(source, AtomsView):
+    yield numpy.asarray(source.species_array, dtype=str), source.positions, source.lattice
+
+  elif hasattr(source, 'positions') and hasattr(source, 'lattices'):
+    # Trajectory, straight from its arrays
+    for n in range(len(source)):
+      yield source.species, numpy.asarray(source.positions[n]), source.lattice(n)
+
+  elif hasattr(source, 'positions') and hasattr(source, 'species'):
+    yield numpy.asarray(source.species, dtype=str), source.positions, source.lattice
+
+  else:
+    for item in source:
+      for frame in frames(item):
+        yield frame
+
+class Analysis(object):
+  """
+    A histogram accumulated a frame at a time. Subclasses give add, which takes the
+    species, positions and lattice of a frame, and merge, which adds in another
+    accumulation of the same kind, e.g. from another process.
+  """
+
+  def __init__(self):
+    self.species = None
+    self.num_frames = 0
+
+  def _codes(self, species):
+    """
+      Species of each atom as a row of self.species, which the first frame sets.
+    """
+    if self.species is None:
+      self.species = numpy.unique(species)
+      self._start()
+
+    codes = numpy.searchsorted(self.species, species)
+
+    if (codes >= len(self.species)).any() or (self.species[numpy.minimum(codes, len(self.species) - 1)] != species).any():
+      raise ValueError("Frame has species other than %s" % self.species.tolist())
+
+    return codes
+
+  def _start(self):
+    pass
+
+  def empty(self):
+    """
+      A copy of the analysis with nothing accumulated yet.
+    """
+    other = copy.copy(self)
+    other.species = None
+    other.num_frames = 0
+
+    return other
+
+  def _check_merge(self, other):
+    if other.species is None:
+      return False
+
+    if self.species is None:
+      self.species = other.species
+      self._start()
+
+    elif self.species.tolist() != other.species.tolist():
+      raise ValueError("Can't merge accumulations of different species")
+
+    self.num_frames += other.num_frames
+
+    return True
+
+  def _row(self, species):
+    return int(numpy.flatnonzero(self.species == species)[0])
+
+class RDF(Analysis):
+  """
+    Radial distribution function, total and for each pair of species, averaged over
+    frames. Needs a lattice, counting every periodic image out to r_max.
+
+    >>> rdf = RDF(r_max=8.0, bins=400)
+    >>> accumulate(GeomFile("run.md"), [rdf], workers=8)
+    >>> rdf.r, rdf.g('Si', 'O'), rdf.coordination('Si', 'O')
+  """
+
+  def __init__(self, r_max=6.0, bins=300):
+    Analysis.__init__(self)
+    self.r_max = float(r_max)
+    self.bins = int(bins)
+
+  def _start(self):
+    num = len(self.species)
+
+    # Ordered pair counts, sums over frames of N_a N_b / V and of N_a
+    self.counts = numpy.zeros((num, num, self.bins))
+    self.norm = numpy.zeros((num, num))
+    self.atoms = numpy.zeros(num)
+
+  @property
+  def edges(self):
+    return numpy.linspace(0.0, self.r_max, self.bins + 1)
+
+  @property
+  def r(self):
+    """
+      Bin centres in A.
+    """
+    edges = self.edges
+    return (edges[1:] + edges[:-1]) / 2.0
+
+  def add(self, species, positions, lattice):
+    if lattice is None:
+      raise ValueError("An RDF needs a lattice")
+
+    codes = self._codes(species)
+    num = len(self.species)
+
+    i, j, _, dists = NeighbourIndex(positions, lattice, self.r_max).pairs_within(self.r_max)
+
+    bins = (dists * (self.bins / self.r_max)).astype(int)
+    keep = (bins < self.bins) & (dists > 0.0)
+    i, j, bins = i[keep], j[keep], bins[keep]
+
+    # Each pair counts once from either end
+    ci, cj = codes[i], codes[j]
+    flat = numpy.concatenate(((ci * num + cj) * self.bins + bins, (cj * num + ci) * self.bins + bins))
+    self.counts += numpy.bincount(flat, minlength=num * num * self.bins).reshape(num, num, self.bins)
+
+    per_species = numpy.bincount(codes, minlength=num).astype(float)
+    volume = abs(numpy.linalg.det(lattice))
+
+    # Every atom's own images count too, so there are N_a N_b ordered pairs, not N_a (N_a - 1)
+    self.norm += numpy.outer(per_species, per_species) / volume
+    self.atoms += per_species
+    self.num_frames += 1
+
+  def merge(self, other):
+    if self._check_merge(other):
+      self.counts += other.counts
+      self.norm += other.norm
+      self.atoms += other.atoms
+
+  def _select(self, s1, s2):
+    """
+      Rows of the species pair, all species for None.
+    """
+    rows1 = range(len(self.species)) if s1 is None else [self._row(s1)]
+    rows2 = range(len(self.species)) if s2 is None else [self._row(s2)]
+
+    return numpy.ix_(rows1, rows2)
+
+  def g(self, s1=None, s2=None):
+    """
+      g(r) of species s2 around species s1, the total g(r) if both are None.
+    """
+    edges = self.edges
+    shells = 4.0 / 3.0 * numpy.pi * (edges[1:]**3 - edges[:-1]**3)
+
+    rows = self._select(s1, s2)
+    norm = self.norm[rows].sum()
+
+    if norm == 0.0:
+      return numpy.zeros(self.bins)
+
+    return self.counts[rows].sum(axis=(0, 1)) / (norm * shells)
+
+  def coordination(self, s1=None, s2=None):
+    """
+      Running coordination number, the mean number of atoms of species s2 within r of
+      an atom of species s1.
+    """
+    rows = self._select(s1, s2)
+    atoms = self.atoms[rows[0][:,0]].sum()
+
+    if atoms == 0.0:
+      return numpy.zeros(self.bins)
+
+    return numpy.cumsum(self.counts[rows].sum(axis=(0, 1))) / atoms
+
+class Coordination(Analysis):
+  """
+    Histograms of the number of atoms bonded to each atom, by covalent radius cutoffs
+    as in BondsResult.from_geometry.
+
+    histogram[a, b, n] counts atoms of species a with n neighbours of species b,
+    b = len(species) counting neighbours of every species. max_n or more neighbours
+    are counted as max_n.
+
+    >>> coordination = Coordination()
+    >>> accumulate(traj, [coordination])
+    >>> coordination.distribution('Si', 'O')
+  """
+
+  def __init__(self, tol=0.45, cutoffs=None, max_n=12):
+    Analysis.__init__(self)
+    self.tol = tol
+    self.cutoffs = cutoffs
+    self.max_n = int(max_n)
+
+  def _start(self):
+    num = len(self.species)
+
+    self.table = bond_cutoffs(self.species, self.tol, self.cutoffs)
+    self.histogram = numpy.zeros((num, num + 1, self.max_n + 1), dtype=numpy.int64)
+
+  def add(self, species, positions, lattice):
+    codes = self._codes(species)
+    num = len(self.species)
+    num_atoms = len(codes)
+
+    index = NeighbourIndex(positions, lattice, numpy.nanmax(self.table))
+    i, j, _, dists = index.pairs_within(numpy.nanmax(self.table))
+
+    keep = (dists <= self.table[codes[i], codes[j]]) & (dists > 0.0)
+    i, j = i[keep], j[keep]
+
+    # Neighbours of each atom by species, then of any species
+    atom = numpy.concatenate((i, j))
+    other = numpy.concatenate((codes[j], codes[i]))
+
+    neighbours = numpy.zeros((num_atoms, num + 1), dtype=int)
+    neighbours[:,:num] = numpy.bincount(atom * num + other, minlength=num_atoms * num).reshape(num_atoms, num)
+    neighbours[:,num] = neighbours[:,:num].sum(axis=1)
+
+    neighbours = numpy.minimum(neighbours, self.max_n)
+
+    flat = (codes[:,None] * (num + 1) + numpy.arange(num + 1)[None,:]) * (self.max_n + 1) + neighbours
+    self.histogram += numpy.bincount(flat.ravel(), minlength=self.histogram.size).reshape(self.histogram.shape)
+    self.num_frames += 1
+
+  def merge(self, other):
+    if self._check_merge(other):
+      self.histogram += other.histogram
+
+  def distribution(self, s1, s2=None):
+    """
+      Fraction of atoms of species s1 with 0, 1, ..., max_n neighbours of species s2,
+      or of any species if s2 is None.
+    """
+    row = self._row(s1)
+    col = len(self.species) if s2 is None else self._row(s2)
+
+    counts = self.histogram[row, col].astype(float)
+    return counts / max(1.0, counts.sum())
+
+  def mean(self, s1, s2=None):
+    """
+      Mean number of neighbours of species s2 of the atoms of species s1.
+    """
+    return (self.distribution(s1, s2) * numpy.arange(self.max_n + 1)).sum()
+
+class AngleDistribution(Analysis):
+  """
+    Histograms of bond angles, bonds found by covalent radius cutoffs as in
+    BondsResult.from_geometry, for every triplet of species.
+
+    histogram[a, c, b] counts angles in degrees at an atom of species c between its
+    bonds to atoms of species a and b, with a <= b.
+
+    >>> angles = AngleDistribution(bins=90)
+    >>> accumulate(traj, [angles])
+    >>> angles.distribution('O', 'Si', 'O')
+  """
+
+  def __init__(self, bins=180, tol=0.45, cutoffs=None):
+    Analysis.__init__(self)
+    self.bins = int(bins)
+    self.tol = tol
+    self.cutoffs = cutoffs
+
+  def _start(self):
+    num = len(self.species)
+    self.histogram = numpy.zeros((num, num, num, self.bins), dtype=numpy.int64)
+
+  @property
+  def edges(self):
+    return numpy.linspace(0.0, 180.0, self.bins + 1)
+
+  @property
+  def theta(self):
+    """
+      Bin centres in degrees.
+    """
+    edges = self.edges
+    return (edges[1:] + edges[:-1]) / 2.0
+
+  def add(self, species, positions, lattice):
+    codes = self._codes(species)
+    num = len(self.species)
+
+    atoms = AtomsView.from_arrays(species, species_indices(species), positions, lattice=lattice)
+    bonds = BondsResult.from_geometry(atoms, self.tol, self.cutoffs)
+
+    triplets, theta = geometry.angles(bonds, atoms)
+
+    a, c, b = codes[triplets[:,0]], codes[triplets[:,1]], codes[triplets[:,2]]
+    a, b = numpy.minimum(a, b), numpy.maximum(a, b)
+
+    bins = numpy.minimum((numpy.degrees(theta) * (self.bins / 180.0)).astype(int), self.bins - 1)
+
+    flat = ((a * num + c) * num + b) * self.bins + bins
+    self.histogram += numpy.bincount(flat, minlength=self.histogram.size).reshape(self.histogram.shape)
+    self.num_frames += 1
+
+  def merge(self, other):
+    if self._check_merge(other):
+      self.histogram += other.histogram
+
+  def distribution(self, s1=None, centre=None, s2=None):
+    """
+      Normalised distribution of the angles at species centre between bonds to s1 and
+      s2, in 1/degree. None matches any species.
+    """
+    num = len(self.species)
+
+    def matches(s):
+      mask = numpy.zeros(num, dtype=bool)
+      mask[slice(None) if s is None else self._row(s)] = True
+      return mask
+
+    m1, m2 = matches(s1), matches(s2)
+
+    # Only a <= b is stored, so match either way round
+    pairs = (m1[:,None] & m2[None,:]) | (m2[:,None] & m1[None,:])
+    pairs &= numpy.triu(numpy.ones((num, num), dtype=bool))
+
+    selected = self.histogram[:,matches(centre)] * pairs[:,None,:,None]
+    counts = selected.sum(axis=(0, 1, 2)).astype(float)
+
+    total = counts.sum()
+    if total == 0:
+      return counts
+
+    return counts / (total * (180.0 / self.bins))
+
+def _accumulate(args):
+  analyses, chunk = args
+
+  for species, positions, lattice in chunk:
+    for analysis in analyses:
+      analysis.add(species, positions, lattice)
+
+  return analyses
+
+def _chunks(source, size):
+  chunk = []
+
+  for frame in frames(source):
+    chunk.append(frame)
+
+    if len(chunk) == size:
+      yield chunk
+      chunk = []
+
+  if chunk:
+    yield chunk
+
+def accumulate(source, analyses, workers=1, chunksize=16):
+  """
+    Add every frame of source, see frames, to each of the analyses.
+
+    With workers other than 1, chunks of chunksize frames are spread over a pool of
+    processes, None meaning one per CPU, each accumulating into its own copies of
+    the analyses which are then merged back. Frames are read in this process as
+    they're needed, so a file of frames is never all in memory.
+
+    Returns the analyses.
+
+    >>> rdf, coordination = accumulate(traj, [RDF(), Coordination()], workers=8)
+  """
+  if workers == 1:
+    _accumulate((analyses, frames(source)))
+    return analyses
+
+  pool = multiprocessing.Pool(workers)
+
+  try:
+    jobs = (([analysis.empty() for analysis in analyses], chunk) for chunk in _chunks(source, chunksize))
+
+    for done in pool.imap_unordered(_accumulate, jobs):
+      for analysis, part in zip(analyses, done):
+        analysis.merge(part)
+  finally:
+    pool.close()
+    pool.join()
+
+  return analyses
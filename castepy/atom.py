@@ -76,6 +76,83 @@ class Atom(object):
     """
     return self._position
 
+class ArrayAtom(Atom):
+  """
+    An atom whose data lives in one row of an AtomsArray. These are lightweight views
+    created on demand, changes to them are written straight back to the arrays.
+
+    Views of the same row compare equal, and any other attributes set on them, e.g.
+    ion.magres, are kept by the AtomsArray so every view of the row sees them.
+  """
+
+  def __init__(self, store, row):
+    object.__setattr__(self, '_store', store)
+    object.__setattr__(self, '_row', row)
+
+  def __getattr__(self, name):
+    if name.startswith('_'):
+      raise AttributeError(name)
+
+    try:
+      return self._store.extras[self._row][name]
+    except KeyError:
+      raise AttributeError(name)
+
+  def __setattr__(self, name, value):
+    if name.startswith('_') or hasattr(type(self), name):
+      object.__setattr__(self, name, value)
+    else:
+      self._store.extras.setdefault(self._row, {})[name] = value
+
+  def __eq__(self, other):
+    return isinstance(other, ArrayAtom) and other._store is self._store and other._row == self._row
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __hash__(self):
+    return hash((id(self._store), self._row))
+
+  @property
+  def label(self):
+    """
+      This atom's label.
+    """
+    return self._store.label_names[self._store.label_codes[self._row]]
+
+  @label.setter
+  def label(self, value):
+    self._store.set_label(self._row, value)
+
+  @property
+  def species(self):
+    """
+      This atom's species.
+    """
+    return self._store.species_names[self._store.species_codes[self._row]]
+
+  @species.setter
+  def species(self, value):
+    self._store.set_species(self._row, value)
+
+  @property
+  def index(self):
+    """
+      This atom's label index.
+    """
+    return int(self._store.indices[self._row])
+
+  @property
+  def position(self):
+    """
+      This atom's position in cartesian coordinates. Units are Angstroms.
+    """
+    return self._store.positions[self._row]
+
+  @position.setter
+  def position(self, value):
+    self._store.positions[self._row] = value
+
 class AtomImage(object):
   """
     A periodic image of a particular atom. Exactly like the underlying atom except for its position.
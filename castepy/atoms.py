@@ -3,7 +3,8 @@ import math
 import numpy
 import re
 
-from atom import Atom, AtomImage
+from atom import Atom, ArrayAtom, AtomImage
+from periodic import NeighbourIndex, minimum_image
 
 class ListPropertyView(list):
   """
@@ -41,6 +42,31 @@ def insideout():
     yield -i
     i += 1
 
+def species_indices(species):
+  """
+    Give the 1-based index of every atom within its own species, counting in order
+    of appearance as CASTEP does.
+
+    >>> species_indices(['H', 'C', 'H'])
+    array([1, 1, 2])
+  """
+
+  species = numpy.asarray(species)
+
+  if len(species) == 0:
+    return numpy.zeros(0, dtype=int)
+
+  _, codes = numpy.unique(species, return_inverse=True)
+
+  order = numpy.argsort(codes, kind='mergesort')
+  sorted_codes = codes[order]
+  group_start = numpy.searchsorted(sorted_codes, sorted_codes, side='left')
+
+  indices = numpy.empty(len(codes), dtype=int)
+  indices[order] = numpy.arange(len(codes)) - group_start + 1
+
+  return indices
+
 class LabelNotFound(Exception):
   pass
 
@@ -50,17 +76,157 @@ class SpeciesNotFound(Exception):
 class AtomNotFound(Exception):
   pass
 
+class AtomsArray(object):
+  """
+    Structure-of-arrays storage for a collection of atoms: an (N,3) positions array,
+    species and label codes into small name tables and the per-species indices.
+
+    Atom objects are only created on demand as ArrayAtom views into these arrays.
+    Any other attributes set on them are kept in extras, by row.
+  """
+
+  def __init__(self, species, indices, positions, labels=None):
+    self.positions = numpy.array(positions, dtype=numpy.float64).reshape(-1, 3)
+    self.indices = numpy.array(indices, dtype=numpy.int32).reshape(-1)
+
+    self.species_names, self.species_codes = self._encode(species)
+
+    if labels is None:
+      self.label_names, self.label_codes = list(self.species_names), self.species_codes.copy()
+    else:
+      self.label_names, self.label_codes = self._encode(labels)
+
+    if not (len(self.positions) == len(self.indices) == len(self.species_codes) == len(self.label_codes)):
+      raise ValueError("Atom arrays have mismatched lengths")
+
+    self.extras = {}
+
+  @staticmethod
+  def _encode(values):
+    """
+      Turn a sequence of strings into (names, codes) with names[codes] == values.
+    """
+    if len(values) == 0:
+      return [], numpy.zeros(0, dtype=numpy.int32)
+
+    names, codes = numpy.unique(numpy.asarray(values), return_inverse=True)
+
+    return [str(name) for name in names], codes.astype(numpy.int32)
+
+  @staticmethod
+  def _code(names, value):
+    if value not in names:
+      names.append(value)
+
+    return names.index(value)
+
+  def set_species(self, row, value):
+    self.species_codes[row] = self._code(self.species_names, value)
+
+  def set_label(self, row, value):
+    self.label_codes[row] = self._code(self.label_names, value)
+
+  @property
+  def species(self):
+    """
+      The species of every atom as an array of strings.
+    """
+    return numpy.array(self.species_names, dtype=object)[self.species_codes]
+
+  @property
+  def labels(self):
+    """
+      The label of every atom as an array of strings.
+    """
+    return numpy.array(self.label_names, dtype=object)[self.label_codes]
+
+  def atom(self, row):
+    """
+      A new Atom view of a given row. Views of the same row compare equal.
+    """
+    row = int(row)
+
+    if not -len(self) <= row < len(self):
+      raise IndexError(row)
+
+    if row < 0:
+      row += len(self)
+
+    return ArrayAtom(self, row)
+
+  def take(self, rows):
+    """
+      A new, independent AtomsArray holding copies of the given rows.
+    """
+    rows = numpy.asarray(rows, dtype=int)
+
+    new = AtomsArray.__new__(AtomsArray)
+    new.positions = self.positions[rows]
+    new.indices = self.indices[rows]
+    new.species_names = list(self.species_names)
+    new.species_codes = self.species_codes[rows]
+    new.label_names = list(self.label_names)
+    new.label_codes = self.label_codes[rows]
+    new.extras = {}
+
+    return new
+
+  def __len__(self):
+    return len(self.positions)
+
+class AtomList(object):
+  """
+    A read-only sequence of the atoms in some rows of an AtomsArray.
+  """
+
+  def __init__(self, store, rows):
+    self.store = store
+    self.rows = rows
+
+  def __getitem__(self, idx):
+    if isinstance(idx, slice):
+      return AtomList(self.store, self.rows[idx])
+    else:
+      return self.store.atom(self.rows[idx])
+
+  def __iter__(self):
+    atom = self.store.atom
+    for row in self.rows:
+      yield atom(row)
+
+  def __len__(self):
+    return len(self.rows)
+
 class AtomsView(object):
   """
     A container for a collection of atoms with an optional lattice.
+
+    The atoms are either a list of Atom objects or, for large systems, an AtomsArray
+    (see AtomsView.from_arrays). In the latter case views share the arrays and Atom
+    objects are only created when individual atoms are asked for.
   """
   ViewType = None
 
-  def __init__(self, atoms=None, lattice=None):
-    if atoms is not None:
-      self.atoms = atoms
+  def __init__(self, atoms=None, lattice=None, rows=None):
+    self._store = None
+    self._rows = None
+    self._all_rows = False
+    self._neighbour_index = None
+    self._list_arrays = None
+
+    if isinstance(atoms, AtomsArray):
+      self._store = atoms
+
+      if rows is None:
+        self._rows = numpy.arange(len(atoms))
+        self._all_rows = True
+      else:
+        self._rows = numpy.asarray(rows, dtype=int)
+
+    elif atoms is not None:
+      self._atoms = atoms
     else:
-      self.atoms = []
+      self._atoms = []
 
     if lattice is not None:
       self.lattice = lattice
@@ -72,11 +238,108 @@ class AtomsView(object):
 
     self._build_index()
 
+  @classmethod
+  def from_arrays(klass, species, indices, positions, labels=None, lattice=None):
+    """
+      Build an array-backed collection of atoms.
+
+      >>> AtomsView.from_arrays(['H', 'H'], [1, 2], [[0,0,0], [0,0,0.74]])
+    """
+    return klass(AtomsArray(species, indices, positions, labels), lattice)
+
+  @property
+  def atoms(self):
+    """
+      The list of atoms in this collection.
+    """
+    if self._store is not None:
+      return list(AtomList(self._store, self._rows))
+    else:
+      return self._atoms
+
+  @atoms.setter
+  def atoms(self, value):
+    self._store = None
+    self._rows = None
+    self._all_rows = False
+    self._atoms = value
+    self._list_arrays = None
+
+  @property
+  def positions(self):
+    """
+      The (N,3) array of atom positions. For an array-backed view of every atom this
+      is the underlying array itself, not a copy.
+    """
+    if self._store is not None:
+      if self._all_rows:
+        return self._store.positions
+      else:
+        return self._store.positions[self._rows]
+    else:
+      return self._get_list_arrays()[0].copy()
+
+  def _get_list_arrays(self):
+    """
+      (positions, is_image) of a list of atoms, kept until the list is replaced or
+      added to. Moving the atoms in place isn't seen.
+    """
+    if self._list_arrays is None:
+      positions = numpy.array([atom.position for atom in self._atoms], dtype=float).reshape(-1, 3)
+      is_image = numpy.array([isinstance(atom, AtomImage) for atom in self._atoms], dtype=bool)
+
+      self._list_arrays = (positions, is_image)
+
+    return self._list_arrays
+
+  @property
+  def species_array(self):
+    """
+      The species of every atom as an array of strings.
+    """
+    if self._store is not None:
+      return self._store.species[self._rows]
+    else:
+      return numpy.array([atom.species for atom in self._atoms], dtype=object)
+
+  @property
+  def labels_array(self):
+    """
+      The label of every atom as an array of strings.
+    """
+    if self._store is not None:
+      return self._store.labels[self._rows]
+    else:
+      return numpy.array([atom.label for atom in self._atoms], dtype=object)
+
+  @property
+  def indices_array(self):
+    """
+      The per-species index of every atom as an integer array.
+    """
+    if self._store is not None:
+      return self._store.indices[self._rows]
+    else:
+      return numpy.array([atom.index for atom in self._atoms], dtype=numpy.int32)
+
+  def copy(self):
+    """
+      Return a deep copy of the collection.
+    """
+    if self._store is not None:
+      return self.ViewType(self._store.take(self._rows), self.lattice)
+    else:
+      return self.ViewType([atom.copy() for atom in self._atoms], self.lattice)
+
   def add(self, atoms):
     """
       Add an extra atom or list of atoms.
     """
 
+    # Fall back to holding a plain list of the atoms
+    if self._store is not None:
+      self.atoms = self.atoms
+
     try:
       # Try to iterate and append
       for atom in atoms:
@@ -91,6 +354,25 @@ class AtomsView(object):
     self.label_index.clear()
     self.species_index.clear()
 
+    if self._store is not None:
+      store = self._store
+
+      for names, codes, index in [(store.label_names, store.label_codes, self.label_index),
+                                  (store.species_names, store.species_codes, self.species_index)]:
+        view_codes = codes[self._rows]
+
+        # Stable sort keeps each group in its original order
+        order = numpy.argsort(view_codes, kind='mergesort')
+        bounds = numpy.flatnonzero(numpy.diff(view_codes[order])) + 1
+
+        for group in numpy.split(order, bounds):
+          if len(group) > 0:
+            index[names[view_codes[group[0]]]] = AtomList(store, self._rows[group])
+
+      return
+
+    self._list_arrays = None
+
     for atom in self.atoms:
       if atom.label in self.label_index:
         self.label_index[atom.label].append(atom)
@@ -105,20 +387,46 @@ class AtomsView(object):
   def get(self, species, index):
     return self.species_index[species][index-1]
 
+  def _select(self, index, keys):
+    if type(keys) != list:
+      keys = [keys]
+
+    if self._store is not None:
+      rows = [index[k].rows for k in keys if k in index]
+
+      if len(rows) > 0:
+        rows = numpy.concatenate(rows)
+      else:
+        rows = numpy.zeros(0, dtype=int)
+
+      return self.ViewType(self._store, self.lattice, rows)
+
+    rtn_atoms = []
+    for k in keys:
+      if k in index:
+        rtn_atoms += index[k]
+    return self.ViewType(rtn_atoms, self.lattice)
+
+  def take(self, rows):
+    """
+      Return a AtomsView of the atoms at the given positions in this collection.
+
+      >>> atoms.take([0, 2, 5])
+    """
+    rows = numpy.asarray(rows, dtype=int)
+
+    if self._store is not None:
+      return self.ViewType(self._store, self.lattice, self._rows[rows])
+    else:
+      return self.ViewType([self._atoms[row] for row in rows], self.lattice)
+
   def label(self, label):
     """
       Return a AtomsView containing only atoms of the specified label.
 
       >>> atoms.label("C1")
     """
-    if type(label) != list:
-      label = [label]
-      
-    rtn_atoms = []
-    for l in label:
-      if l in self.label_index:
-        rtn_atoms += self.label_index[l]
-    return self.ViewType(rtn_atoms, self.lattice)
+    return self._select(self.label_index, label)
 
   def species(self, species):
     """
@@ -126,14 +434,7 @@ class AtomsView(object):
 
       >>> atoms.species('C')
     """
-    if type(species) != list:
-      species = [species]
-      
-    rtn_atoms = []
-    for s in species:
-      if s in self.species_index:
-        rtn_atoms += self.species_index[s]
-    return self.ViewType(rtn_atoms, self.lattice)
+    return self._select(self.species_index, species)
 
   def within(self, pos, max_dr):
     """
@@ -142,84 +443,87 @@ class AtomsView(object):
       >>> atoms.within(p, 5.0)
     """
 
-    if type(pos) is Atom:
+    if hasattr(pos, 'position'):
       pos = pos.position
 
-    atoms = []
+    pos = numpy.asarray(pos, dtype=float)
 
-    for atom in self.atoms:
-      if type(atom) == Atom:
-        images = self._all_images_within(atom.position, pos, max_dr)
+    if self._store is not None:
+      atom_list = AtomList(self._store, self._rows)
+      positions = self.positions
+      is_image = numpy.zeros(len(self._rows), dtype=bool)
+    else:
+      atom_list = self._atoms
+      positions, is_image = self._get_list_arrays()
 
-        for image_dist, image_pos in images:
-          if image_dist <= max_dr:
-            atoms.append(AtomImage(atom, image_pos))
-      elif type(atom) == AtomImage:
-        if atom.dist(pos) <= max_dr:
-          atoms.append(atom)
+    atoms = []
 
-    return self.ViewType(atoms, self.lattice)
+    if len(atom_list) == 0:
+      return self.ViewType(atoms, self.lattice)
 
-  def least_mirror(self, a, b):
-    """
-      Give the closest periodic image of a to b given the current lattice.
-    """
-    min = None
-    min_p = None
+    real_rows = numpy.flatnonzero(~is_image)
 
-    for i in range(-1,2):
-      for j in range(-1,2):
-        for k in range(-1,2):
-          ap = numpy.add(a, numpy.dot(self.lattice.T, (float(i), float(j), float(k))))
-          r = numpy.subtract(ap, b)
-          d = numpy.dot(r, r)
+    # Existing images stay where they are, real atoms bring all their images
+    if len(real_rows) == len(positions):
+      found, translations, image_dist = self._get_neighbour_index(positions, max_dr).query(pos, max_dr)
+    else:
+      found, translations, image_dist = self._get_neighbour_index(positions[real_rows], max_dr).query(pos, max_dr)
+      found = real_rows[found]
 
-          if min is None or d < min:
-            min = d
-            min_p = ap
+    if self.lattice is not None:
+      image_pos = positions[found] + numpy.dot(translations, self.lattice)
+    else:
+      image_pos = positions[found]
 
-    return (math.sqrt(min), min_p)
+    image_rows = numpy.flatnonzero(is_image)
+    image_dist2 = numpy.sqrt(((positions[image_rows] - pos)**2).sum(axis=1))
+    image_rows = image_rows[image_dist2 <= max_dr]
 
-  def _all_images_within(self, a, b, r):
-    """
-      Give all images of a to b within distance r.
-    """
+    rows = numpy.concatenate([found, image_rows])
+    dists = numpy.concatenate([image_dist, numpy.zeros(len(image_rows))])
 
-    images = []
+    for n in numpy.lexsort((dists, rows)):
+      if n < len(found):
+        atoms.append(AtomImage(atom_list[rows[n]], image_pos[n]))
+      else:
+        atoms.append(atom_list[rows[n]])
 
-    for i in insideout():
-      any_j = False
+    return self.ViewType(atoms, self.lattice)
 
-      for j in insideout():
-        any_k = False
+  def neighbour_index(self, cutoff=3.0):
+    """
+      The periodic neighbour index over these atoms. It is kept and reused until the
+      positions or lattice change, cutoff only sets the bin size of a new index.
+    """
+    return self._get_neighbour_index(self.positions, cutoff)
 
-        for k in insideout():
-          R = numpy.dot(self.lattice.T, numpy.array([float(i), float(j), float(k)]))
-          
-          if numpy.dot(a+R-b,a+R-b) > r*r:
-            if k < 0:
-              break
-            else:
-              continue
+  def _get_neighbour_index(self, positions, cutoff):
+    if self._neighbour_index is None or not self._neighbour_index.matches(positions, self.lattice):
+      self._neighbour_index = NeighbourIndex(positions, self.lattice, cutoff)
 
-          any_k = True
-          any_j = True
-      
-          ap = numpy.add(a, R)
-          dr = numpy.subtract(ap, b)
-          d = numpy.dot(dr, dr)
+    return self._neighbour_index
 
-          images.append((math.sqrt(d), ap))
+  def pairs_within(self, max_dr):
+    """
+      Find all pairs of atoms, including periodic images, within max_dr Angstroms
+      of each other.
 
-        if not any_k and j < 0:
-          break
+      Returns arrays (i, j, translations, distances) of atom numbers within this
+      collection, with the image of atom j nearest atom i at
+      positions[j] + dot(translations, lattice). Each pair is given once.
 
-      if not any_j and i < 0:
-        break
+      >>> i, j, t, d = atoms.pairs_within(2.0)
+    """
+    return self.neighbour_index(max_dr).pairs_within(max_dr)
 
-    images = sorted(images, key=lambda (d,p): d)
+  def least_mirror(self, a, b):
+    """
+      Give the closest periodic image of a to b given the current lattice.
 
-    return images
+      a and b can also be (N,3) arrays of pairs, in which case arrays of distances
+      and image positions are returned.
+    """
+    return minimum_image(self.lattice, a, b)
 
   re_species_index = re.compile('([A-Za-z]+)([0-9]+)')
 
@@ -227,6 +531,10 @@ class AtomsView(object):
     try:
       return object.__getattribute__(self, attr_name)
     except AttributeError:
+      # Private and special names are never atoms, e.g. pickle looking for __setstate__
+      if attr_name.startswith('_'):
+        raise
+
       try:
         s, i = self.re_species_index.findall(attr_name)[0]
         return self.species_index[s][int(i)-1]
@@ -238,13 +546,22 @@ class AtomsView(object):
       s, i = idx
       return self.species_index[s][i-1]
     except:
-      return self.atoms[idx]
+      if self._store is not None:
+        return AtomList(self._store, self._rows)[idx]
+      else:
+        return self.atoms[idx]
 
   def __iter__(self):
-    return self.atoms.__iter__()
+    if self._store is not None:
+      return AtomList(self._store, self._rows).__iter__()
+    else:
+      return self.atoms.__iter__()
 
   def __len__(self):
-    return len(self.atoms)
+    if self._store is not None:
+      return len(self._rows)
+    else:
+      return len(self.atoms)
 
   def __add__(self, b):
     # Shouldn't typecheck here. Replace with ducktyping.
@@ -253,14 +570,14 @@ class AtomsView(object):
 
       return self.ViewType(list(new_atoms), self.lattice)
 
-    elif type(b) is Atom:
+    elif isinstance(b, Atom):
       new_atoms = set(self.atoms + [b])
       
       return self.ViewType(list(new_atoms), self.lattice)
 
   def __radd__(self, b):
     # Shouldn't typecheck here. Replace with ducktyping.
-    if type(b) is Atom:
+    if isinstance(b, Atom):
       new_atoms = set(self.atoms + [b])
       
       return self.ViewType(list(new_atoms), self.lattice)
@@ -0,0 +1,241 @@
+import os
+import time
+import zlib
+import hashlib
+import sqlite3
+import cPickle as pickle
+
+import settings
+
+def file_hash(path, block_size=1 << 20):
+  """
+    SHA1 of a file's contents, read in blocks.
+  """
+  h = hashlib.sha1()
+
+  with open(path, 'rb') as f:
+    while True:
+      block = f.read(block_size)
+
+      if not block:
+        break
+
+      h.update(block)
+
+  return h.hexdigest()
+
+class ResultCache(object):
+  """
+    Persistent cache of parsed results in a local SQLite database.
+
+    Each entry is a parsed product of one file, e.g. the SCFResults of a .castep file,
+    stored as compressed pickle. An entry is valid while the file's size and mtime are
+    unchanged. Storing doesn't read the file: it's hashed on the first hit instead, so
+    if later only the mtime changes the entry is kept when the contents still match.
+    Once the cache grows past max_size bytes the least recently used entries are evicted.
+
+    Every write is committed straight away, so processes sharing the database only
+    wait on each other for a moment, up to timeout seconds.
+
+    >>> cache = ResultCache()
+    >>> scf = cache.get("ethanol.castep", "scf", lambda: list(SCFResult.load(open("ethanol.castep").read())))
+  """
+
+  # Bump whenever the pickled results change shape, so old entries are dropped
+  version = 1
+
+  def __init__(self, path=None, max_size=1 << 30, timeout=60.0):
+    if path is None:
+      path = settings.CACHE_PATH
+
+    self.path = path
+    self.max_size = max_size
+    self.timeout = timeout
+
+    self._db = None
+
+    # Running total of nbytes, so storing doesn't sum the whole table
+    self._total = None
+
+    # Hash of each file as of its (size, mtime), so it's read once for all its products
+    self._hashes = {}
+
+  @property
+  def db(self):
+    if self._db is None:
+      cache_dir = os.path.dirname(os.path.abspath(self.path))
+
+      if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+      self._db = sqlite3.connect(self.path, timeout=self.timeout)
+      self._db.text_factory = str
+      self._setup()
+
+    return self._db
+
+  def _setup(self):
+    db = self._db
+
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+
+    db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    db.execute("""CREATE TABLE IF NOT EXISTS entries (path TEXT,
+                                                      product TEXT,
+                                                      size INTEGER,
+                                                      mtime REAL,
+                                                      hash TEXT,
+                                                      data BLOB,
+                                                      nbytes INTEGER,
+                                                      last_used REAL,
+                                                      PRIMARY KEY (path, product))""")
+    db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+
+    row = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+
+    if row is None or int(row[0]) != self.version:
+      db.execute("DELETE FROM entries")
+      db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(self.version),))
+
+    db.commit()
+
+    self._total = self.size()
+
+  def get(self, path, product, loader):
+    """
+      Return the cached product of the file at path, calling loader() to produce
+      and store it if there's no valid entry.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+
+    row = self.db.execute("SELECT size, mtime, hash, data FROM entries WHERE path = ? AND product = ?",
+                          (path, product)).fetchone()
+
+    now = time.time()
+
+    if row is not None:
+      size, mtime, digest, data = row
+
+      if size == st.st_size and mtime == st.st_mtime:
+        if digest is None:
+          digest = self._hash(path, st)
+
+        self.db.execute("UPDATE entries SET hash = ?, last_used = ? WHERE path = ? AND product = ?",
+                        (digest, now, path, product))
+        self.db.commit()
+        return self._decode(data)
+
+      # Touched but maybe not changed, if it was hashed while unchanged
+      if size == st.st_size and digest is not None and digest == self._hash(path, st):
+        self.db.execute("UPDATE entries SET mtime = ?, last_used = ? WHERE path = ? AND product = ?",
+                        (st.st_mtime, now, path, product))
+        self.db.commit()
+        return self._decode(data)
+
+    value = loader()
+    self.put(path, product, value, st)
+
+    return value
+
+  def put(self, path, product, value, st=None):
+    """
+      Store the product of the file at path.
+    """
+    path = os.path.abspath(path)
+
+    if st is None:
+      st = os.stat(path)
+
+    data = zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL), 1)
+
+    old = self.db.execute("SELECT nbytes FROM entries WHERE path = ? AND product = ?",
+                          (path, product)).fetchone()
+
+    self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, NULL, ?, ?, ?)",
+                    (path, product, st.st_size, st.st_mtime,
+                     sqlite3.Binary(data), len(data), time.time()))
+
+    self._total += len(data) - (old[0] if old is not None else 0)
+
+    if self._total > self.max_size:
+      self.evict()
+
+    self.db.commit()
+
+  def _hash(self, path, st):
+    key = (st.st_size, st.st_mtime)
+
+    if self._hashes.get(path, (None, None))[0] != key:
+      self._hashes[path] = (key, file_hash(path))
+
+    return self._hashes[path][1]
+
+  def evict(self, max_size=None):
+    """
+      Drop least recently used entries until the cache fits in max_size bytes.
+    """
+    if max_size is None:
+      max_size = self.max_size
+
+    # Other processes may have stored entries too, so start from the real total
+    total = self.size()
+    self._total = total
+
+    if total <= max_size:
+      return
+
+    rows = self.db.execute("SELECT path, product, nbytes FROM entries ORDER BY last_used")
+
+    to_delete = []
+    for path, product, nbytes in rows:
+      if total <= max_size:
+        break
+
+      to_delete.append((path, product))
+      total -= nbytes
+
+    self.db.executemany("DELETE FROM entries WHERE path = ? AND product = ?", to_delete)
+    self._total = total
+
+  def size(self):
+    """
+      Total size of the stored results in bytes.
+    """
+    return self.db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM entries").fetchone()[0]
+
+  def clear(self):
+    self.db.execute("DELETE FROM entries")
+    self.db.commit()
+    self._total = 0
+
+  def close(self):
+    if self._db is not None:
+      self._db.commit()
+      self._db.close()
+      self._db = None
+
+    # Running total of nbytes, so storing doesn't sum the whole table
+    self._total = None
+
+  def _decode(self, data):
+    return pickle.loads(zlib.decompress(data))
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def __getstate__(self):
+    # Connections don't survive pickling, e.g. into worker processes
+    state = self.__dict__.copy()
+    state['_db'] = None
+    return state
+
+  def __del__(self):
+    try:
+      self.close()
+    except Exception:
+      pass
@@ -1,18 +1,24 @@
 import os, sys
+import traceback
+import multiprocessing
 
 from input.parameters import Parameters
 from input.cell import Cell
 from output.nmr import MagresResult
 from magres.oldmagres import OldMagres
 
-from output.finished import error_check, castep_finished
+from output.finished import directory_states
 
-import output.energy
-import output.bonds
-import output.mulliken
+from output.energy import TotalEnergyResult, SCFResult
+from output.bonds import BondsResult, add_bonds
+from output.mulliken import MullikenResult
+from output.sections import CastepIndex
+from output.bands import BandsResult
+from output.forces import ForcesResult
+from output.geom import GeomFile
 
 def calcs_on_path(dir, load=False):
-  from util import find_all_calcs, calc_from_path
+  from utils import find_all_calcs, calc_from_path
 
   calcs = []
 
@@ -26,44 +32,243 @@ def calcs_on_path(dir, load=False):
 
   return calcs
 
+def _load_calc(args):
+  dir, name, include, exclude, cache = args
+
+  try:
+    calc = CastepCalc(dir, name, cache=cache)
+    calc.load(include, exclude)
+  except Exception:
+    return None, traceback.format_exc()
+
+  # Don't ship the raw file contents back from the worker
+  for t in calc.types:
+    calc.invalidate("%s_file" % t)
+
+  return calc, None
+
+def load_calcs(dir, include=None, exclude=None, workers=None, chunksize=16, cache=None):
+  """
+    Find and load every calculation below dir using a pool of worker processes,
+    workers=None meaning one per CPU and workers=1 loading in this process. Parsed
+    products are kept in cache, a ResultCache, if one is given.
+
+    Returns (calcs, errors). calcs are in sorted (dir, name) order. errors is a list of
+    (dir, name, traceback) for every calculation that failed to parse.
+
+    >>> calcs, errors = load_calcs("project", include=["cell", "energy"], workers=8)
+  """
+  from utils import scan_calcs
+
+  jobs = [(calc_dir, name, include, exclude, cache) for calc_dir, name in scan_calcs(dir)]
+
+  if workers == 1 or len(jobs) <= 1:
+    results = map(_load_calc, jobs)
+  else:
+    pool = multiprocessing.Pool(workers)
+
+    try:
+      results = pool.map(_load_calc, jobs, chunksize)
+    finally:
+      pool.close()
+      pool.join()
+
+  calcs = []
+  errors = []
+
+  for (calc_dir, name, _, _, _), (calc, error) in zip(jobs, results):
+    if error is None:
+      calcs.append(calc)
+    else:
+      errors.append((calc_dir, name, error))
+
+  return calcs, errors
+
 class CastepCalc:
+  """
+    A CASTEP calculation, identified by its directory and seedname.
+
+    Nothing is read when the calculation is created. The raw file contents
+    (cell_file, param_file, castep_file, magres_file) and the parsed products
+    (cell, params, magres, energy, scf, mulliken, bonds, bands) are loaded on first
+    access and cached until the file they came from is modified. Accessing any of them
+    raises MissingFile, an AttributeError, if the file isn't there. Products of the .castep file are
+    parsed from just their own sections, found through castep_index.
+
+    Given a ResultCache, parsed products are also kept on disk between sessions.
+
+    >>> calc = CastepCalc("ethanol", "ethanol")
+    >>> calc.cell.ions
+  """
+
+  class MissingFile(AttributeError):
+    pass
+
   types = {'cell':'%s.cell',
            'param': '%s.param',
            'castep': '%s.castep',
-           'magres': '%s.magres',}
-
-  def __init__(self, dir=None, name=None, include=None, exclude=None):
-    if dir is None:
-      root = "."
-    else:
-      root = dir
-
+           'magres': '%s.magres',
+           'bands': '%s.bands',
+           'geom': '%s.geom',
+           'md': '%s.md',}
+
+  # Parsed product: (file it comes from, loader method)
+  products = {'cell': ('cell', '_load_cell'),
+              'params': ('param', '_load_params'),
+              'magres': ('magres', '_load_magres'),
+              'castep_index': ('castep', '_load_castep_index'),
+              'energy': ('castep', '_load_energy'),
+              'scf': ('castep', '_load_scf'),
+              'mulliken': ('castep', '_load_mulliken'),
+              'bonds': ('castep', '_load_bonds'),
+              'forces': ('castep', '_load_forces'),
+              'bands': ('bands', '_load_bands'),
+              'geom': ('geom', '_load_geom'),
+              'md': ('md', '_load_md'),}
+
+  def __init__(self, dir=None, name=None, include=None, exclude=None, cache=None):
     self.dir = dir
     self.name = name
+    self.cache = cache
 
-    self.files = []
-
-    for t, file in self.types.items():
-      file_path = os.path.join(root, file % name)
-      if os.path.isfile(file_path):
-        self.files.append(file_path)
-        try:
-          f = open(file_path)
-          setattr(self, "%s_file" % t, f.read())
-        except:
-          pass
+    self._cache = {}
 
     if include is not None:
       self.load(include, exclude)
 
+  @property
+  def root(self):
+    if self.dir is None:
+      return "."
+    else:
+      return self.dir
 
-  def state(self):
-    if castep_finished(self.dir, self.name):
-      return 'finished'
-    elif error_check(self.dir, self.name):
-      return 'error'
+  def path(self, t):
+    """
+      Path to the file of type t ('cell', 'param', 'castep', 'magres' or 'bands').
+    """
+    return os.path.join(self.root, self.types[t] % self.name)
+
+  @property
+  def files(self):
+    """
+      Paths of the calculation's files that exist.
+    """
+    return [self.path(t) for t in self.types if os.path.isfile(self.path(t))]
+
+  def _mtime(self, t):
+    try:
+      return os.stat(self.path(t)).st_mtime
+    except OSError:
+      return None
+
+  def _cached(self, key, t, loader):
+    """
+      Return the cached value of key, reloading it if file type t has changed since.
+    """
+    mtime = self._mtime(t)
+
+    if mtime is None:
+      self._cache.pop(key, None)
+      raise self.MissingFile("%s: no %s file" % (key, self.path(t)))
+
+    if key in self._cache and self._cache[key][0] == mtime:
+      return self._cache[key][1]
+
+    value = loader()
+    self._cache[key] = (mtime, value)
+
+    return value
+
+  def invalidate(self, key=None):
+    """
+      Forget a cached file or product, or everything if no key is given.
+    """
+    if key is None:
+      self._cache.clear()
+    else:
+      self._cache.pop(key, None)
+
+  def __getattr__(self, key):
+    if key.startswith('_'):
+      raise AttributeError(key)
+
+    if key.endswith('_file') and key[:-5] in self.types:
+      t = key[:-5]
+      return self._cached(key, t, lambda: self._read(t))
+
+    if key in self.products:
+      t, loader = self.products[key]
+      loader = getattr(self, loader)
+
+      if self.cache is not None:
+        return self._cached(key, t, lambda: self.cache.get(self.path(t), key, loader))
+      else:
+        return self._cached(key, t, loader)
+
+    raise AttributeError(key)
+
+  def _read(self, t):
+    with open(self.path(t)) as f:
+      return f.read()
+
+  def _load_cell(self):
+    return Cell(self.path('cell'))
+
+  def _load_params(self):
+    return Parameters(self.path('param'))
+
+  def _load_magres(self):
+    magres = MagresResult(self.magres_file)
+
+    # Nothing there? Try using the old-style parser
+    if magres.magres_file.data_dict == {}:
+      old_magres_file = OldMagres(self.magres_file, getattr(self, 'castep_file', None))
+      magres = MagresResult(old_magres_file.as_new_format())
+
+    return magres
+
+  def _load_castep_index(self):
+    return CastepIndex(self.path('castep'))
+
+  def _load_energy(self):
+    try:
+      return TotalEnergyResult.load_last(self.path('castep'))
+    except TotalEnergyResult.CantFindEnergy:
+      return None
+
+  def _load_scf(self):
+    return list(SCFResult.load(self.castep_index.text('scf')))
+
+  def _load_mulliken(self):
+    return MullikenResult.load(self.castep_index.text('mulliken'))
+
+  def _load_bonds(self):
+    bonds = list(BondsResult.load(self.castep_index.text('bonds', -1)))
+
+    if len(bonds) > 0:
+      return bonds[-1]
     else:
-      return 'fresh'
+      return None
+
+  def _load_forces(self):
+    return ForcesResult.load(self.castep_index)
+
+  def _load_bands(self):
+    return BandsResult.load(self.path('bands'))
+
+  def _load_geom(self):
+    return GeomFile(self.path('geom'))
+
+  def _load_md(self):
+    return GeomFile(self.path('md'))
+
+  def state(self):
+    """
+      'finished', 'error' or 'fresh'. Use output.finished.calc_states to check many
+      calculations at once.
+    """
+    return directory_states(self.root, [self.name])[self.name]
 
   def write(self, dir, seedname):
     """
@@ -81,6 +286,10 @@ class CastepCalc:
     return (cell_path, param_path)
 
   def load(self, include=None, exclude=None):
+    """
+      Load products now rather than on first access. Including "bonds" also
+      annotates the cell's ions with the bonds found.
+    """
     if include is None:
       include = set(["cell", "params", "magres", "bonds"])
     else:
@@ -93,37 +302,14 @@ class CastepCalc:
 
     to_load = include - exclude
 
-    if hasattr(self, 'cell_file') and "cell" in to_load:
-      self.cell = Cell(self.cell_file)
-
-    if hasattr(self, 'param_file') and "params" in to_load:
-      self.params = Parameters(self.param_file)
-
-    if hasattr(self, 'magres_file') and "magres" in to_load:
-      self.magres = MagresResult(self.magres_file)
-
-      # Nothing there? Try using the old-style parser
-      if self.magres.magres_file.data_dict == {}:
-        old_magres_file = OldMagres(self.magres_file, self.castep_file)
-        #self.magres_file.data_dict = old_magres_file.as_new_format()
-        self.magres.magres_file = old_magres_file.as_new_format()
-
-        print self.magres
+    for product in to_load:
+      try:
+        getattr(self, product)
+      except self.MissingFile:
+        pass
 
-    if hasattr(self, 'castep_file') and "bonds" in to_load:
+    if "bonds" in to_load and os.path.isfile(self.path('castep')) and os.path.isfile(self.path('cell')):
         try:
-          bonds.add_bonds(self.cell.ions, self.castep_file)
+          add_bonds(self.cell.ions, self.castep_index.text('bonds'))
         except:
           pass
-
-    if hasattr(self, 'castep_file') and "energy" in to_load:
-      try:
-        self.energy = energy.parse(self.castep_file)
-      except energy.CantFindEnergy:
-        self.energy = None
-
-      self.scf = energy.SCFResult.load(self.castep_file)
-
-    if hasattr(self, 'castep_file') and "mulliken" in to_load:
-      self.mulliken = mulliken.MullikenResult.load(self.castep_file)
-
@@ -17,3 +17,11 @@ hbar_si = planck_si / (2.0 * math.pi)
 fine_structure_si = elementary_charge_si**2/(4.0*math.pi*epsilon_0_si*hbar_si*speed_light_si)
 boltzmann_si = molar_gas_si/avogadro_si
 amu_si = 1e-3/avogadro_si
+
+# Atomic units
+hartree_ev = 27.21138386
+bohr_angstrom = 0.52917720859
+hartree_si = hartree_ev * elementary_charge_si
+hartree_kelvin = hartree_si / boltzmann_si
+atomic_time_ps = hbar_si / hartree_si * 1e12
+atomic_pressure_gpa = hartree_si / (bohr_angstrom * 1e-10)**3 * 1e-9
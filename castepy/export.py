@@ -0,0 +1,207 @@
+import os
+import numpy
+
+try:
+  import h5py
+except ImportError:
+  h5py = None
+
+from calc import load_calcs
+
+# Atoms table column: MullikenResult.charges key
+mulliken_columns = [('mulliken_s', 'charge_s'),
+                    ('mulliken_p', 'charge_p'),
+                    ('mulliken_d', 'charge_d'),
+                    ('mulliken_f', 'charge_f'),
+                    ('mulliken_total', 'tot'),
+                    ('mulliken_charge', 'charge')]
+
+def calc_tables(calcs):
+  """
+    Columnar tables of loaded calculations, as {table: {column: array}}.
+
+      calcs   one row per calculation: dir, name, energy, num_atoms
+      atoms   one row per atom: calc, species, index, position, mulliken_s, mulliken_p,
+              mulliken_d, mulliken_f, mulliken_total, mulliken_charge, ms, efg
+      bonds   one row per bond: calc, species1, index1, species2, index2, population, length
+
+    calc in the atoms and bonds tables is the row of the calculation in calcs. Values a
+    calculation doesn't have, e.g. without a .magres file, are NaN.
+  """
+  calc_cols = dict((col, []) for col in ['dir', 'name', 'energy', 'num_atoms'])
+  atom_cols = dict((col, []) for col in ['calc', 'species', 'index', 'position', 'ms', 'efg'] +
+                                        [col for col, _ in mulliken_columns])
+  bond_cols = dict((col, []) for col in ['calc', 'species1', 'index1', 'species2', 'index2',
+                                         'population', 'length'])
+
+  for n, calc in enumerate(calcs):
+    energy = getattr(calc, 'energy', None)
+    cell = getattr(calc, 'cell', None)
+
+    calc_cols['dir'].append(calc.root)
+    calc_cols['name'].append(calc.name)
+    calc_cols['energy'].append(energy[0] if energy is not None else numpy.nan)
+
+    if cell is not None and cell.ions is not None:
+      ions = cell.ions
+      species = ions.species_array
+      indices = ions.indices_array
+      num_atoms = len(species)
+
+      atom_cols['calc'].append(numpy.repeat(n, num_atoms))
+      atom_cols['species'].append(species)
+      atom_cols['index'].append(indices)
+      atom_cols['position'].append(ions.positions)
+
+      keys = zip(species.tolist(), indices.tolist())
+
+      mulliken = getattr(calc, 'mulliken', None)
+      charges = mulliken[-1].charges if mulliken else {}
+
+      for col, charge in mulliken_columns:
+        atom_cols[col].append(numpy.array([charges[key][charge] if key in charges else numpy.nan
+                                           for key in keys]))
+
+      magres = getattr(calc, 'magres', None)
+      magres_rows = magres.rows_for(ions) if magres is not None else None
+
+      for kind in ['ms', 'efg']:
+        values = numpy.empty((num_atoms, 3, 3))
+        values.fill(numpy.nan)
+
+        if magres is not None and kind in magres.tensor_data:
+          rows, stack = magres.tensor_data[kind]
+
+          # Tensor of each site, then of each atom
+          site_tensor = numpy.zeros(len(magres.sites), dtype=int) - 1
+          site_tensor[rows] = numpy.arange(len(rows))
+
+          found = magres_rows >= 0
+          entries = site_tensor[magres_rows[found]]
+          values[numpy.flatnonzero(found)[entries >= 0]] = stack[entries[entries >= 0]]
+
+        atom_cols[kind].append(values)
+    else:
+      num_atoms = 0
+
+    calc_cols['num_atoms'].append(num_atoms)
+
+    bonds = getattr(calc, 'bonds', None)
+
+    if bonds is not None:
+      a, b = bonds.pairs[:,0], bonds.pairs[:,1]
+
+      bond_cols['calc'].append(numpy.repeat(n, len(bonds)))
+      bond_cols['species1'].append(bonds.species[a])
+      bond_cols['index1'].append(bonds.indices[a])
+      bond_cols['species2'].append(bonds.species[b])
+      bond_cols['index2'].append(bonds.indices[b])
+      bond_cols['population'].append(bonds.population)
+      bond_cols['length'].append(bonds.length)
+
+  calcs_table = {'dir': numpy.array(calc_cols['dir'], dtype=str),
+                 'name': numpy.array(calc_cols['name'], dtype=str),
+                 'energy': numpy.array(calc_cols['energy'], dtype=float),
+                 'num_atoms': numpy.array(calc_cols['num_atoms'], dtype=numpy.int32)}
+
+  atoms_table = {}
+  empty = {'calc': (0,), 'index': (0,), 'position': (0, 3), 'ms': (0, 3, 3), 'efg': (0, 3, 3)}
+
+  for col, values in atom_cols.items():
+    if col == 'species':
+      atoms_table[col] = numpy.concatenate(values).astype(str) if values else numpy.zeros(0, dtype='S1')
+    elif col in ('calc', 'index'):
+      atoms_table[col] = numpy.concatenate(values).astype(numpy.int32) if values else numpy.zeros(0, dtype=numpy.int32)
+    else:
+      atoms_table[col] = numpy.concatenate(values) if values else numpy.zeros(empty.get(col, (0,)))
+
+  bonds_table = {}
+  types = {'calc': numpy.int32, 'index1': numpy.int32, 'index2': numpy.int32,
+           'species1': str, 'species2': str, 'population': float, 'length': float}
+
+  for col, values in bond_cols.items():
+    bonds_table[col] = numpy.concatenate(values).astype(types[col]) if values else numpy.zeros(0, dtype=types[col])
+
+  return {'calcs': calcs_table, 'atoms': atoms_table, 'bonds': bonds_table}
+
+def _is_hdf5(path):
+  return path.endswith('.h5') or path.endswith('.hdf5')
+
+def write_tables(path, tables):
+  """
+    Write tables to HDF5 if path ends in .h5 or .hdf5, each column stored as
+    "table/column". Otherwise path is a directory and each column is written,
+    uncompressed so it can be memory mapped, to path/table/column.npy.
+  """
+  if _is_hdf5(path):
+    if h5py is None:
+      raise ImportError("Writing HDF5 needs h5py")
+
+    with h5py.File(path, 'w') as f:
+      for table, cols in tables.items():
+        for col, values in cols.items():
+          f.create_dataset("%s/%s" % (table, col), data=values, compression='gzip', shuffle=True)
+  else:
+    for table, cols in tables.items():
+      table_dir = os.path.join(path, table)
+
+      if not os.path.isdir(table_dir):
+        os.makedirs(table_dir)
+
+      for col, values in cols.items():
+        numpy.save(os.path.join(table_dir, col + '.npy'), values)
+
+def read_tables(path, mmap_mode=None):
+  """
+    Read tables written by write_tables back in as {table: {column: array}}.
+
+    mmap_mode is passed on to numpy.load, e.g. 'r' to memory map each column rather
+    than read it in. HDF5 columns come back as h5py datasets, which are only read when
+    sliced.
+
+    >>> tables = read_tables("project", mmap_mode='r')
+    >>> tables['atoms']['mulliken_charge'][tables['atoms']['species'] == 'O']
+  """
+  tables = {}
+
+  if _is_hdf5(path):
+    if h5py is None:
+      raise ImportError("Reading HDF5 needs h5py")
+
+    f = h5py.File(path, 'r')
+
+    for table in f:
+      tables[table] = dict((col, f[table][col]) for col in f[table])
+  else:
+    for table in os.listdir(path):
+      table_dir = os.path.join(path, table)
+
+      if not os.path.isdir(table_dir):
+        continue
+
+      tables[table] = {}
+
+      for name in os.listdir(table_dir):
+        if name.endswith('.npy'):
+          tables[table][name[:-4]] = numpy.load(os.path.join(table_dir, name), mmap_mode=mmap_mode)
+
+  return tables
+
+def export_calcs(dir, path, include=None, workers=None, cache=None):
+  """
+    Load every calculation below dir and write one row per calculation, atom and
+    bond to path, a directory or an HDF5 file, see calc_tables and write_tables. Calculations
+    are loaded in parallel as in load_calcs.
+
+    Returns the (dir, name, traceback) of every calculation that failed to load.
+
+    >>> errors = export_calcs("project", "project_tables", workers=8)
+  """
+  if include is None:
+    include = ["cell", "energy", "mulliken", "bonds", "magres"]
+
+  calcs, errors = load_calcs(dir, include, workers=workers, cache=cache)
+
+  write_tables(path, calc_tables(calcs))
+
+  return errors
@@ -0,0 +1,202 @@
+import numpy
+
+from periodic import minimum_image, _ragged_arange
+
+def atom_rows(bonds, ions):
+  """
+    (N,) row in ions of each atom of a bond graph, -1 for atoms ions doesn't have.
+  """
+  graph_rows = bonds.rows(zip(numpy.asarray(ions.species_array, dtype=str).tolist(),
+                              numpy.asarray(ions.indices_array).tolist()))
+
+  rows = numpy.zeros(bonds.num_atoms, dtype=int) - 1
+  found = graph_rows >= 0
+  rows[graph_rows[found]] = numpy.flatnonzero(found)
+
+  return rows
+
+def _frames(bonds, atoms, lattice, rows):
+  """
+    Positions as (frames, N, 3) in bond graph row order, the lattice and the rows
+    of the positions given.
+  """
+  if hasattr(atoms, 'positions'):
+    if lattice is None:
+      lattice = atoms.lattice
+    if rows is None:
+      rows = atom_rows(bonds, atoms)
+
+    atoms = atoms.positions
+
+  positions = numpy.asarray(atoms, dtype=float)
+  single = positions.ndim == 2
+
+  if single:
+    positions = positions[None]
+
+  if rows is None:
+    rows = numpy.arange(bonds.num_atoms)
+
+  if (rows < 0).any():
+    raise ValueError("No positions for atoms %s" % bonds.keys(numpy.flatnonzero(rows < 0)))
+
+  return positions[:,rows], lattice, rows, single
+
+def _bond_vectors(bonds, positions, lattice, minimum):
+  """
+    (frames, M, 3) vectors of the bonds, positions in bond graph row order.
+  """
+  a, b = bonds.pairs[:,0], bonds.pairs[:,1]
+  vectors = positions[:,b] - positions[:,a]
+
+  if lattice is None:
+    return vectors
+
+  lattice = numpy.asarray(lattice, dtype=float)
+
+  if bonds.translations is not None and not minimum:
+    if lattice.ndim == 2:
+      return vectors + numpy.dot(bonds.translations, lattice)
+    else:
+      return vectors + numpy.einsum('mi,fij->fmj', bonds.translations, lattice)
+
+  if lattice.ndim == 2:
+    _, images = minimum_image(lattice, vectors.reshape(-1, 3), numpy.zeros(3))
+    return images.reshape(vectors.shape)
+
+  for frame, (frame_vectors, frame_lattice) in enumerate(zip(vectors, lattice)):
+    _, images = minimum_image(frame_lattice, frame_vectors, numpy.zeros(3))
+    vectors[frame] = images
+
+  return vectors
+
+def bond_vectors(bonds, atoms, lattice=None, rows=None, minimum=False):
+  """
+    Vector from the first to the second atom of every bond.
+
+    atoms is an AtomsView, or positions as an (N,3) array or (frames,N,3) array of MD
+    snapshots. With arrays, rows gives the row in them of each atom of the bond graph,
+    see atom_rows, otherwise they are taken to be in the graph's order. lattice can be
+    one (3,3) lattice or one per frame.
+
+    The bonds' own image translations are used when they have them, as from
+    BondsResult.from_geometry, otherwise or if minimum is set the minimum image.
+    Use minimum for snapshots whose atoms have been wrapped back into the cell.
+
+    Returns (M,3), or (frames,M,3) for snapshots.
+  """
+  positions, lattice, rows, single = _frames(bonds, atoms, lattice, rows)
+  vectors = _bond_vectors(bonds, positions, lattice, minimum)
+
+  return vectors[0] if single else vectors
+
+def _entry_vectors(bonds, vectors, entries):
+  """
+    Vectors from each atom along the given CSR entries to its neighbour.
+  """
+  sign = numpy.where(bonds.forward[entries], 1.0, -1.0)
+  return vectors[:,bonds.edges[entries]] * sign[None,:,None]
+
+def angle_triplets(bonds):
+  """
+    Every pair of bonds sharing an atom, each once.
+
+    Returns (triplets, entries): triplets is (K,3) bond graph rows (a, centre, b) and
+    entries (K,2) the CSR entries of the centre's bonds to a and b.
+  """
+  degree = bonds.degree()
+  centres = numpy.repeat(numpy.arange(bonds.num_atoms), degree)
+
+  # Pair each entry with the later entries of the same atom
+  entries = numpy.arange(len(bonds.neighbours))
+  later = bonds.indptr[centres + 1] - entries - 1
+
+  first = numpy.repeat(entries, later)
+  second = _ragged_arange(entries + 1, later)
+
+  triplets = numpy.column_stack((bonds.neighbours[first], centres[first], bonds.neighbours[second]))
+
+  return triplets, numpy.column_stack((first, second))
+
+def dihedral_quadruplets(bonds):
+  """
+    Every chain of three bonds a-b, b-c, c-d around each bond b-c, with a and d
+    reached by bonds other than b-c.
+
+    Returns (quadruplets, entries, middle): quadruplets is (K,4) bond graph rows
+    (a, b, c, d), entries (K,2) the CSR entries b->a and c->d and middle the bond b-c.
+  """
+  num_bonds = len(bonds.pairs)
+  degree = bonds.degree()
+  b, c = bonds.pairs[:,0], bonds.pairs[:,1]
+
+  def others(rows):
+    edge = numpy.repeat(numpy.arange(num_bonds), degree[rows])
+    entries = _ragged_arange(bonds.indptr[rows], degree[rows])
+
+    keep = bonds.edges[entries] != edge
+    return edge[keep], entries[keep]
+
+  a_edge, a_entries = others(b)
+  d_edge, d_entries = others(c)
+
+  num_d = numpy.bincount(d_edge, minlength=num_bonds)
+  d_start = numpy.cumsum(num_d) - num_d
+
+  # Every a of a bond with every d of the same bond
+  per_a = num_d[a_edge]
+  first = numpy.repeat(a_entries, per_a)
+  middle = numpy.repeat(a_edge, per_a)
+  second = d_entries[_ragged_arange(d_start[a_edge], per_a)]
+
+  quadruplets = numpy.column_stack((bonds.neighbours[first], b[middle], c[middle], bonds.neighbours[second]))
+
+  return quadruplets, numpy.column_stack((first, second)), middle
+
+def angles(bonds, atoms, lattice=None, rows=None, minimum=False):
+  """
+    Every bond angle in a structure or set of snapshots in one pass, see bond_vectors
+    for the arguments.
+
+    Returns (triplets, angles): triplets (K,3) rows (a, centre, b) of the atoms, in
+    atoms if it's an AtomsView or rows is given, else in the bond graph, and the
+    angles in radians, (K,) or (frames,K).
+
+    >>> triplets, theta = angles(BondsResult.from_geometry(cell.ions), cell.ions)
+  """
+  positions, lattice, rows, single = _frames(bonds, atoms, lattice, rows)
+  vectors = _bond_vectors(bonds, positions, lattice, minimum)
+
+  triplets, entries = angle_triplets(bonds)
+
+  u = _entry_vectors(bonds, vectors, entries[:,0])
+  w = _entry_vectors(bonds, vectors, entries[:,1])
+
+  theta = numpy.arctan2(numpy.sqrt((numpy.cross(u, w)**2).sum(axis=2)), (u * w).sum(axis=2))
+
+  return rows[triplets], theta[0] if single else theta
+
+def dihedrals(bonds, atoms, lattice=None, rows=None, minimum=False):
+  """
+    Every dihedral angle in a structure or set of snapshots in one pass, see angles.
+
+    Returns (quadruplets, dihedrals): quadruplets (K,4) rows (a, b, c, d) and the
+    angles between the a-b-c and b-c-d planes in radians, in (-pi, pi], positive for
+    a clockwise turn looking from b to c.
+  """
+  positions, lattice, rows, single = _frames(bonds, atoms, lattice, rows)
+  vectors = _bond_vectors(bonds, positions, lattice, minimum)
+
+  quadruplets, entries, middle = dihedral_quadruplets(bonds)
+
+  b1 = -_entry_vectors(bonds, vectors, entries[:,0])
+  b2 = vectors[:,middle]
+  b3 = _entry_vectors(bonds, vectors, entries[:,1])
+
+  n1 = numpy.cross(b1, b2)
+  n2 = numpy.cross(b2, b3)
+  length = numpy.sqrt((b2**2).sum(axis=2))
+
+  phi = numpy.arctan2(length * (b1 * n2).sum(axis=2), (n1 * n2).sum(axis=2))
+
+  return rows[quadruplets], phi[0] if single else phi
@@ -1,13 +1,139 @@
 import os.path
 
 import re
+import mmap
 import numpy
 import math
 
-from collections import Counter
+from cStringIO import StringIO
 
-from castepy.atoms import AtomsView, Atoms
+from castepy.atoms import AtomsView, Atoms, species_indices
 from castepy.atom import Atom
+from castepy.periodic import NeighbourIndex
+
+re_keyword_split = re.compile(r"[\s:]+")
+
+def _cell_lines(source):
+  """
+    Iterate over the lines of a .cell file held in a string, file object or mmap.
+  """
+
+  if isinstance(source, mmap.mmap):
+    return iter(source.readline, "")
+  elif isinstance(source, str):
+    return StringIO(source)
+  elif isinstance(source, unicode):
+    return iter(source.splitlines())
+  else:
+    return iter(source)
+
+def tokenize_cell(source):
+  """
+    Scan a .cell file line by line in a single pass, yielding
+
+      ('block', NAME, lines) for every %block ... %endblock
+      ('keyword', key, value) for every other non-empty line
+
+    Block names are upper-cased and block lines are stripped with blank lines dropped.
+  """
+
+  block_name = None
+  block_lines = None
+
+  for line in _cell_lines(source):
+    line = line.strip()
+
+    if len(line) == 0:
+      continue
+
+    if block_name is not None:
+      if line[:9].lower() == "%endblock":
+        yield ('block', block_name, block_lines)
+        block_name = None
+      else:
+        block_lines.append(line)
+
+    elif line[:6].lower() == "%block":
+      block_name = line[6:].strip().upper()
+      block_lines = []
+
+    else:
+      split = re_keyword_split.split(line, maxsplit=1)
+
+      if len(split) == 2:
+        yield ('keyword', split[0], split[1])
+      else:
+        yield ('keyword', split[0], None)
+
+  # Unterminated final block, keep what we have
+  if block_name is not None:
+    yield ('block', block_name, block_lines)
+
+def parse_ion_block(block):
+  """
+    Split the lines of a POSITIONS_ABS/POSITIONS_FRAC block into columns.
+
+    Returns (units, species, labels, positions) where species and labels are lists
+    of strings and positions is an (N,3) array in the block's own coordinates.
+  """
+
+  rows = [line.split() for line in block]
+  ion_rows = [row for row in rows if len(row) == 4]
+
+  units = None
+  for row in rows:
+    if len(row) == 1:
+      units = row[0]
+
+  if len(ion_rows) == 0:
+    return (units, [], [], numpy.zeros((0, 3)))
+
+  tokens, x, y, z = zip(*ion_rows)
+  positions = numpy.array([x, y, z], dtype=float).T
+
+  # Only split each distinct "species:label" token once
+  split_tokens = {}
+  for token in set(tokens):
+    sl = token.split(":")
+
+    if len(sl) > 1:
+      split_tokens[token] = (sl[0], sl[1])
+    else:
+      split_tokens[token] = (sl[0], sl[0])
+
+  species, labels = zip(*[split_tokens[token] for token in tokens])
+
+  return (units, list(species), list(labels), positions)
+
+def supercell_translations(matrix):
+  """
+    The lattice translations, in units of the lattice vectors, that tile the supercell
+    whose vectors are the rows of the integer matrix.
+  """
+
+  matrix = numpy.asarray(matrix, dtype=int)
+  num_cells = int(round(abs(numpy.linalg.det(matrix))))
+
+  if num_cells == 0:
+    raise ValueError("Supercell matrix is singular")
+
+  # Every lattice point inside the supercell lies within the bounding box of its corners
+  corners = numpy.dot([(i, j, k) for i in (0, 1) for j in (0, 1) for k in (0, 1)], matrix)
+  lo = corners.min(axis=0)
+  hi = corners.max(axis=0)
+
+  grid = numpy.mgrid[lo[0]:hi[0]+1, lo[1]:hi[1]+1, lo[2]:hi[2]+1].reshape(3, -1).T
+
+  frac = numpy.dot(grid, numpy.linalg.inv(matrix))
+  eps = 1e-8
+  inside = ((frac > -eps) & (frac < 1.0 - eps)).all(axis=1)
+
+  translations = grid[inside]
+
+  if len(translations) != num_cells:
+    raise ValueError("Found %d lattice points in supercell of %d cells" % (len(translations), num_cells))
+
+  return translations
 
 class Cell:
     class LatticeNotImplemented(Exception): pass
@@ -22,15 +148,16 @@ class Cell:
         if cell_file is not None:
           if type(cell_file) is str:
             if os.path.isfile(cell_file):
-              self.parse_cell(open(cell_file).read())
+              with open(cell_file) as f:
+                self.parse_cell(f)
             else:
               self.parse_cell(cell_file)
 
-          elif type(cell_file) is file:
-            self.parse_cell(cell_file.read())
+          elif type(cell_file) is file or isinstance(cell_file, mmap.mmap):
+            self.parse_cell(cell_file)
 
           elif hasattr(cell_file, "ions"):
-            new_ions = Atoms([a.copy() for a in cell_file.ions])
+            new_ions = cell_file.ions.copy()
             new_ions.lattice = cell_file.lattice
 
             self.ions = new_ions
@@ -54,34 +181,14 @@ class Cell:
                                     [0.0, 0.0, 1.0]])
 
     def parse_cell(self, cell):
-        block_re = re.compile(r"%block (.*?)\n(.*?\n{0,})%endblock (.*?)\n", re.I | re.S | re.M)
-
-        # Fix any windows line endings
-        cell = cell.replace("\r\n", "\n")
-        blocks = block_re.findall(cell)
-        
-        for name, content, _ in blocks:
-            unclean_lines = content.split('\n')
-            lines = []
-            for line in unclean_lines:
-                line_clean = line.strip()
-                if len(line_clean) > 0:
-                    lines.append(line_clean)
-            self.blocks[name.upper()] = lines
-
-        cell_sans_blocks = block_re.sub("", cell)
-        other = re.split("\n\s{0,}", cell_sans_blocks, re.S | re.M)
-        for o in other:
-            o_s = o.strip()
-            if len(o_s) > 0:
-                o_split = re.split("[\s:]+", o_s, maxsplit=1)
-
-                if len(o_split) == 2:
-                  self.otherdict[o_split[0]] = o_split[1]
-                elif len(o_split) == 1:
-                  self.otherdict[o_split[0]] = None
-                else:
-                  raise Exception("More than two columns for cell-other split")
+        """
+          Parse a .cell file given as a string, file object or mmap.
+        """
+        for kind, name, value in tokenize_cell(cell):
+          if kind == 'block':
+            self.blocks[name] = value
+          else:
+            self.otherdict[name] = value
 
         self.parse_lattice()
         self.parse_ions()
@@ -176,83 +283,61 @@ class Cell:
         if self.ions_type is None:
           return
 
-        convert = False # Dont convert frac to cart
-        if self.ions_type == 'POSITIONS_FRAC':
-          convert = True
-
-        atoms = []
-
-        index_counter = Counter()
-
-        self.ions_units = None
-        for line in self.blocks[self.ions_type]: # Include positions frac
-          lsplit = line.split()
-
-          if len(lsplit) == 4:
-            s, x, y, z = lsplit
-            position = (float(x), float(y), float(z))
-
-            sl = s.split(":")
-
-            species = sl[0]
+        units, species, labels, positions = parse_ion_block(self.blocks[self.ions_type])
 
-            # Atoms are 1-indexed to match castep.
-            index_counter[species] += 1
-            index = index_counter[species]
+        # Atoms are 1-indexed to match castep.
+        indices = species_indices(species)
 
-            if len(sl) > 1:
-              label = sl[1]
-            else:
-              label = species
-
-            if convert:
-              position = numpy.dot(self.basis.T, position)
-
-            atoms.append(Atom(species, index, position, label))
-
-          elif len(lsplit) == 1:
-            self.ions_units = lsplit[0]
+        self.ions_units = units if units is not None else 'ang'
 
-        if self.ions_units is None:
-          self.ions_units = 'ang'
+        # Convert frac to cart in one go and change the basis
+        if self.ions_type == 'POSITIONS_FRAC':
+          positions = numpy.dot(positions, self.basis)
 
-        # If we've converted, change the basis
-        if convert:
           self.ions_type = 'POSITIONS_ABS'
           self.basis = numpy.array([[1.0, 0.0, 0.0],
                                     [0.0, 1.0, 0.0],
                                     [0.0, 0.0, 1.0]])
 
-        self.ions = AtomsView(atoms, self.lattice)
+        self.ions = AtomsView.from_arrays(species, indices, positions, labels, self.lattice)
 
     def regen_ion_block(self):
         for type in ['POSITIONS_ABS', 'POSITIONS_FRAC']: # Clear out any other ion blocks
           if type in self.blocks:
             del self.blocks[type]
 
-        self.blocks[self.ions_type] = [self.ions_units] + ["{} {:f} {:f} {:f}".format(atom.species, atom.position[0], atom.position[1], atom.position[2]) for atom in self.ions]
+        species = self.ions.species_array
+        positions = self.ions.positions.tolist()
+
+        self.blocks[self.ions_type] = [self.ions_units] + ["%s %f %f %f" % (s, x, y, z) for s, (x, y, z) in zip(species, positions)]
 
     def regen_lattice_block(self):
         self.blocks[self.lattice_type] = [self.lattice_units] + ["{:f} {:f} {:f}".format(a,b,c) for a,b,c in self.ions.lattice]
 
-    def find_unique_ions(self):
-        """ Generate a unique set of the ions, fix duplicates """
-        ions = dict()
+    def find_unique_ions(self, tol=0.01):
+        """
+          Generate a unique set of the ions, dropping any within tol Angstroms of an
+          earlier ion or one of its periodic images.
+
+          Returns the unique ions and a list of the duplicates found as
+          (kept, removed, distance) tuples.
 
-        to_remove = set()
+          >>> unique, duplicates = c.find_unique_ions()
+        """
+        # A throwaway index, the ions' own is kept for within() and its bins would be tol wide
+        index = NeighbourIndex(self.ions.positions, self.ions.lattice, tol)
+        i, j, _, dists = index.pairs_within(tol)
 
-        for ion1 in self.ions:
-          if ion1 not in to_remove:
-            for ion2 in self.ions:
-              if ion1 != ion2:
-                dr, _ = self.ions.least_mirror(ion1.position, ion2.position)
+        removed = numpy.zeros(len(self.ions), dtype=bool)
+        duplicates = []
 
-                if dr < 0.01:
-                  print ion1, ion2
-                  to_remove.add(ion2)
+        # Pairs come sorted by i, so earlier ions are kept in preference
+        for a, b, d in zip(i, j, dists):
+          if a != b and not removed[a] and not removed[b]:
+            removed[b] = True
+            duplicates.append((self.ions[a], self.ions[b], d))
 
-        return AtomsView([atom for atom in self.ions if atom not in to_remove],
-                         self.ions.lattice)
+        return self.ions.take(numpy.flatnonzero(~removed)), duplicates
  
     def __str__(self):
         self.regen_ion_block()
@@ -273,26 +358,46 @@ class Cell:
 
         return "\n".join(out)
 
-    def supercell(self, N1, N2, N3):
-        new_ions = []
+    def supercell(self, N1, N2=None, N3=None):
+        """
+          Build an N1 x N2 x N3 supercell. N1 may instead be a 3x3 integer matrix whose
+          rows give the new lattice vectors in terms of the current ones.
 
-        index = 0
-        for ion in self.ions:
-          for n1 in range(N1):
-            for n2 in range(N2):
-              for n3 in range(N3):
-                R = numpy.dot(self.lattice, numpy.array([n1, n2, n3]))
-                new_pos = ion.position + R
+          Each ion is followed by its images, and ions are re-indexed per species in that
+          order as CASTEP would. Labels are kept.
 
-                new_ion = Atom(ion.species, index, new_pos)
-                new_ions.append(new_ion)
-                index += 1
+          >>> c.supercell(2, 2, 2)
+          >>> c.supercell([[1, 1, 0], [-1, 1, 0], [0, 0, 2]])
+        """
+        if N2 is None and N3 is None:
+          matrix = numpy.array(N1)
+        else:
+          matrix = numpy.diag([N1, N2, N3])
 
-        supercell = Cell(self)
+        if matrix.shape != (3, 3) or not numpy.allclose(matrix, numpy.round(matrix)):
+          raise ValueError("Supercell must be given by three integers or a 3x3 integer matrix")
 
-        supercell.lattice = numpy.dot(numpy.diag([N1, N2, N3]), self.lattice)
-        supercell.ions = Atoms(new_ions)
-        supercell.ions.lattice = supercell.lattice
+        matrix = numpy.round(matrix).astype(int)
 
-        return supercell
+        translations = numpy.dot(supercell_translations(matrix), self.lattice)
+
+        positions = self.ions.positions[:,None,:] + translations[None,:,:]
+        species = numpy.repeat(self.ions.species_array, len(translations))
+        labels = numpy.repeat(self.ions.labels_array, len(translations))
+
+        supercell = Cell()
 
+        supercell.lattice_units = self.lattice_units
+        supercell.lattice_type = "LATTICE_CART"
+        supercell.ions_units = self.ions_units
+        supercell.ions_type = self.ions_type
+        supercell.basis = self.basis
+
+        supercell.lattice = numpy.dot(matrix, self.lattice)
+        supercell.ions = Atoms.from_arrays(species,
+                                           species_indices(species),
+                                           positions.reshape(-1, 3),
+                                           labels,
+                                           supercell.lattice)
+
+        return supercell
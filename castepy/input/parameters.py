@@ -89,6 +89,10 @@ class Parameters:
       raise KeyError
 
   def __getattr__(self, key):
+    # params itself isn't there yet while unpickling
+    if key == 'params' or key.startswith('_'):
+      raise AttributeError(key)
+
     if key in self.params:
       return self.params[key]
     else:
@@ -1,59 +1,169 @@
 import sys
-import re
+import numpy
+
+from itertools import islice
+from cStringIO import StringIO
+
+class BandsResult(object):
+  """
+    Eigenvalues from a CASTEP .bands file as dense arrays, in the file's atomic units
+    (Hartree, Bohr).
+
+      eigenvalues     (nspin, nkpt, nband) array, NaN padded if the spins have different numbers of bands
+      kpoints         (nkpt, 3) fractional k-points
+      weights         (nkpt,) k-point weights
+      k_index         (nkpt,) the file's 1-based k-point numbers
+      fermi_energy    one per spin
+      num_electrons   one per spin
+      num_eigenvalues one per spin
+      unit_cell       (3,3) lattice vectors
+
+    K-points are sorted by number whatever order the file has them in.
+
+    >>> bands = BandsResult.load("si.bands")
+    >>> bands.eigenvalues[0,:,3]
+  """
+
+  class BandsFileError(Exception):
+    pass
+
+  def __init__(self, eigenvalues, kpoints, weights, k_index, fermi_energy,
+               num_electrons, num_eigenvalues, unit_cell):
+    self.eigenvalues = eigenvalues
+    self.kpoints = kpoints
+    self.weights = weights
+    self.k_index = k_index
+    self.fermi_energy = fermi_energy
+    self.num_electrons = num_electrons
+    self.num_eigenvalues = num_eigenvalues
+    self.unit_cell = unit_cell
+
+  @property
+  def num_spins(self):
+    return self.eigenvalues.shape[0]
+
+  @property
+  def num_kpoints(self):
+    return self.eigenvalues.shape[1]
+
+  @classmethod
+  def load(klass, path, kpoints=None, out=None):
+    """
+      Read a .bands file a line at a time.
+
+      kpoints=(start, stop) only reads the k-points numbered start to stop-1, counting
+      from 1 as the file does. The eigenvalues of the rest are skipped over unparsed.
+
+      If out is a path the eigenvalues are written straight into a .npy file there and
+      eigenvalues is a memory map of it, so reading never holds them all in memory.
+    """
+    with open(path) as f:
+      return klass._read(f, kpoints, out)
+
+  @classmethod
+  def _header_value(klass, f, prefix, type=float):
+    line = f.readline()
+
+    if not line.startswith(prefix):
+      raise klass.BandsFileError("Expected '%s', found '%s'" % (prefix, line.strip()))
+
+    return map(type, line[len(prefix):].split())
+
+  @classmethod
+  def _read(klass, f, kpoints=None, out=None):
+    num_kpoints, = klass._header_value(f, "Number of k-points", int)
+    num_spins, = klass._header_value(f, "Number of spin components", int)
+    num_electrons = klass._header_value(f, "Number of electrons")
+    num_eigenvalues = klass._header_value(f, "Number of eigenvalues", int)
+
+    line = f.readline()
+    fermi_energy = map(float, line.split(")")[-1].split())
+
+    if not line.startswith("Fermi energ"):
+      raise klass.BandsFileError("Expected Fermi energy, found '%s'" % line.strip())
+
+    if f.readline().strip() != "Unit cell vectors":
+      raise klass.BandsFileError("Expected unit cell vectors")
+
+    unit_cell = numpy.array([map(float, f.readline().split()) for i in range(3)])
+
+    if len(num_eigenvalues) == 1:
+      num_eigenvalues = num_eigenvalues * num_spins
+
+    if kpoints is None:
+      start, stop = 1, num_kpoints + 1
+    else:
+      start, stop = max(1, kpoints[0]), min(num_kpoints + 1, kpoints[1])
+
+    nkpt = max(0, stop - start)
+    shape = (num_spins, nkpt, max(num_eigenvalues))
+
+    if out is not None:
+      eigenvalues = numpy.lib.format.open_memmap(out, mode='w+', dtype=float, shape=shape)
+    else:
+      eigenvalues = numpy.empty(shape)
+
+    if len(set(num_eigenvalues)) > 1:
+      eigenvalues[...] = numpy.nan
+
+    k = numpy.zeros((nkpt, 3))
+    weights = numpy.zeros(nkpt)
+    found = numpy.zeros(nkpt, dtype=bool)
+
+    row = -1
+    for line in f:
+      if line.startswith("K-point"):
+        cols = line.split()
+        row = int(cols[1]) - start
 
-re_num_kpoints = re.compile('Number of k-points\s+([0-9]+)')
-re_num_spins = re.compile('Number of spin components\s+([0-9]+)')
-re_num_electrons = re.compile('Number of electrons\s+([0-9\.]+)')
-re_num_eigenvalues = re.compile('Number of eigenvalues\s+([0-9]+)')
-re_fermi_energy = re.compile('Fermi energy \(in atomic units\)\s+([\-0-9\.]+)')
+        if not 0 <= row < nkpt:
+          row = -1
+          continue
 
-re_unit_cell = re.compile('Unit cell vectors\n\s+([0-9\.]+)\s+([0-9\.]+)\s+([0-9\.]+)\n\s+([0-9\.]+)\s+([0-9\.]+)\s+([0-9\.]+)\n\s+([0-9\.]+)\s+([0-9\.]+)\s+([0-9\.]+)\n')
+        k[row] = map(float, cols[2:5])
+        weights[row] = float(cols[5])
+        found[row] = True
 
+      elif line.startswith("Spin component"):
+        spin = int(line.split()[2]) - 1
+        num_bands = num_eigenvalues[spin]
+
+        if row >= 0:
+          eigenvalues[spin, row, :num_bands] = numpy.array(list(islice(f, num_bands)), dtype=float)
+        else:
+          for skipped in islice(f, num_bands):
+            pass
 
-re_kpoint = re.compile('K-point\s+([0-9]+)\s+([0-9\.]+)\s+([0-9\.]+)\s+([0-9\.]+)\s+([0-9\.]+)\n(.*)', re.M | re.S)
-re_spin = re.compile('Spin component\s+([0-9]+)\n(.*)', re.M | re.S)
+    if not found.all():
+      raise klass.BandsFileError("Missing k-points %s" % (numpy.flatnonzero(~found) + start).tolist())
 
-def parse_bands(bands):
-  num_kpoints = int(re_num_kpoints.findall(bands)[0])
-  num_spins = int(re_num_spins.findall(bands)[0])
-  num_electrons = float(re_num_electrons.findall(bands)[0])
-  num_eigenvalues = int(re_num_eigenvalues.findall(bands)[0])
-  fermi_energy = float(re_fermi_energy.findall(bands)[0])
-  unit_cell = map(float,re_unit_cell.findall(bands)[0])
-  kpoints = re_kpoint.findall(bands)
-
-
-  result = {'fermi_energy': fermi_energy,
-            'unit_cell': [unit_cell[:3], unit_cell[3:6], unit_cell[6:]],
-            'num_electrons': num_electrons,
-            'num_eigenvalues': num_eigenvalues,
-            'kpoints': [],}
-
-  for kpoint in kpoints:
-    idx, kx, ky, kz, weight, spins_bands = kpoint
-
-    idx = int(idx)
-    kx, ky, kz = float(kx), float(ky), float(kz)
-    weight = float(weight)
-
-    spin_bands = re_spin.findall(spins_bands)
+    if out is not None:
+      eigenvalues.flush()
 
+    return klass(eigenvalues, k, weights, numpy.arange(start, stop),
+                 fermi_energy, num_electrons, num_eigenvalues, unit_cell)
 
-    kpoint_result = {'index': idx,
-                     'weight': weight,
-                     'k': [kx, ky, kz],
-                     'spins': [],}
-
-    for spin, bands in spin_bands:
-      spin_result = {'index': int(spin),
-                     'bands': map(float, bands.split())}
-
-      kpoint_result['spins'].append(spin_result)
-
-    result['kpoints'].append(kpoint_result)
-
-
-  return result
+def parse_bands(bands):
+  """
+    Parse the text of a .bands file into nested dicts and lists. BandsResult gives
+    the same as arrays, which is far quicker and smaller for big files.
+  """
+  result = BandsResult._read(StringIO(bands))
+
+  kpoints = []
+  for row, idx in enumerate(result.k_index):
+    kpoints.append({'index': int(idx),
+                    'weight': result.weights[row],
+                    'k': result.kpoints[row].tolist(),
+                    'spins': [{'index': spin + 1,
+                               'bands': result.eigenvalues[spin, row, :result.num_eigenvalues[spin]].tolist()}
+                              for spin in range(result.num_spins)]})
+
+  return {'fermi_energy': result.fermi_energy[0],
+          'unit_cell': result.unit_cell.tolist(),
+          'num_electrons': result.num_electrons[0],
+          'num_eigenvalues': result.num_eigenvalues[0],
+          'kpoints': kpoints,}
 
 if __name__ == "__main__":
   result = parse_bands(open(sys.argv[1]).read())
@@ -4,6 +4,8 @@ import numpy
 from numpy import dot, array
 import math
 
+from castepy.radii import bond_cutoffs
+
 regex_block = re.compile("\s+Bond\s+Population\s+Length \(A\).*?\n[=]+\n(.*?)\n[=]+", re.M | re.S)
 regex_line = re.compile("\s+([A-Za-z]+)\s+([0-9]+)\s+--\s+([A-Za-z]+)\s+([0-9]+)\s+([0-9\-\.]+)\s+([0-9\-\.]+)")
 
@@ -39,78 +41,159 @@ def clamp(x, a=0.0, b=1.0):
 
 def add_bonds(ions, castep_file, pop_tol=0.2, dist_tol=None):
   """
-    Annotate collection of ions with bonding information from CASTEP run
+    Annotate collection of ions with bonding information from CASTEP run, or from
+    a BondsResult, e.g. BondsResult.from_geometry(ions) when there isn't one.
   """
-  
-  bonds = parse_bonds(castep_file)
 
-  if bonds == []:
+  translations = None
+
+  if isinstance(castep_file, BondsResult):
+    bond_blocks = [castep_file.bonds]
+    translations = castep_file.translations
+  else:
+    bond_blocks = list(parse_bonds(castep_file))
+
+  if len(bond_blocks) == 0:
     raise Exception("No bonds found")
 
   for atom in ions:
     atom.bonds = []
 
-  # Store all bonds, unduplicated
+  # Store all bonds, unduplicated, from the final population analysis
   ions.bonds = []
+  kept = []
 
-  for bond in bonds:
+  for n, bond in enumerate(bond_blocks[-1]):
     (s1, i1), (s2, i2), pop, r = bond
     if pop_tol is not None and pop < pop_tol:
       continue
     if dist_tol is not None and r < dist_tol:
       continue
     ions.bonds.append(bond)
-    
-    ion1 = ions.species_index[s1][i1-1]
-    ion2 = ions.species_index[s2][i2-1]
+    kept.append(n)
+
+  # Bond graph for neighbour queries, with the ions to map its rows back to
+  ions.bond_graph = BondsResult(ions.bonds, tol=None)
+  ions.bond_graph.ions = ions
+
+  if translations is not None:
+    ions.bond_graph.translations = translations[numpy.array(kept, dtype=int)]
+
+  for atom in ions:
+    atom.bond_graph = ions.bond_graph
+
+  if len(ions.bonds) == 0:
+    return
+
+  bonded1 = [ions.species_index[s1][i1-1] for (s1, i1), _, _, _ in ions.bonds]
+  bonded2 = [ions.species_index[s2][i2-1] for _, (s2, i2), _, _ in ions.bonds]
 
-    _, p2 = ions.least_mirror(ion2.position, ion1.position) # Mirror location of ion2 from ion1
-    _, p1 = ions.least_mirror(ion1.position, ion2.position) # Mirror location of ion1 from ion2
-    
-    ion1.bonds.append((ion2, ion1.position, pop, r))
-    ion2.bonds.append((ion1, ion2.position, pop, r))
+  pos1 = numpy.array([ion.position for ion in bonded1])
+  pos2 = numpy.array([ion.position for ion in bonded2])
 
-def bond_neighbours(ion, n=1, visited=None):
+  if ions.bond_graph.translations is not None:
+    # The images the bonds were found to, an atom can be bonded to more than one image of another
+    shift = dot(ions.bond_graph.translations, ions.lattice)
+    p1, p2 = pos1 - shift, pos2 + shift
+  else:
+    _, p2 = ions.least_mirror(pos2, pos1) # Mirror locations of ion2 from ion1
+    _, p1 = ions.least_mirror(pos1, pos2) # Mirror locations of ion1 from ion2
+
+  for ion1, ion2, mirror1, mirror2, (_, _, pop, r) in zip(bonded1, bonded2, p1, p2, ions.bonds):
+    ion1.bonds.append((ion2, mirror2, pop, r))
+    ion2.bonds.append((ion1, mirror1, pop, r))
+
+def bond_neighbours(ion, n=1):
   """
-    Find the nth nearest neighbours by bonding.
-    Recursive.
+    Find the nth nearest neighbours by bonding, the atoms n bonds away along the
+    shortest path. Needs the ions annotated by add_bonds.
   """
-  if visited is None:
-    visited = set([ion])
-
-  rtn = set()
-  for ion2, p, pop, r in ion.bonds:
-    if ion2 not in visited:
-      visited.add(ion2)
-      if n == 1:
-        rtn.add(ion2)
-      else:
-        rtn |= bond_neighbours(ion2, n-1, visited)
- 
-  return rtn
+  graph = ion.bond_graph
+  row = graph.row((ion.species, ion.index))
+
+  if row < 0:
+    return set()
+
+  return set(graph.ions.get(s, i) for s, i in graph.keys(graph.shells([row], n)[-1]))
 
 def bond_angle(ion1, ion2, ions):
-  common = find_common(ion1, ion2).pop()
-  p1 = ion1.p
-  _, p2 = least_mirror(common.p, p1, ions.basis, ions.lattice)
-  _, p3 = least_mirror(ion2.p, p2, ions.basis, ions.lattice)
+  """
+    The angle in radians between the bonds of ion1 and ion2 to an atom bonded to
+    both. Needs the ions annotated by add_bonds, see geometry.angles for every
+    angle at once.
+  """
+  common = ions.bond_graph.common((ion1.species, ion1.index), (ion2.species, ion2.index))
+
+  if len(common) == 0:
+    raise ValueError("%s and %s have no common bonded atom" % (ion1, ion2))
+
+  key = sorted(common)[0]
+  centre = ions.get(*key).position
 
-  bond1 = array(p2) - array(p1)
-  bond2 = array(p2) - array(p3)
+  if ions.bond_graph.translations is not None:
+    p1 = _bonded_image(ions.bond_graph, key, ion1)
+    p2 = _bonded_image(ions.bond_graph, key, ion2)
+  else:
+    _, p1 = ions.least_mirror(ion1.position, centre)
+    _, p2 = ions.least_mirror(ion2.position, centre)
 
-  # print math.sqrt(dot(bond1, bond1)), math.sqrt(dot(bond2, bond2))
+  bond1 = array(p1) - array(centre)
+  bond2 = array(p2) - array(centre)
 
-  return math.acos(dot(bond1, bond2)/math.sqrt(dot(bond1,bond1)*dot(bond2,bond2))) 
+  return math.acos(dot(bond1, bond2)/math.sqrt(dot(bond1,bond1)*dot(bond2,bond2)))
 
 
+def _bonded_image(graph, key, ion):
+  """
+    Position of the image of ion bonded to the atom key, the first if there's more than one.
+  """
+  row = graph.row(key)
+  start = graph.indptr[row]
+
+  entry = start + numpy.flatnonzero(graph.neighbours[start:graph.indptr[row + 1]] == graph.row((ion.species, ion.index)))[0]
+  shift = dot(graph.translations[graph.edges[entry]], graph.ions.lattice)
+
+  # Translations move the second atom of a bond to the image by the first
+  if graph.forward[entry]:
+    return ion.position + shift
+  else:
+    return ion.position - shift
+
 class BondsResult(object):
   """
     BondsResult parses and contains the output of a .castep population analysis.
+
+    The bonds are held as a graph over the bonded atoms, each a row numbered in
+    (species, index) order:
+
+      species, indices    (N,) the atom of each row
+      pairs               (M,2) rows of the two atoms of each bond
+      population, length  (M,) population and length in A of each bond
+      indptr, neighbours  CSR adjacency, the rows bonded to row r are
+                          neighbours[indptr[r]:indptr[r+1]]
+      edges               the bond of each entry in neighbours
+      forward             does each entry in neighbours go from the first atom of its bond to the second
+      translations        (M,3) lattice translation of the second atom's image in each bond,
+                          if known, else None
+
+    >>> bonds = BondsResult.load(castep_file).next()
+    >>> bonds.keys(bonds.shells(bonds.row(('C', 1)), 2)[1])
   """
 
   def __init__(self, bonds, tol=0.25):
-    self.bonds = [bond for bond in bonds if bond[2] >= tol]
-    self._build_index()
+    if tol is not None:
+      bonds = [bond for bond in bonds if bond[2] >= tol]
+
+    self.population = numpy.array([bond[2] for bond in bonds], dtype=float)
+    self.length = numpy.array([bond[3] for bond in bonds], dtype=float)
+
+    species = numpy.array([bond[0][0] for bond in bonds] + [bond[1][0] for bond in bonds], dtype=str)
+    indices = numpy.array([bond[0][1] for bond in bonds] + [bond[1][1] for bond in bonds], dtype=int)
+
+    self.translations = None
+
+    self._build_index(species, indices)
+    self._index = None
 
   @classmethod
   def load(klass, castep_file, tol=0.25):
@@ -121,37 +204,295 @@ class BondsResult(object):
     for bonds in parse_bonds(castep_file):
       yield BondsResult(bonds, tol)
 
-  def _build_index(self):
+  @classmethod
+  def from_arrays(klass, species1, indices1, species2, indices2, population, length, translations=None):
     """
-      Build an index of which atoms are connected to which
+      Build the bond graph straight from one array entry per bond.
     """
+    bonds = klass.__new__(klass)
+    bonds.population = numpy.asarray(population, dtype=float)
+    bonds.length = numpy.asarray(length, dtype=float)
+    bonds.translations = None if translations is None else numpy.asarray(translations, dtype=int).reshape(-1, 3)
 
-    self.index = {}
+    species = numpy.concatenate((numpy.asarray(species1, dtype=str), numpy.asarray(species2, dtype=str)))
+    indices = numpy.concatenate((numpy.asarray(indices1, dtype=int), numpy.asarray(indices2, dtype=int)))
 
-    for idx1, idx2, population, r in self.bonds:
-      if idx1 not in self.index:
-        self.index[idx1] = {}
-        
-      self.index[idx1][idx2] = (population, r)
-      
-      if idx2 not in self.index:
-        self.index[idx2] = {}
-        
-      self.index[idx2][idx1] = (population, r)
+    bonds._build_index(species, indices)
+    bonds._index = None
+
+    return bonds
+
+  @classmethod
+  def from_geometry(klass, ions, tol=0.45, cutoffs=None):
+    """
+      Find bonds from the positions of a collection of atoms alone, for when there's
+      no population analysis. Two atoms, or an atom and a periodic image, are bonded
+      if they are closer than the sum of their covalent radii plus tol Angstroms, see
+      radii.bond_cutoffs. The populations are NaN and translations give the image of
+      each bond.
+
+      >>> bonds = BondsResult.from_geometry(cell.ions)
+    """
+    species = numpy.asarray(ions.species_array, dtype=str)
+    indices = ions.indices_array
+
+    names, codes = numpy.unique(species, return_inverse=True)
+    table = bond_cutoffs(names, tol, cutoffs)
+
+    i, j, t, dists = ions.pairs_within(numpy.nanmax(table) if len(names) > 0 else 0.0)
+
+    keep = (dists <= table[codes[i], codes[j]]) & (dists > 0.0)
+    i, j, t, dists = i[keep], j[keep], t[keep], dists[keep]
+
+    population = numpy.empty(len(i))
+    population.fill(numpy.nan)
+
+    return klass.from_arrays(species[i], indices[i], species[j], indices[j], population, dists, t)
+
+  def _build_index(self, species, indices):
+    """
+      Number the bonded atoms and build the CSR adjacency of which atoms are connected to which
+    """
+
+    num_bonds = len(self.population)
+
+    # One integer code per (species, index), whose sorted order is the row order
+    self._names = numpy.unique(species)
+    self._stride = indices.max() + 1 if len(indices) > 0 else 1
+
+    codes, rows = numpy.unique(self._code(species, indices), return_inverse=True)
+
+    self._codes = codes
+    self.species = self._names[codes // self._stride] if len(codes) > 0 else numpy.zeros(0, dtype=str)
+    self.indices = codes % self._stride
+    self.pairs = rows.reshape(2, num_bonds).T
+
+    src = numpy.concatenate((self.pairs[:,0], self.pairs[:,1]))
+    dst = numpy.concatenate((self.pairs[:,1], self.pairs[:,0]))
+    edges = numpy.tile(numpy.arange(num_bonds), 2)
+
+    order = numpy.argsort(src, kind='mergesort')
+
+    self.neighbours = dst[order]
+    self.edges = edges[order]
+    self.forward = order < num_bonds
+    self.indptr = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(src, minlength=len(codes))))).astype(int)
+
+  def _code(self, species, indices):
+    return numpy.searchsorted(self._names, species) * self._stride + numpy.asarray(indices, dtype=int)
+
+  def __len__(self):
+    return len(self.population)
+
+  @property
+  def num_atoms(self):
+    return len(self.species)
+
+  @property
+  def bonds(self):
+    """
+      The bonds as a list of ((s1, i1), (s2, i2), population, length).
+    """
+    keys = self.keys(numpy.arange(self.num_atoms))
+
+    return [(keys[a], keys[b], population, r)
+            for (a, b), population, r in zip(self.pairs.tolist(), self.population.tolist(), self.length.tolist())]
+
+  @property
+  def index(self):
+    """
+      Nested dicts {(s1, i1): {(s2, i2): (population, r)}} of which atoms are connected to which.
+    """
+    if self._index is None:
+      self._index = {}
+
+      for idx1, idx2, population, r in self.bonds:
+        self._index.setdefault(idx1, {})[idx2] = (population, r)
+        self._index.setdefault(idx2, {})[idx1] = (population, r)
+
+    return self._index
+
+  def rows(self, keys):
+    """
+      Rows of a sequence of (species, index) atoms, -1 for atoms without bonds.
+    """
+    if len(keys) == 0:
+      return numpy.zeros(0, dtype=int)
+
+    if len(self._codes) == 0:
+      return numpy.zeros(len(keys), dtype=int) - 1
+
+    species, indices = zip(*keys)
+    codes = self._code(numpy.array(species, dtype=str), indices)
+
+    rows = numpy.searchsorted(self._codes, codes)
+    rows[rows >= len(self._codes)] = -1
+
+    known = numpy.in1d(species, self._names) & (numpy.asarray(indices) < self._stride)
+    rows[~known | (self._codes[rows] != codes)] = -1
+
+    return rows
+
+  def row(self, key):
+    """
+      Row of a (species, index) atom, -1 if it has no bonds.
+    """
+    return int(self.rows([key])[0])
+
+  def key(self, row):
+    return (str(self.species[row]), int(self.indices[row]))
+
+  def keys(self, rows):
+    """
+      (species, index) of each of the given rows.
+    """
+    return zip(self.species[rows].tolist(), self.indices[rows].tolist())
+
+  def degree(self):
+    """
+      (N,) number of bonds of each atom.
+    """
+    return numpy.diff(self.indptr)
+
+  def _expand(self, rows):
+    """
+      Every bond leaving the given rows as (origin rows, neighbour rows, bonds).
+    """
+    starts = self.indptr[rows]
+    counts = self.indptr[rows + 1] - starts
+
+    offsets = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts) + numpy.arange(counts.sum())
+
+    return numpy.repeat(rows, counts), self.neighbours[offsets], self.edges[offsets]
+
+  def _search(self, sources, max_n=None, target=None, exclude=None):
+    """
+      Breadth first search from the source rows, a whole shell at a time. Returns
+      the number of bonds to each row, -1 if not reached, and the row it was reached from.
+      Stops at max_n bonds, on reaching target or never crossing bond exclude.
+    """
+    dist = numpy.zeros(self.num_atoms, dtype=int) - 1
+    parent = numpy.zeros(self.num_atoms, dtype=int) - 1
+
+    frontier = numpy.unique(numpy.asarray(sources, dtype=int).reshape(-1))
+    dist[frontier] = 0
+    n = 0
+
+    while len(frontier) > 0 and (max_n is None or n < max_n):
+      if target is not None and dist[target] >= 0:
+        break
+
+      n += 1
+
+      origins, reached, edges = self._expand(frontier)
+
+      new = dist[reached] < 0
+      if exclude is not None:
+        new &= edges != exclude
+
+      frontier, first = numpy.unique(reached[new], return_index=True)
+      dist[frontier] = n
+      parent[frontier] = origins[new][first]
+
+    return dist, parent
+
+  def distances(self, sources, max_n=None):
+    """
+      (N,) number of bonds on the shortest path from any of the source rows to each
+      row, -1 where there's no path or it's longer than max_n.
+    """
+    return self._search(sources, max_n)[0]
+
+  def shells(self, sources, n=1):
+    """
+      Rows exactly 1, 2, ..., n bonds from the source rows, as a list of n arrays.
+    """
+    dist = self.distances(sources, n)
+
+    return [numpy.flatnonzero(dist == k) for k in range(1, n + 1)]
+
+  def components(self):
+    """
+      Connected components, e.g. the molecules of a molecular crystal.
+      Returns (number of components, (N,) component of each row).
+    """
+    labels = numpy.arange(self.num_atoms)
+    a, b = self.pairs[:,0], self.pairs[:,1]
+
+    while True:
+      joined = numpy.minimum(labels[a], labels[b])
+
+      new = labels.copy()
+      numpy.minimum.at(new, a, joined)
+      numpy.minimum.at(new, b, joined)
+      new = new[new]
+
+      if (new == labels).all():
+        break
+
+      labels = new
+
+    found, labels = numpy.unique(labels, return_inverse=True)
+
+    return len(found), labels
+
+  def path(self, row1, row2, exclude=None):
+    """
+      Rows along a shortest bonded path from row1 to row2, inclusive, or None if
+      they're not connected.
+    """
+    dist, parent = self._search([row1], target=row2, exclude=exclude)
+
+    if dist[row2] < 0:
+      return None
+
+    rows = [row2]
+    while rows[-1] != row1:
+      rows.append(parent[rows[-1]])
+
+    return numpy.array(rows[::-1])
+
+  def ring(self, row, max_size=None):
+    """
+      Rows of a smallest ring through row, starting from it, or None if there's none
+      with at most max_size atoms. A bond to a periodic image of the same atoms counts
+      as closing a ring.
+    """
+    best = None
+
+    for n in range(self.indptr[row], self.indptr[row + 1]):
+      neighbour, edge = self.neighbours[n], self.edges[n]
+
+      if neighbour == row:
+        return numpy.array([row])
+
+      rows = self.path(row, neighbour, exclude=edge)
+
+      if rows is not None and (best is None or len(rows) < len(best)):
+        best = rows
+
+    if best is None or (max_size is not None and len(best) > max_size):
+      return None
+
+    return best
 
   def common(self, idx1, idx2):
     """
       Return a set of atoms bonded to both atom1 and atom2
     """
 
-    bonded1 = set(self.index[idx1].keys())
-    bonded2 = set(self.index[idx2].keys())
+    row1, row2 = self.rows([idx1, idx2])
+
+    if row1 < 0 or row2 < 0:
+      return set()
 
-    return bonded1 & bonded2
+    bonded1 = self.neighbours[self.indptr[row1]:self.indptr[row1 + 1]]
+    bonded2 = self.neighbours[self.indptr[row2]:self.indptr[row2 + 1]]
+
+    return set(self.keys(numpy.intersect1d(bonded1, bonded2)))
 
   def __str__(self):
     out = []
     for idx1, idx2, population, r in self.bonds:
       out.append("{}{} -{:.2f}A-> {}{} ({:.2f})".format(idx1[0],idx1[1],r,idx2[0],idx2[1],population))
     return "\n".join(out)
-
@@ -0,0 +1,219 @@
+import numpy
+
+from castepy import constants
+
+def _kpoint_chunks(bands, chunk=None):
+  """
+    (start, stop) k-point ranges holding roughly a million eigenvalues each.
+  """
+  num_spins, num_kpoints, num_bands = bands.eigenvalues.shape
+
+  if chunk is None:
+    chunk = max(1, 1000000 // max(1, num_spins * num_bands))
+
+  for start in range(0, num_kpoints, chunk):
+    yield start, min(start + chunk, num_kpoints)
+
+def _fermi_energies(bands):
+  """
+    Fermi energy of each spin in eV, as an (nspin,1,1) array to broadcast against eigenvalues.
+  """
+  fermi = numpy.zeros(bands.num_spins) + numpy.array(bands.fermi_energy)[:bands.num_spins]
+  return (fermi * constants.hartree_ev)[:,None,None]
+
+def occupancy(bands):
+  """
+    Electrons per state, 2 without spin polarisation.
+  """
+  return 2.0 if bands.num_spins == 1 else 1.0
+
+def energy_range(bands, chunk=None):
+  """
+    Lowest and highest eigenvalue in eV.
+  """
+  lo = numpy.inf
+  hi = -numpy.inf
+
+  for start, stop in _kpoint_chunks(bands, chunk):
+    e = bands.eigenvalues[:,start:stop]
+    lo = min(lo, numpy.nanmin(e))
+    hi = max(hi, numpy.nanmax(e))
+
+  return lo * constants.hartree_ev, hi * constants.hartree_ev
+
+def _kernel(offsets, width, shape):
+  if shape == 'gaussian':
+    return numpy.exp(-0.5 * (offsets / width)**2) / (width * numpy.sqrt(2.0 * numpy.pi))
+  elif shape == 'lorentzian':
+    return width / (numpy.pi * (offsets**2 + width**2))
+  else:
+    raise ValueError("Unknown broadening %s" % shape)
+
+def dos(bands, energies=None, width=0.1, shape='gaussian', chunk=None):
+  """
+    Broadened density of states in states/eV per cell, one curve per spin.
+
+    The eigenvalues are binned onto the energy grid, weighted by their k-point weights, a
+    chunk of k-points at a time, and the histogram convolved with the broadening by FFT.
+    width is the standard deviation of a 'gaussian' or half width of a 'lorentzian', in eV.
+
+    energies is an evenly spaced grid in eV, by default covering every eigenvalue in
+    steps of width/10.
+
+    Returns (energies, dos) with dos of shape (nspin, len(energies)).
+
+    >>> energies, d = dos(BandsResult.load("si.bands"), width=0.05)
+  """
+  if energies is None:
+    lo, hi = energy_range(bands, chunk)
+    step = width / 10.0
+    energies = numpy.arange(lo - 5 * width, hi + 5 * width + step, step)
+
+  energies = numpy.asarray(energies, dtype=float)
+  num_points = len(energies)
+  step = energies[1] - energies[0]
+
+  num_spins = bands.num_spins
+  hist = numpy.zeros((num_spins, num_points))
+
+  for start, stop in _kpoint_chunks(bands, chunk):
+    e = bands.eigenvalues[:,start:stop] * constants.hartree_ev
+    w = numpy.broadcast_to(bands.weights[None,start:stop,None], e.shape)
+
+    bins = numpy.floor((e - energies[0]) / step + 0.5)
+    inside = (bins >= 0) & (bins < num_points)
+
+    for spin in range(num_spins):
+      keep = inside[spin]
+      hist[spin] += numpy.bincount(bins[spin][keep].astype(int), w[spin][keep], minlength=num_points)
+
+  hist *= occupancy(bands)
+
+  # Broadening sampled out to where it's negligible, or the whole grid
+  reach = 10 * width if shape == 'gaussian' else 200 * width
+  half = min(num_points - 1, int(numpy.ceil(reach / step)))
+  kernel = _kernel(numpy.arange(-half, half + 1) * step, width, shape)
+
+  size = num_points + len(kernel) - 1
+  nfft = 1 << int(numpy.ceil(numpy.log2(size)))
+
+  convolved = numpy.fft.irfft(numpy.fft.rfft(hist, nfft, axis=1) * numpy.fft.rfft(kernel, nfft), nfft, axis=1)
+
+  return energies, convolved[:,half:half + num_points]
+
+def band_edges(bands, chunk=None, tol=1e-4):
+  """
+    Highest occupied and lowest unoccupied eigenvalue for each spin and k-point, in eV.
+    States up to tol Hartree above the Fermi energy count as occupied, as CASTEP
+    prints the Fermi energy rounded and often right at the valence band maximum.
+    Returns (vbm, cbm), both (nspin, nkpt).
+  """
+  num_spins, num_kpoints, _ = bands.eigenvalues.shape
+  fermi = _fermi_energies(bands) + tol * constants.hartree_ev
+
+  vbm = numpy.empty((num_spins, num_kpoints))
+  cbm = numpy.empty((num_spins, num_kpoints))
+
+  for start, stop in _kpoint_chunks(bands, chunk):
+    e = bands.eigenvalues[:,start:stop] * constants.hartree_ev
+    valid = ~numpy.isnan(e)
+    below = valid & (e <= fermi)
+
+    vbm[:,start:stop] = numpy.where(below, e, -numpy.inf).max(axis=2)
+    cbm[:,start:stop] = numpy.where(valid & ~below, e, numpy.inf).min(axis=2)
+
+  return vbm, cbm
+
+def fermi_analysis(bands, chunk=None, tol=1e-4):
+  """
+    The bands of every spin at the Fermi level, in one pass over the eigenvalues. A band
+    only crosses the Fermi energy if it reaches more than tol Hartree either side of it,
+    and states within tol above it count as occupied, see band_edges.
+
+    Returns a dict of
+      fermi_energy    (nspin,) in eV
+      band_min        (nspin, nband) lowest energy of each band, eV
+      band_max        (nspin, nband) highest energy of each band, eV
+      crossing        (nspin, nband) does the band cross the Fermi energy
+      num_electrons   (nspin,) electrons in occupied states
+      metal           is any band crossing
+  """
+  num_spins, _, num_bands = bands.eigenvalues.shape
+  fermi = _fermi_energies(bands)
+  tol = tol * constants.hartree_ev
+
+  band_min = numpy.empty((num_spins, num_bands))
+  band_min.fill(numpy.inf)
+  band_max = -band_min
+  electrons = numpy.zeros(num_spins)
+
+  for start, stop in _kpoint_chunks(bands, chunk):
+    e = bands.eigenvalues[:,start:stop] * constants.hartree_ev
+
+    band_min = numpy.fmin(band_min, numpy.nanmin(e, axis=1))
+    band_max = numpy.fmax(band_max, numpy.nanmax(e, axis=1))
+
+    below = (e <= fermi + tol).sum(axis=2)
+    electrons += (below * bands.weights[None,start:stop]).sum(axis=1)
+
+  crossing = (band_min < fermi[:,:,0] - tol) & (band_max > fermi[:,:,0] + tol)
+
+  return {'fermi_energy': fermi[:,0,0],
+          'band_min': band_min,
+          'band_max': band_max,
+          'crossing': crossing,
+          'num_electrons': electrons * occupancy(bands),
+          'metal': bool(crossing.any())}
+
+def band_gap(bands, chunk=None, tol=1e-4):
+  """
+    Direct and indirect band gaps in eV over all spins, zero for metals. tol is as for
+    fermi_analysis.
+
+    Returns a dict of
+      gap           lowest unoccupied minus highest occupied eigenvalue
+      vbm, cbm      the band edges
+      vbm_k, cbm_k  rows of the k-points the edges are at
+      direct_gap    smallest gap at a single k-point
+      direct_k      row of the k-point with the direct gap
+      metal         is a band crossing the Fermi energy
+  """
+  vbm_k, cbm_k = band_edges(bands, chunk, tol)
+  metal = fermi_analysis(bands, chunk, tol)['metal']
+
+  # Edges of each k-point across spins
+  vbm_k = vbm_k.max(axis=0)
+  cbm_k = cbm_k.min(axis=0)
+
+  v = int(numpy.argmax(vbm_k))
+  c = int(numpy.argmin(cbm_k))
+  direct = cbm_k - vbm_k
+  d = int(numpy.argmin(direct))
+
+  if metal:
+    gap = direct_gap = 0.0
+  else:
+    gap = max(0.0, cbm_k[c] - vbm_k[v])
+    direct_gap = direct[d]
+
+  return {'gap': gap,
+          'vbm': vbm_k[v],
+          'cbm': cbm_k[c],
+          'vbm_k': v,
+          'cbm_k': c,
+          'direct_gap': direct_gap,
+          'direct_k': d,
+          'metal': metal}
+
+def kpath(bands):
+  """
+    Distance along the path through the k-points in 1/Angstrom, for plotting band
+    structures. Starts at 0.
+  """
+  # Reciprocal lattice vectors as rows, unit cell in Bohr
+  recip = 2.0 * numpy.pi * numpy.linalg.inv(bands.unit_cell).T / constants.bohr_angstrom
+  k = numpy.dot(bands.kpoints, recip)
+
+  steps = numpy.sqrt((numpy.diff(k, axis=0)**2).sum(axis=1))
+
+  return numpy.concatenate(([0.0], numpy.cumsum(steps)))
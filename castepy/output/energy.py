@@ -2,6 +2,8 @@ import sys
 import re
 import math
 
+from sections import tail_search
+
 # Final energy, E             =  -126966.5122468     eV
 
 class TotalEnergyResult(object):
@@ -10,6 +12,7 @@ class TotalEnergyResult(object):
 
   energy_regex = re.compile("Final energy, E\s+=\s{0,}([0-9.\-]+)\s+eV")
   energy_regex2 = re.compile("Final energy\s+=\s{0,}([0-9.\-]+)\s+eV")
+  energy_tail_regex = re.compile("Final energy(?:, E)?\s+=\s{0,}([0-9.\-]+)\s+eV")
 
   @classmethod
   def load(klass, castep_file):
@@ -22,6 +25,19 @@ class TotalEnergyResult(object):
       for energy in energies:
         yield float(energy), 'eV'
 
+  @classmethod
+  def load_last(klass, castep_path):
+    """
+      The last final energy in a .castep file, read from the tail of the file
+      rather than the whole thing.
+    """
+    match = tail_search(castep_path, klass.energy_tail_regex)
+
+    if match is None:
+      raise klass.CantFindEnergy()
+
+    return float(match.group(1)), 'eV'
+
 class SCFResult(object):
   find_lines = re.compile(r'(.*?)\<\-\- SCF\n')
 
@@ -36,6 +52,46 @@ class SCFResult(object):
 
     return "\n".join(lines)
 
+  @staticmethod
+  def parse_line(line):
+    """
+      The SCF step on one "<-- SCF" line, given the text before the marker,
+      or None for headers and rules.
+    """
+    cols = line.split()
+
+    if len(cols) == 3 and cols[0] == 'Initial':
+      loop = 0
+      energy, timer = cols[1:]
+      energy_gain = 1.0
+    elif len(cols) == 4:
+      loop, energy, energy_gain, timer = cols
+    elif len(cols) == 5:
+      loop, energy, fermi_energy, energy_gain, timer = cols
+    else:
+      return None
+
+    if loop == 'energy':
+      return None
+
+    if loop == 'Initial':
+      loop = 0
+      energy_gain = 1.0
+
+    try:
+      loop = int(loop)
+      energy = float(energy)
+      energy_gain = float(energy_gain)
+      timer = float(timer)
+    except ValueError:
+      return None
+
+    return {'loop': loop,
+            'energy': energy,
+            'energy_gain': energy_gain,
+            'log_gain': math.log(abs(energy_gain), 10),
+            'time': timer}
+
   @classmethod
   def load(klass, castep_file):
     scf_lines = klass.find_lines.findall(castep_file)
@@ -43,45 +99,15 @@ class SCFResult(object):
     scf_run = []
 
     for line in scf_lines:
-      cols = line.split()
+      step = klass.parse_line(line)
 
-      if len(cols) == 1 or len(cols) == 6 or len(cols) == 7:
+      if step is None:
         continue
-      elif len(cols) == 3:
-        if cols[0] == 'Initial':
-          loop = 0
-          energy, timer = cols[1:]
-          energy_gain = 1.0
-        elif cols[0] in ['per', 'Real']:
-          continue
-      elif len(cols) == 4:
-        loop, energy, energy_gain, timer = cols
-      elif len(cols) == 5:
-        loop, energy, fermi_energy, energy_gain, timer = cols
-      else:
-        continue
-        
-      if loop == 'energy':
-        continue
-
-      if loop == 'Initial':
-        loop = 0
-        energy_gain = 1.0
 
-      loop = int(loop)
-      energy = float(energy)
-      energy_gain = float(energy_gain)
-      timer = float(timer)
-        
-      if scf_run and loop == 0:
+      if scf_run and step['loop'] == 0:
         yield SCFResult(scf_run)
         scf_run = []
 
-      scf_run.append({'loop': loop,
-                      'energy': energy,
-                      'energy_gain': energy_gain,
-                      'log_gain': math.log(abs(energy_gain), 10),
-                      'time': timer})
+      scf_run.append(step)
 
     yield SCFResult(scf_run)
-
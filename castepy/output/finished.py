@@ -2,7 +2,12 @@
 import os, sys
 import re
 
-from castepy.utils import calc_from_path
+from multiprocessing.pool import ThreadPool
+
+from castepy.utils import calc_from_path, dir_entries
+
+# ethanol.0001.err, one per process of a run
+re_err_file = re.compile(r"^(.+)\.[0-9]+\.err$")
 
 def error_check(cwd, name):
   files = os.listdir(cwd)
@@ -17,13 +22,104 @@ def error_check(cwd, name):
   else:
     return None
 
-def castep_finished(cwd, name):
+def _tail_finished(path, tail):
   try:
-    castep_file = open(os.path.join(cwd, "%s.castep" % name)).read()
-    if len(re.findall("Writing analysis data to ", castep_file)) == 0:
-      return False
-    else:
-      return True
+    with open(path, 'rb') as f:
+      f.seek(0, os.SEEK_END)
+      f.seek(max(0, f.tell() - tail))
+
+      return "Writing analysis data to " in f.read()
   except IOError:
     return False
 
+def castep_finished(cwd, name, tail=1 << 16):
+  """
+    Has the last run in the .castep file finished? Only the last tail bytes are read,
+    the end-of-run marker being followed by just a few lines of timings.
+  """
+  return _tail_finished(os.path.join(cwd, "%s.castep" % name), tail)
+
+def directory_states(dir, names=None, tail=1 << 16):
+  """
+    States of the calculations in one directory, from a single listing of it. Gives
+    {name: state} for the given seednames, or every seedname with a .cell file.
+
+    A calculation is 'finished' if its .castep file ends with the end-of-run marker,
+    'error' if it has non-empty <name>.<digits>.err files, and 'fresh' otherwise.
+  """
+  cells = set()
+  castep_files = set()
+  err_sizes = {}
+
+  for f, path, is_dir in dir_entries(dir):
+    if is_dir:
+      continue
+
+    if f.endswith(".cell"):
+      cells.add(f[:-5])
+    elif f.endswith(".castep"):
+      castep_files.add(f[:-7])
+    elif f.endswith(".err"):
+      match = re_err_file.match(f)
+
+      if match is not None:
+        name = match.group(1)
+        err_sizes[name] = err_sizes.get(name, 0) + os.path.getsize(path)
+
+  if names is None:
+    names = cells
+
+  states = {}
+
+  for name in names:
+    if name in castep_files and _tail_finished(os.path.join(dir, "%s.castep" % name), tail):
+      states[name] = 'finished'
+    elif err_sizes.get(name, 0) != 0:
+      states[name] = 'error'
+    else:
+      states[name] = 'fresh'
+
+  return states
+
+def calc_states(dir, workers=1, tail=1 << 16):
+  """
+    States of every calculation below dir as a sorted list of (dir, name, state).
+
+    Each directory is listed once, only .err files are stat'd and only the tail of
+    each .castep file is read. With workers > 1 directories are checked in that
+    many threads, which helps on network filesystems.
+
+    >>> for dir, name, state in calc_states("project", workers=16):
+    ...   print dir, name, state
+  """
+  dirs = []
+  to_visit = [dir]
+
+  while to_visit:
+    current = to_visit.pop()
+    dirs.append(current)
+
+    for f, path, is_dir in dir_entries(current):
+      if is_dir:
+        to_visit.append(path)
+
+  check = lambda current: directory_states(current, tail=tail)
+
+  if workers == 1 or len(dirs) <= 1:
+    results = map(check, dirs)
+  else:
+    pool = ThreadPool(workers)
+
+    try:
+      results = pool.map(check, dirs)
+    finally:
+      pool.close()
+      pool.join()
+
+  table = []
+
+  for current, states in zip(dirs, results):
+    for name, state in states.items():
+      table.append((current, name, state))
+
+  return sorted(table)
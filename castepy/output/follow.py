@@ -0,0 +1,187 @@
+import os
+import re
+import time
+
+from energy import TotalEnergyResult, SCFResult
+
+# |  dE/ion   |   4.399379E-004 |   5.000000E-006 |         eV | No  | <-- BFGS
+bfgs_line = re.compile(r"^ \|\s+(.*?)\s+\|\s+([0-9A-Z\.\-\+]+)\s+\|\s+([0-9A-Z\.\-\+]+)\s+\|\s+(.*?)\s+\|\s+(.*?)\s+\| <-- BFGS")
+
+class CastepFollower(object):
+  """
+    Follow a .castep file as it's written, parsing only what has been appended
+    since the last poll.
+
+    Each poll gives a list of (kind, value) events for the new complete lines:
+      ('scf', step)        an SCF step, as the dicts of SCFResult.steps. Loop 0 starts a new cycle.
+      ('bfgs', step)       a BFGS convergence line, {'param', 'value', 'tol', 'unit', 'ok'}
+      ('energy', energy)   a final energy, (value, 'eV')
+      ('finished', None)   CASTEP has written its analysis data and stopped
+
+    >>> follower = CastepFollower("ethanol/ethanol.castep")
+    >>> for kind, value in follower.follow(interval=10.0):
+    ...   print kind, value
+  """
+
+  def __init__(self, path, offset=0, block_size=1 << 20):
+    self.path = path
+    self.block_size = block_size
+
+    # Everything before offset has been parsed
+    self.offset = offset
+    self.finished = False
+
+  def poll(self):
+    """
+      Events for everything appended to the file since the last poll.
+    """
+    try:
+      size = os.path.getsize(self.path)
+    except OSError:
+      return []
+
+    # Truncated or overwritten, start from the top again
+    if size < self.offset:
+      self.offset = 0
+      self.finished = False
+
+    if size == self.offset:
+      return []
+
+    events = []
+
+    with open(self.path, 'rb') as f:
+      f.seek(self.offset)
+
+      partial = ""
+      remaining = size - self.offset
+
+      while remaining > 0:
+        block = f.read(min(self.block_size, remaining))
+
+        if not block:
+          break
+
+        remaining -= len(block)
+
+        lines = (partial + block).split("\n")
+        partial = lines.pop()
+
+        for line in lines:
+          self.offset += len(line) + 1
+          event = self.parse_line(line)
+
+          if event is not None:
+            events.append(event)
+
+    return events
+
+  def parse_line(self, line):
+    """
+      The event on one line of a .castep file, or None.
+    """
+    line = line.rstrip()
+
+    if line.endswith("<-- SCF"):
+      step = SCFResult.parse_line(line[:-7])
+
+      if step is not None:
+        return 'scf', step
+
+    elif line.endswith("<-- BFGS"):
+      m = bfgs_line.match(line)
+
+      if m is not None:
+        param, value, tol, unit, ok = m.groups()
+
+        try:
+          return 'bfgs', {'param': param,
+                          'value': float(value),
+                          'tol': float(tol),
+                          'unit': unit,
+                          'ok': ok}
+        except ValueError:
+          return None
+
+    elif "Final energy" in line:
+      m = TotalEnergyResult.energy_tail_regex.search(line)
+
+      if m is not None:
+        return 'energy', (float(m.group(1)), 'eV')
+
+    elif line.startswith("Writing analysis data to "):
+      self.finished = True
+      return 'finished', None
+
+    return None
+
+  def follow(self, interval=5.0, timeout=None):
+    """
+      Generate events as the file grows, until CASTEP finishes or nothing has been
+      written for timeout seconds.
+    """
+    last_change = time.time()
+
+    while True:
+      events = self.poll()
+
+      for event in events:
+        yield event
+
+      if self.finished:
+        return
+
+      now = time.time()
+
+      if events:
+        last_change = now
+      elif timeout is not None and now - last_change > timeout:
+        return
+
+      time.sleep(interval)
+
+def follow_calcs(paths, interval=10.0, callback=None, timeout=None):
+  """
+    Follow many .castep files at once, generating (path, kind, value) events until
+    every one has finished or gone quiet for timeout seconds. If callback is given
+    it's called with each event as well.
+
+    Each poll only stats the files and reads what's been appended, so hundreds of
+    running jobs can be watched without re-reading their output.
+
+    >>> for path, kind, value in follow_calcs(glob.glob("*/*.castep")):
+    ...   if kind == 'energy':
+    ...     print path, value
+  """
+  followers = [CastepFollower(path) for path in paths]
+  last_change = dict((path, time.time()) for path in paths)
+
+  while followers:
+    active = []
+
+    for follower in followers:
+      events = follower.poll()
+
+      for kind, value in events:
+        if callback is not None:
+          callback(follower.path, kind, value)
+
+        yield follower.path, kind, value
+
+      now = time.time()
+
+      if events:
+        last_change[follower.path] = now
+
+      if follower.finished:
+        continue
+
+      if timeout is not None and now - last_change[follower.path] > timeout:
+        continue
+
+      active.append(follower)
+
+    followers = active
+
+    if followers:
+      time.sleep(interval)
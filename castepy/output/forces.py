@@ -0,0 +1,159 @@
+import re
+import sys
+import numpy
+
+from sections import CastepIndex
+
+number = r"([-+0-9.Ee]+)"
+
+# * H         1     -0.15013     -0.02447     -0.10400 *
+# * Si        1      0.00000(cons'd)  0.00000(cons'd)  0.00000(cons'd) *
+re_force_line = re.compile(r"^ \* +([A-Za-z]\S*) +([0-9]+) +" +
+                           r" +".join([number + r" *(\(cons'd\))?"] * 3) +
+                           r" *\*", re.M)
+
+# *  x     -2.123456      0.000000      0.000000  *
+re_stress_line = re.compile(r"^ \* +([xyz]) +" + r" +".join([number] * 3) + r" *\*", re.M)
+re_pressure = re.compile(r"Pressure: +" + number)
+
+class ForcesResult(object):
+  """
+    The forces and stresses of every step of a CASTEP run as arrays.
+
+      forces        (nsteps, N, 3) Cartesian forces in eV/A
+      constrained   (nsteps, N, 3) bool, is the component constrained
+      species       (N,) species of each atom
+      indices       (N,) index of each atom within its species
+      titles        title of each forces box, e.g. "Forces" or "Symmetrised Forces"
+      stress        (nstress, 3, 3) stress tensors in GPa
+      pressure      (nstress,) pressures in GPa
+
+    The boxes are found with a CastepIndex, so only they are read from the file.
+
+    >>> forces = ForcesResult.load("ethanol.castep")
+    >>> forces.max_force()
+    >>> forces.species[forces.worst(n=5)]
+  """
+
+  class ForcesError(Exception):
+    pass
+
+  def __init__(self, forces, constrained, species, indices, titles, stress, pressure):
+    self.forces = forces
+    self.constrained = constrained
+    self.species = species
+    self.indices = indices
+    self.titles = titles
+    self.stress = stress
+    self.pressure = pressure
+
+  @classmethod
+  def load(klass, castep, title=None):
+    """
+      Read the forces and stress boxes of a .castep file, given its path or CastepIndex.
+      title picks out only boxes with that title, e.g. "Constrained Forces" when more
+      than one box is printed per step.
+    """
+    if isinstance(castep, CastepIndex):
+      index = castep
+    else:
+      index = CastepIndex(castep)
+
+    blocks = [index.text('forces', n) for n in range(index.count('forces'))]
+    titles = [block.split("\n", 1)[0].strip(" *") for block in blocks]
+
+    if title is not None:
+      blocks = [block for block, t in zip(blocks, titles) if t == title]
+      titles = [title] * len(blocks)
+
+    forces = None
+    species = indices = None
+    constrained = None
+
+    for step, block in enumerate(blocks):
+      lines = re_force_line.findall(block)
+
+      if forces is None:
+        num_atoms = len(lines)
+        forces = numpy.zeros((len(blocks), num_atoms, 3))
+        constrained = numpy.zeros((len(blocks), num_atoms, 3), dtype=bool)
+
+        species = numpy.array([line[0] for line in lines], dtype=str)
+        indices = numpy.array([line[1] for line in lines], dtype=int)
+      elif len(lines) != forces.shape[1]:
+        raise klass.ForcesError("Step %d has %d atoms, expected %d" % (step, len(lines), forces.shape[1]))
+
+      if len(lines) == 0:
+        continue
+
+      cols = numpy.array(lines)
+
+      forces[step] = cols[:,[2, 4, 6]].astype(float)
+      constrained[step] = cols[:,[3, 5, 7]] != ''
+
+    if forces is None:
+      forces = numpy.zeros((0, 0, 3))
+      constrained = numpy.zeros((0, 0, 3), dtype=bool)
+      species = numpy.zeros(0, dtype=str)
+      indices = numpy.zeros(0, dtype=int)
+
+    num_stress = index.count('stress')
+    stress = numpy.zeros((num_stress, 3, 3))
+    pressure = numpy.zeros(num_stress)
+    pressure.fill(numpy.nan)
+
+    for step in range(num_stress):
+      block = index.text('stress', step)
+      rows = re_stress_line.findall(block)
+
+      if len(rows) == 3:
+        stress[step] = numpy.array([row[1:] for row in rows], dtype=float)
+
+      m = re_pressure.search(block)
+      if m is not None:
+        pressure[step] = float(m.group(1))
+
+    return klass(forces, constrained, species, indices, titles, stress, pressure)
+
+  @property
+  def num_steps(self):
+    return self.forces.shape[0]
+
+  def norms(self, free=False):
+    """
+      (nsteps, N) magnitude of each atom's force. With free=True constrained components
+      are left out.
+    """
+    forces = self.forces
+
+    if free:
+      forces = numpy.where(self.constrained, 0.0, forces)
+
+    return numpy.sqrt((forces**2).sum(axis=2))
+
+  def max_force(self, free=False):
+    """
+      (nsteps,) largest force on any atom.
+    """
+    return self.norms(free).max(axis=1)
+
+  def rms_force(self, free=False):
+    """
+      (nsteps,) root mean square force per atom.
+    """
+    return numpy.sqrt((self.norms(free)**2).mean(axis=1))
+
+  def worst(self, step=-1, n=10, free=False):
+    """
+      Rows of the n atoms with the largest forces at a step, largest first.
+    """
+    norms = self.norms(free)[step]
+    return numpy.argsort(-norms, kind='mergesort')[:n]
+
+if __name__ == "__main__":
+  forces = ForcesResult.load(sys.argv[1])
+
+  norms = forces.norms()[-1]
+
+  for row in forces.worst():
+    print norms[row], "->", forces.species[row], forces.indices[row], " ".join(map(str, forces.forces[-1,row]))
@@ -0,0 +1,288 @@
+import os
+import re
+import sys
+import mmap
+import numpy
+
+from castepy import constants
+from castepy.trajectory import Trajectory
+
+# A blank line, then the line of the frame's time, or of a .geom step's iteration
+# number and convergence flags:
+#                                       0     F   F   F   F  <-- c
+re_frame_start = re.compile(r"^[ \t]*\r?\n([ \t]*[-+0-9.EeDd]+(?:[ \t]+[TF])*(?:[ \t]+<--[ \t]*c)?[ \t]*\r?\n)", re.M)
+re_blank_line = re.compile(r"^[ \t]*\r?\n", re.M)
+
+# Factors from the files' atomic units
+to_angstrom = constants.bohr_angstrom
+to_ev = constants.hartree_ev
+to_ev_per_angstrom = constants.hartree_ev / constants.bohr_angstrom
+to_angstrom_per_ps = constants.bohr_angstrom / constants.atomic_time_ps
+to_gpa = constants.atomic_pressure_gpa
+
+class GeomFrame(object):
+  """
+    One step of a .geom or .md file in A, eV, ps, K and GPa.
+
+      time          time in ps of an MD step, the iteration number of a .geom step
+      energies      the energies of the E line, (E, enthalpy) for .geom or
+                    (E, Hamiltonian, kinetic) for .md
+      energy        the first of them
+      temperature   K, or None
+      pressure      GPa, or None
+      lattice       (3,3) lattice vectors as rows, or None
+      stress        (3,3) stress tensor, or None
+      species       (N,) species of each atom
+      indices       (N,) index of each atom within its species
+      positions     (N,3)
+      velocities    (N,3) A/ps, or None
+      forces        (N,3) eV/A, or None
+  """
+
+  def __init__(self, time, energies, species, indices, positions, lattice=None, stress=None,
+               temperature=None, pressure=None, velocities=None, forces=None):
+    self.time = time
+    self.energies = energies
+    self.energy = energies[0] if len(energies) > 0 else numpy.nan
+    self.species = species
+    self.indices = indices
+    self.positions = positions
+    self.lattice = lattice
+    self.stress = stress
+    self.temperature = temperature
+    self.pressure = pressure
+    self.velocities = velocities
+    self.forces = forces
+
+class GeomFile(object):
+  """
+    Reader for the .geom files of geometry optimisations and .md files of molecular
+    dynamics, a frame at a time.
+
+    The file is scanned once for where each frame starts, kept in offsets, so any
+    frame can be read straight away with frame(k). Given a ResultCache the offsets
+    are kept between sessions too. Frames are converted from atomic units on whole
+    arrays as they are read, and only the frames asked for are ever held in memory.
+
+    >>> md = GeomFile("run.md")
+    >>> len(md), md.frame(-1).temperature
+    >>> for frame in md.frames(1000, step=10):
+    ...   accumulate(frame.positions, frame.lattice)
+    >>> traj = md.trajectory(step=10, out="run_traj")
+
+    update() picks up frames written since the last scan, so a running calculation
+    can be followed.
+  """
+
+  class GeomFileError(Exception):
+    pass
+
+  def __init__(self, path, cache=None):
+    self.path = path
+    self.md = path.endswith(".md")
+
+    # Byte offset of each complete frame, and where the next scan carries on
+    self.offsets = []
+    self.scanned = 0
+
+    if cache is not None:
+      self.offsets, self.scanned = cache.get(path, "geom_offsets", self._scan_all)
+      self.offsets = list(self.offsets)
+
+    self.update()
+
+  def _scan_all(self):
+    self.offsets = []
+    self.scanned = 0
+    self.update()
+
+    return numpy.array(self.offsets, dtype=numpy.int64), self.scanned
+
+  def update(self):
+    """
+      Index any complete frames added to the file since the last scan.
+    """
+    size = os.path.getsize(self.path)
+
+    if size < self.scanned:
+      self.offsets = []
+      self.scanned = 0
+
+    if size == self.scanned:
+      return
+
+    with open(self.path, 'rb') as f:
+      data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+      try:
+        starts = []
+
+        for match in re_frame_start.finditer(data, self.scanned):
+          starts.append((match.start(), match.start(1), match.end(1)))
+
+        # The last frame is only complete once the blank line after it is there.
+        # With no frame found the next scan starts from the same place, as the
+        # blank line before a frame still being written is needed to find it.
+        if starts and re_blank_line.search(data, starts[-1][2]) is None:
+          self.scanned = starts.pop()[0]
+        elif starts:
+          self.scanned = re_blank_line.search(data, starts[-1][2]).start()
+
+        self.offsets.extend(start for _, start, _ in starts)
+      finally:
+        data.close()
+
+  def __len__(self):
+    return len(self.offsets)
+
+  def _lines(self, f):
+    """
+      The lines of the frame f is at, up to the blank line after it.
+    """
+    lines = []
+
+    while True:
+      line = f.readline()
+
+      if not line.strip():
+        return lines
+
+      lines.append(line)
+
+  def _parse(self, lines):
+    if len(lines) == 0:
+      raise self.GeomFileError("Empty frame in %s" % self.path)
+
+    time = float(lines[0].split()[0].replace('D', 'E'))
+    if self.md:
+      time *= constants.atomic_time_ps
+
+    tagged = {}
+    for line in lines[1:]:
+      values, _, tag = line.rpartition("<--")
+      tagged.setdefault(tag.strip(), []).append(values.split())
+
+    def array(tag, factor, cols=slice(None)):
+      if tag not in tagged:
+        return None
+
+      return numpy.array([values[cols] for values in tagged[tag]], dtype=float) * factor
+
+    if 'R' not in tagged:
+      raise self.GeomFileError("No positions in frame at %s of %s" % (time, self.path))
+
+    species = numpy.array([values[0] for values in tagged['R']], dtype=str)
+    indices = numpy.array([values[1] for values in tagged['R']], dtype=int)
+
+    energies = array('E', to_ev)
+    temperature = array('T', constants.hartree_kelvin)
+    frame_pressure = array('P', to_gpa)
+
+    return GeomFrame(time,
+                     energies[0] if energies is not None else numpy.zeros(0),
+                     species,
+                     indices,
+                     array('R', to_angstrom, slice(2, 5)),
+                     lattice=array('h', to_angstrom),
+                     stress=array('S', to_gpa),
+                     temperature=temperature[0,0] if temperature is not None else None,
+                     pressure=frame_pressure[0,0] if frame_pressure is not None else None,
+                     velocities=array('V', to_angstrom_per_ps, slice(2, 5)),
+                     forces=array('F', to_ev_per_angstrom, slice(2, 5)))
+
+  def frame(self, k):
+    """
+      Frame k, counting from 0. Negative k counts back from the last frame.
+    """
+    with open(self.path, 'rb') as f:
+      f.seek(self.offsets[k])
+      return self._parse(self._lines(f))
+
+  def frames(self, start=0, stop=None, step=1):
+    """
+      Generate frames start, start+step, ... up to stop, as a slice would. With a
+      step of 1 the file is read straight through, otherwise each frame is seeked to.
+    """
+    rows = range(len(self.offsets))[start:stop:step]
+
+    if len(rows) == 0:
+      return
+
+    with open(self.path, 'rb') as f:
+      f.seek(self.offsets[rows[0]])
+
+      for row in rows:
+        if step != 1:
+          f.seek(self.offsets[row])
+        else:
+          # Past the blank line ending the last frame
+          while f.tell() < self.offsets[row]:
+            f.readline()
+
+        yield self._parse(self._lines(f))
+
+  def __iter__(self):
+    return self.frames()
+
+  def trajectory(self, start=0, stop=None, step=1, out=None):
+    """
+      A Trajectory of the frames, as frames() gives them. If out is a directory the
+      arrays are written straight into memory mapped .npy files there, so the
+      trajectory never has to fit in memory, as Trajectory.load would give.
+    """
+    rows = range(len(self.offsets))[start:stop:step]
+
+    if len(rows) == 0:
+      raise self.GeomFileError("No frames in %s" % self.path)
+
+    first = self.frame(rows[0])
+    num_atoms = len(first.species)
+
+    shapes = {'positions': (len(rows), num_atoms, 3),
+              'energies': (len(rows),)}
+
+    if first.lattice is not None:
+      shapes['lattices'] = (len(rows), 3, 3)
+    if first.forces is not None:
+      shapes['forces'] = (len(rows), num_atoms, 3)
+
+    arrays = {}
+
+    if out is not None and not os.path.isdir(out):
+      os.makedirs(out)
+
+    for name, shape in shapes.items():
+      if out is not None:
+        arrays[name] = numpy.lib.format.open_memmap(os.path.join(out, name + ".npy"), mode='w+',
+                                                    dtype=float, shape=shape)
+      else:
+        arrays[name] = numpy.empty(shape)
+
+    for n, frame in enumerate(self.frames(start, stop, step)):
+      if len(frame.species) != num_atoms:
+        raise self.GeomFileError("Frame %d has %d atoms, expected %d" % (rows[n], len(frame.species), num_atoms))
+
+      arrays['positions'][n] = frame.positions
+      arrays['energies'][n] = frame.energy
+
+      if 'lattices' in arrays:
+        arrays['lattices'][n] = frame.lattice
+      if 'forces' in arrays:
+        arrays['forces'][n] = frame.forces
+
+    traj = Trajectory(first.species, first.indices, **arrays)
+
+    if out is not None:
+      for name in arrays:
+        arrays[name].flush()
+
+      numpy.save(os.path.join(out, "species.npy"), traj.species)
+      numpy.save(os.path.join(out, "indices.npy"), traj.indices)
+
+    return traj
+
+if __name__ == "__main__":
+  geom = GeomFile(sys.argv[1])
+
+  for frame in geom:
+    print frame.time, frame.energy, frame.temperature
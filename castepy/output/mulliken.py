@@ -34,7 +34,7 @@ class MullikenResult(object):
 
   def annotate(self, ions):
     for s, i in self.charges:
-      ion = ions.get_species(s, i)
+      ion = ions.get(s, i)
       ion.mulliken = self.charges[(s,i)]
 
 if __name__ == "__main__":
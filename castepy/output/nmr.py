@@ -8,20 +8,14 @@ from castepy.input.cell import Cell
 from magres.format import MagresFile
 
 from castepy.magres_constants import gamma_common, efg_to_Cq
+from castepy.output import tensors
+from castepy.periodic import minimum_image
 
 def tensor_properties(matrix):
-  m = numpy.mat(numpy.reshape(matrix, (3,3)))
-
-  m_sym = (m + m.H)/2.0
-  m_asym = (m - m.H)/2.0
-#  eval, evec = numpy.linalg.eig(m_sym)
-
-  prop = {}
-  prop['iso'] = numpy.trace(m_sym)/3.0  
-#  prop['aniso'] = eval[2] - (eval[0] + eval[1])/2.0
-# prop['asym'] = (eval[1] - eval[0]) / (eval[2] - prop['iso'])
-
-  return prop
+  """
+    Properties of a single tensor, see tensors.tensor_properties for whole stacks at once.
+  """
+  return tensors.site_properties(tensors.tensor_properties(matrix), 0)
 
 class DictAttrAccessor:
   def __init__(self, d):
@@ -36,10 +30,85 @@ class DictAttrAccessor:
       else:
         return self.d[key]
 
+class MagresSite(object):
+  """
+    One site of a MagresResult, as put on each ion by MagresResult.annotate.
+
+    Tensors are views into the result's arrays rather than copies.
+
+    >>> ion.magres['ms']
+    >>> ion.magres['ms_prop']['iso']
+    >>> ion.magres['isc'][('H', 2)]
+  """
+
+  def __init__(self, result, row):
+    self.result = result
+    self.row = row
+
+  def __contains__(self, key):
+    try:
+      self[key]
+    except KeyError:
+      return False
+
+    return True
+
+  def __getitem__(self, key):
+    result = self.result
+
+    if key.endswith('_prop'):
+      kind = key[:-5]
+      props = result.properties(kind) if kind in result.tensor_data else None
+    else:
+      kind = key
+      props = None
+
+    if kind not in result.tensor_data:
+      raise KeyError(key)
+
+    rows, stack = result.tensor_data[kind]
+    entries = result.entries(kind, self.row)
+
+    if rows.ndim == 1:
+      if len(entries) == 0:
+        raise KeyError(key)
+
+      if props is not None:
+        return tensors.site_properties(props, entries[0])
+      else:
+        return stack[entries[0]]
+    else:
+      # Couplings to each other site
+      values = {}
+
+      for entry in entries:
+        other = result.sites[rows[entry,1]]
+
+        if props is not None:
+          values[other] = tensors.site_properties(props, entry)
+        else:
+          values[other] = stack[entry]
+
+      return values
+
 class MagresResult(object):
+  """
+    The tensors of a .magres file held as stacked arrays.
+
+    Every atom is a site with a row in species_array, indices_array and positions, and
+    index maps (species, index) to that row. Each kind of tensor in the file, e.g.
+    'ms', 'efg' or 'isc', is stored in tensor_data[kind] as (rows, tensors): the site
+    row of each tensor, or (M,2) rows of both sites for couplings, and the (M,3,3) stack
+    of tensors. Queries are array selections.
+
+    >>> magres = MagresResult(open("ethanol.magres").read())
+    >>> magres.properties('ms')['iso'][magres.select('ms', 'C')]
+    >>> magres.properties('isc')['iso'][magres.select('isc', max_dr=3.0)]
+  """
+
   def __init__(self, magres_file=None):
     """
-      Load new .magres format file into dictionary structure.
+      Load new .magres format file into stacked arrays.
     """
 
     if type(magres_file) == MagresFile:
@@ -47,8 +116,11 @@ class MagresResult(object):
     else:
       self.magres_file = MagresFile(magres_file)
 
+    self._props = {}
+    self._build_arrays()
+
   def __getattr__(self, key):
-    if 'magres' not in self.magres_file.data_dict:
+    if key.startswith('_') or 'magres' not in self.magres_file.data_dict:
       raise AttributeError(key)
 
     d = self.magres_file.data_dict['magres']
@@ -61,38 +133,167 @@ class MagresResult(object):
       else:
         return d[key]
 
-  def annotate(self, ions):
+  def _build_arrays(self):
+    data = self.magres_file.data_dict or {}
+    atoms = data.get('atoms', {})
+
+    self.sites = []
+    self.index = {}
+    positions = []
+
+    for atom in atoms.get('atom', []):
+      self._site(atom['label'], atom['index'])
+      positions.append(atom['position'])
+
+    self.lattice = None
+    if atoms.get('lattice'):
+      self.lattice = numpy.array(atoms['lattice'], dtype=float).reshape(-1, 3, 3)[-1]
+
+    self.tensor_data = {}
+
+    for kind, entries in data.get('magres', {}).items():
+      if kind == 'units' or type(entries) != list or len(entries) == 0:
+        continue
+
+      first = entries[0]
+
+      if 'atom' in first:
+        sites = ['atom']
+      elif 'atom1' in first and 'atom2' in first:
+        sites = ['atom1', 'atom2']
+      else:
+        continue
+
+      value_keys = [k for k in first if k not in sites]
+      if len(value_keys) != 1:
+        continue
+
+      rows = [[self._site(entry[site]['label'], entry[site]['index']) for site in sites] for entry in entries]
+      stack = numpy.array([entry[value_keys[0]] for entry in entries], dtype=float).reshape(-1, 3, 3)
+
+      rows = numpy.array(rows, dtype=int)
+      if len(sites) == 1:
+        rows = rows[:,0]
+
+      self.tensor_data[kind] = (rows, stack)
+
+    # Entries of each kind by site, sorted by site with indptr into them as in CSR
+    self._site_entries = {}
+
+    for kind, (rows, _) in self.tensor_data.items():
+      first = rows if rows.ndim == 1 else rows[:,0]
+      order = numpy.argsort(first, kind='mergesort')
+      indptr = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(first, minlength=len(self.sites)))))
+
+      self._site_entries[kind] = (order, indptr)
+
+    self.species_array = numpy.array([s for s, i in self.sites], dtype=str)
+    self.indices_array = numpy.array([i for s, i in self.sites], dtype=numpy.int32)
+
+    # Sites only mentioned in the magres block have no position
+    self.positions = numpy.empty((len(self.sites), 3))
+    self.positions.fill(numpy.nan)
+    self.positions[:len(positions)] = numpy.reshape(positions, (-1, 3))
+
+  def _site(self, species, index):
+    key = (species, int(index))
+
+    if key not in self.index:
+      self.index[key] = len(self.sites)
+      self.sites.append(key)
+
+    return self.index[key]
+
+  def row(self, species, index):
     """
-      Given the corresponding ions structure, annotate with magres data.
+      The site row of an atom.
     """
+    return self.index[(species, index)]
 
-    try:
-      for s1, i1, s2, i2, K_tensor in self.isc:
-        ion1 = ions.get_species(s1, i1)
+  def entries(self, kind, row):
+    """
+      Entries of tensor_data[kind] of the site in a row, the first site for couplings.
+    """
+    order, indptr = self._site_entries[kind]
+    return order[indptr[row]:indptr[row + 1]]
 
-        if not hasattr(ion1, 'magres'):
-          ion1.magres = {}
+  def properties(self, kind):
+    """
+      tensors.tensor_properties of every tensor of a kind, e.g. 'ms', cached.
+    """
+    if kind not in self._props:
+      self._props[kind] = tensors.tensor_properties(self.tensor_data[kind][1])
 
-        if 'isc' not in ion1.magres:
-          ion1.magres['isc'] = {}
+    return self._props[kind]
 
-        ion1.magres['isc'][(s2, i2)] = numpy.asarray(K_tensor)
-    except AttributeError:
-      pass
+  def distances(self, kind):
+    """
+      Distance between the two sites of each coupling tensor, the minimum image if
+      there's a lattice.
+    """
+    rows, _ = self.tensor_data[kind]
 
-    try:
-      for s, i, efg_tensor in self.efg:
-        ion = ions.get_species(s, i)
+    a = self.positions[rows[:,0]]
+    b = self.positions[rows[:,1]]
 
-        if not hasattr(ion1, 'magres'):
-          ion.magres = {}
+    if self.lattice is not None:
+      dists, _ = minimum_image(self.lattice, a, b)
+      return numpy.atleast_1d(dists)
+    else:
+      return numpy.sqrt(((b - a)**2).sum(axis=1))
+
+  def select(self, kind, species=None, max_dr=None):
+    """
+      Boolean mask over the tensors of a kind. species picks the species of the site,
+      or for couplings a species or (species1, species2) pair in either order. max_dr
+      keeps couplings between sites at most that far apart.
+
+      >>> magres.tensor_data['isc'][1][magres.select('isc', ('C', 'H'), max_dr=2.0)]
+    """
+    rows, stack = self.tensor_data[kind]
+    mask = numpy.ones(len(stack), dtype=bool)
+
+    if species is not None:
+      site_species = self.species_array[rows]
+
+      if rows.ndim == 1:
+        mask &= site_species == species
+      elif type(species) in (tuple, list):
+        s1, s2 = species
+        mask &= (((site_species[:,0] == s1) & (site_species[:,1] == s2)) |
+                 ((site_species[:,0] == s2) & (site_species[:,1] == s1)))
+      else:
+        mask &= (site_species == species).any(axis=1)
 
-        if 'efg' not in ion1.magres:
-          ion1.magres['efg'] = {}
+    if max_dr is not None:
+      # Sites without positions are never within max_dr
+      with numpy.errstate(invalid='ignore'):
+        mask &= self.distances(kind) <= max_dr
 
-        ion1.magres['efg'] = numpy.asarray(efg_tensor)
-    except AttributeError:
-      pass
+    return mask
+
+  def rows_for(self, ions):
+    """
+      The site row of each ion, -1 for ions not in the magres file.
+    """
+    return numpy.array([self.index.get((s, i), -1) for s, i in zip(ions.species_array.tolist(),
+                                                                     ions.indices_array.tolist())], dtype=int)
+
+  def annotate(self, ions, sites=True):
+    """
+      Given the corresponding ions structure, annotate with magres data.
+
+      ions.magres is set to this result and ions.magres_rows to the site row of each ion.
+      With sites=True each ion also gets ion.magres, a MagresSite view of its tensors.
+      Nothing is copied either way.
+    """
+    ions.magres = self
+    ions.magres_rows = self.rows_for(ions)
+
+    if sites:
+      for ion, row in zip(ions, ions.magres_rows):
+        if row >= 0:
+          ion.magres = MagresSite(self, row)
 
 class OldMagresResult:
   def __init__(self, magres_file=None):
@@ -168,26 +369,30 @@ class OldMagresResult:
       for ion in ions:
         found = False
         for s, i in self.atoms:
-          if ion.s == s and ion.i == i:
+          if ion.species == s and ion.index == i:
             found = True
             break
         if not found:
-          jc_ion_s = ion.s
-          jc_ion_i = ion.i
+          jc_ion_s = ion.species
+          jc_ion_i = ion.index
 
       self.jc_ion = (jc_ion_s, jc_ion_i)
 
+    annotated = []
+    jc_ions = []
+
     for (s, i), magres in self.atoms.items():
-      ion = ions.get_species(s, i)
+      ion = ions.get(s, i)
 
       ion.magres = {}
+      annotated.append(ion)
 
       if 'ms' in magres:
         ion.magres['ms'] = numpy.reshape(magres['ms']['TOTAL'], (3,3))
          
       if 'efg' in magres:
         ion.magres['efg'] = numpy.reshape(magres['efg']['TOTAL'], (3,3))
-        ion.magres['Cq'] = efg_to_Cq(ion.magres['efg'], ion.s)
+        ion.magres['Cq'] = efg_to_Cq(ion.magres['efg'], ion.species)
 
       if 'jc' in magres:
         if 'jc' not in ion.magres:
@@ -197,5 +402,19 @@ class OldMagresResult:
         J_tensor = [x * gamma_common[s] * gamma_common[jc_ion_s] * 1.05457148e-15 / (2.0 * math.pi) for x in magres['jc']['Total']]
         ion.magres['isc'][(jc_ion_s, jc_ion_i)] = magres['jc']['Total']
         ion.magres['jc'][(jc_ion_s, jc_ion_i)] = J_tensor
-        ion.magres['jc_prop'][(jc_ion_s, jc_ion_i)] = tensor_properties(J_tensor)
+        jc_ions.append(ion)
+
+    # Tensor properties of every site at once
+    for kind in ['ms', 'efg']:
+      sites = [ion for ion in annotated if kind in ion.magres]
+      props = tensors.tensor_properties([ion.magres[kind] for ion in sites])
+
+      for row, ion in enumerate(sites):
+        ion.magres[kind + '_prop'] = tensors.site_properties(props, row)
+
+    if jc_ions:
+      jc_key = (jc_ion_s, jc_ion_i)
+      props = tensors.tensor_properties([ion.magres['jc'][jc_key] for ion in jc_ions])
 
+      for row, ion in enumerate(jc_ions):
+        ion.magres['jc_prop'][jc_key] = tensors.site_properties(props, row)
@@ -0,0 +1,205 @@
+import os
+import re
+import mmap
+
+# Lines which start a section of a .castep file
+re_section_start = re.compile(r"^(?:"
+                              r"(?P<scf>[^\n]*<-- SCF)|"
+                              r"(?P<bfgs>[^\n]*<-- BFGS)|"
+                              r"(?P<forces> \*+ (?:[A-Za-z]+ )*Forces \*+)|"
+                              r"(?P<stress> \*+ (?:[A-Za-z]+ )*Stress Tensor \*+)|"
+                              r"(?P<mulliken>Species[ \t]+Ion[ \t]+(?:Spin[ \t]+)?s[ \t]+p[ \t]+d[ \t]+f[ \t]+Total)|"
+                              r"(?P<bonds>[ \t]+Bond[ \t]+Population[ \t]+Length)|"
+                              r"(?P<energy>Final energy)|"
+                              r"(?P<lattice>[ \t]+Real Lattice\(A\))|"
+                              r"(?P<positions>[ \t]+x[ \t]+Element[ \t]+Atom[ \t]+Fractional coordinates of atoms)|"
+                              r"(?P<finished>Writing analysis data to)"
+                              r")[^\n]*(?:\n|$)", re.M)
+
+re_star_line = re.compile(r"^ \*+[ \t]*\r?$", re.M)
+re_equals_line = re.compile(r"^[ \t]*=+[ \t]*\r?$", re.M)
+re_x_line = re.compile(r"^[ \t]*x+[ \t]*\r?$", re.M)
+
+class CastepIndex(object):
+  """
+    Byte offsets of the sections of a .castep file, found in a single pass.
+
+    Sections are
+      'scf'       runs of consecutive "<-- SCF" lines, one per SCF cycle
+      'bfgs'      runs of consecutive "<-- BFGS" lines
+      'forces'    each forces box
+      'stress'    each stress tensor box
+      'mulliken'  each Mulliken atomic population table
+      'bonds'     each bond population table
+      'energy'    each "Final energy" line
+      'lattice'   each real lattice, the "Real Lattice(A)" line and the three vectors
+      'positions' each box of fractional coordinates of the atoms
+      'finished'  the "Writing analysis data to" line
+
+    The file is scanned through an mmap so it's never read into memory as a whole.
+    Parsers are then handed only the text of the sections they need, e.g.
+
+    >>> index = CastepIndex("ethanol.castep")
+    >>> scf = SCFResult.load(index.text('scf'))
+    >>> bonds = list(BondsResult.load(index.text('bonds', -1)))
+
+    update() picks up anything appended to the file since it was last scanned.
+  """
+
+  kinds = ['scf', 'bfgs', 'forces', 'stress', 'mulliken', 'bonds', 'energy', 'lattice', 'positions', 'finished']
+
+  def __init__(self, path):
+    self.path = path
+    self.sections = dict((kind, []) for kind in self.kinds)
+
+    # Everything before this offset has been indexed
+    self.scanned = 0
+
+    self.update()
+
+  def update(self):
+    """
+      Index anything added to the file since the last scan.
+    """
+    size = os.path.getsize(self.path)
+
+    if size < self.scanned:
+      # Truncated or rewritten, start again
+      self.sections = dict((kind, []) for kind in self.kinds)
+      self.scanned = 0
+
+    if size == self.scanned:
+      return
+
+    with open(self.path, 'rb') as f:
+      data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+      try:
+        self.scanned = self._scan(data, self.scanned, size)
+      finally:
+        data.close()
+
+  def _scan(self, data, start, size):
+    pos = start
+
+    for match in re_section_start.finditer(data, start):
+      kind = match.lastgroup
+      begin = match.start()
+      end = match.end()
+
+      # Wait for the end of a line still being written
+      if end == size and data[end-1:end] != "\n":
+        return begin
+
+      if begin < pos:
+        continue
+
+      if kind == 'forces' or kind == 'stress':
+        closing = re_star_line.search(data, end)
+
+        if closing is None or closing.end() == size:
+          return begin
+
+        end = closing.end() + 1
+
+      elif kind == 'mulliken' or kind == 'bonds':
+        first = re_equals_line.search(data, end)
+        second = first and re_equals_line.search(data, first.end() + 1)
+
+        if second is None or second.end() == size:
+          return begin
+
+        end = second.end() + 1
+
+      elif kind == 'positions':
+        closing = re_x_line.search(data, end)
+
+        if closing is None or closing.end() == size:
+          return begin
+
+        end = closing.end() + 1
+
+      elif kind == 'lattice':
+        for line in range(3):
+          end = data.find("\n", end) + 1
+
+          if end == 0:
+            return begin
+
+      spans = self.sections[kind]
+
+      # Consecutive SCF/BFGS lines make up one section
+      if kind in ('scf', 'bfgs') and spans and spans[-1][1] == begin:
+        spans[-1] = (spans[-1][0], end)
+      else:
+        spans.append((begin, end))
+
+      pos = end
+
+    # Rescan the last line next time if it isn't finished yet
+    return max(pos, data.rfind("\n", start, size) + 1, start)
+
+  def count(self, kind):
+    """
+      The number of sections of this kind.
+    """
+    return len(self.sections[kind])
+
+  def text(self, kind, n=None):
+    """
+      Text of the nth section of this kind, or all of them joined if n is None.
+      Gives an empty string when there is no such section.
+    """
+    spans = self.sections[kind]
+
+    if n is not None:
+      try:
+        spans = [spans[n]]
+      except IndexError:
+        return ""
+
+    if len(spans) == 0:
+      return ""
+
+    with open(self.path, 'rb') as f:
+      texts = []
+
+      for start, end in spans:
+        f.seek(start)
+        texts.append(f.read(end - start))
+
+    return "".join(texts)
+
+def tail_search(path, regex, chunk=1 << 16):
+  """
+    Find the last match of regex in a file by reading backwards from the end, so only
+    the tail of the file is read. Matches must lie within a single line.
+
+    Returns the match object or None.
+  """
+  if isinstance(regex, basestring):
+    regex = re.compile(regex, re.M)
+
+  size = os.path.getsize(path)
+  window = chunk
+
+  with open(path, 'rb') as f:
+    while True:
+      start = max(0, size - window)
+
+      f.seek(start)
+      data = f.read(size - start)
+
+      # Skip the partial first line unless we're at the top of the file
+      offset = 0
+      if start > 0:
+        offset = data.find("\n") + 1
+
+      last = None
+      for match in regex.finditer(data, offset):
+        last = match
+
+      if last is not None or start == 0:
+        return last
+
+      window *= 2
@@ -0,0 +1,118 @@
+import numpy
+
+def as_stack(tensors):
+  """
+    Tensors as an (N,3,3) float array, from a single 3x3 matrix, 9 values or a stack of either.
+  """
+  return numpy.asarray(tensors, dtype=float).reshape(-1, 3, 3)
+
+def symmetric(tensors):
+  return (tensors + tensors.transpose(0, 2, 1)) / 2.0
+
+def antisymmetric(tensors):
+  return (tensors - tensors.transpose(0, 2, 1)) / 2.0
+
+def haeberlen(tensors):
+  """
+    Eigenvalues and eigenvectors of the symmetric parts of an (N,3,3) stack in the
+    Haeberlen order, |zz - iso| >= |xx - iso| >= |yy - iso|.
+
+    Returns (iso, evals, evecs), evals being (N,3) as (xx, yy, zz) and evecs (N,3,3)
+    with the matching eigenvectors as columns. Each set of eigenvectors is a proper
+    rotation, det = +1.
+  """
+  tensors = as_stack(tensors)
+
+  evals, evecs = numpy.linalg.eigh(symmetric(tensors))
+  iso = evals.mean(axis=1)
+
+  # Sort by distance from iso, then the furthest becomes zz: (yy, xx, zz) -> (xx, yy, zz)
+  order = numpy.argsort(numpy.abs(evals - iso[:,None]), axis=1, kind='mergesort')
+  order = order[:,[1, 0, 2]]
+
+  rows = numpy.arange(len(tensors))[:,None]
+  evals = evals[rows, order]
+  evecs = evecs[rows, :, order].transpose(0, 2, 1)
+
+  # Right handed axes
+  flip = numpy.linalg.det(evecs) < 0
+  evecs[flip,:,2] *= -1
+
+  return iso, evals, evecs
+
+def euler_angles(rotations):
+  """
+    ZYZ Euler angles (alpha, beta, gamma) in radians of an (N,3,3) stack of rotation
+    matrices, R = Rz(alpha) Ry(beta) Rz(gamma). Returns an (N,3) array. When beta is
+    0 or pi, gamma is taken to be 0.
+  """
+  R = numpy.asarray(rotations, dtype=float).reshape(-1, 3, 3)
+
+  beta = numpy.arccos(numpy.clip(R[:,2,2], -1.0, 1.0))
+  alpha = numpy.arctan2(R[:,1,2], R[:,0,2])
+  gamma = numpy.arctan2(R[:,2,1], -R[:,2,0])
+
+  # Gimbal lock, only alpha + gamma is defined
+  locked = numpy.abs(numpy.sin(beta)) < 1e-8
+  s = numpy.sign(R[locked,2,2])
+  alpha[locked] = numpy.arctan2(s * R[locked,1,0], s * R[locked,0,0])
+  gamma[locked] = 0.0
+
+  return numpy.column_stack((alpha, beta, gamma))
+
+def tensor_properties(tensors):
+  """
+    Properties of a stack of NMR tensors, e.g. the shieldings, EFGs or ISCs of every site,
+    in one pass. tensors can be (N,3,3), (N,9) or a single tensor.
+
+    Returns a dict of arrays with one entry per tensor:
+      iso         isotropic value, trace/3
+      evals       (N,3) eigenvalues of the symmetric part in Haeberlen order (xx, yy, zz)
+      evecs       (N,3,3) matching eigenvectors as columns
+      euler       (N,3) ZYZ Euler angles (alpha, beta, gamma) of the principal axes, radians
+      aniso       anisotropy, zz - (xx + yy)/2
+      red_aniso   reduced anisotropy, zz - iso
+      asym        asymmetry, (yy - xx) / (zz - iso)
+      span        largest minus smallest eigenvalue
+      skew        3 (middle - iso) / span, in [-1, 1]
+
+    Spherical tensors have an asymmetry and skew of 0.
+
+    >>> props = tensor_properties(ms_tensors)
+    >>> props['iso'][props['asym'] > 0.5]
+  """
+  tensors = as_stack(tensors)
+
+  iso, evals, evecs = haeberlen(tensors)
+  xx, yy, zz = evals[:,0], evals[:,1], evals[:,2]
+
+  red_aniso = zz - iso
+  aniso = zz - (xx + yy) / 2.0
+
+  ordered = numpy.sort(evals, axis=1)
+  span = ordered[:,2] - ordered[:,0]
+
+  # Avoid 0/0 for isotropic tensors
+  spherical = span <= 1e-12 * numpy.maximum(1.0, numpy.abs(iso))
+
+  safe_red_aniso = numpy.where(spherical, 1.0, red_aniso)
+  safe_span = numpy.where(spherical, 1.0, span)
+
+  asym = numpy.where(spherical, 0.0, (yy - xx) / safe_red_aniso)
+  skew = numpy.where(spherical, 0.0, numpy.clip(3.0 * (ordered[:,1] - iso) / safe_span, -1.0, 1.0))
+
+  return {'iso': iso,
+          'evals': evals,
+          'evecs': evecs,
+          'euler': euler_angles(evecs),
+          'aniso': aniso,
+          'red_aniso': red_aniso,
+          'asym': asym,
+          'span': span,
+          'skew': skew}
+
+def site_properties(props, row):
+  """
+    The properties of one tensor out of those given by tensor_properties.
+  """
+  return dict((key, values[row]) for key, values in props.items())
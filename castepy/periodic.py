@@ -0,0 +1,343 @@
+import numpy
+
+def _ragged_arange(starts, counts):
+  """
+    Concatenation of arange(start, start+count) for every start/count pair.
+  """
+  total = counts.sum()
+
+  if total == 0:
+    return numpy.zeros(0, dtype=int)
+
+  ends = numpy.cumsum(counts)
+  local = numpy.arange(total) - numpy.repeat(ends - counts, counts)
+
+  return numpy.repeat(starts, counts) + local
+
+_neighbour_cells = numpy.array([(i, j, k) for i in (-1, 0, 1)
+                                          for j in (-1, 0, 1)
+                                          for k in (-1, 0, 1)], dtype=float)
+
+def reduce_lattice(lattice, max_iter=100):
+  """
+    Reduce a lattice to a short, nearly orthogonal basis of the same lattice by
+    repeatedly shortening each vector with integer combinations of the others.
+
+    Returns (reduced, transform) with reduced == dot(transform, lattice).
+  """
+  reduced = numpy.array(lattice, dtype=float)
+  transform = numpy.identity(3, dtype=int)
+
+  for n in range(max_iter):
+    changed = False
+
+    for i in range(3):
+      for j in range(3):
+        if i == j:
+          continue
+
+        m = int(round(numpy.dot(reduced[i], reduced[j]) / numpy.dot(reduced[j], reduced[j])))
+
+        if m != 0:
+          shorter = reduced[i] - m * reduced[j]
+
+          if numpy.dot(shorter, shorter) < numpy.dot(reduced[i], reduced[i]) - 1e-12:
+            reduced[i] = shorter
+            transform[i] -= m * transform[j]
+            changed = True
+
+      # Also try the face diagonals of the other two vectors
+      j, k = [x for x in range(3) if x != i]
+      for sj, sk in [(1, 1), (1, -1), (-1, 1), (-1, -1)]:
+        shorter = reduced[i] + sj * reduced[j] + sk * reduced[k]
+
+        if numpy.dot(shorter, shorter) < numpy.dot(reduced[i], reduced[i]) - 1e-12:
+          reduced[i] = shorter
+          transform[i] += sj * transform[j] + sk * transform[k]
+          changed = True
+
+    if not changed:
+      break
+
+  return reduced, transform
+
+def minimum_image(lattice, a, b, chunk=100000):
+  """
+    Give the closest periodic images of positions a to positions b.
+
+    a and b are (N,3) arrays of pairs, or single positions which are broadcast
+    against the other. All 27 neighbouring images are checked at once in a reduced
+    basis of the lattice, so the result is the true minimum image however skewed
+    the cell is.
+
+    Returns (distances, images), images being a + integer combinations of the
+    lattice vectors.
+
+    >>> dists, images = minimum_image(lattice, positions[i], positions[j])
+  """
+  a = numpy.asarray(a, dtype=float)
+  b = numpy.asarray(b, dtype=float)
+
+  single = a.ndim == 1 and b.ndim == 1
+
+  a, b = numpy.broadcast_arrays(numpy.atleast_2d(a), numpy.atleast_2d(b))
+
+  reduced, _ = reduce_lattice(lattice)
+  inv_reduced = numpy.linalg.inv(reduced)
+  neighbours = numpy.dot(_neighbour_cells, reduced)
+
+  dists = numpy.empty(len(a))
+  images = numpy.empty((len(a), 3))
+
+  for start in range(0, len(a), chunk):
+    end = start + chunk
+
+    # Nearest lattice point in the reduced basis, then its neighbours
+    shift = numpy.dot(numpy.round(numpy.dot(b[start:end] - a[start:end], inv_reduced)), reduced)
+    candidates = (a[start:end] + shift)[:,None,:] + neighbours[None,:,:]
+
+    d2 = ((candidates - b[start:end,None,:])**2).sum(axis=2)
+    best = d2.argmin(axis=1)
+    rows = numpy.arange(len(best))
+
+    dists[start:end] = numpy.sqrt(d2[rows, best])
+    images[start:end] = candidates[rows, best]
+
+  if single:
+    return dists[0], images[0]
+  else:
+    return dists, images
+
+class NeighbourIndex(object):
+  """
+    A periodic cell list over a set of positions.
+
+    The cell is split into bins along each lattice vector, roughly cutoff Angstroms
+    thick, so a radius query only needs to look at the atoms in nearby bins. Bins
+    wrap around the cell, carrying the lattice translation with them, so every
+    periodic image within the radius is found whatever the shape of the cell.
+    Queries of any radius work, cutoff only sets the bin size.
+
+    Without a lattice the positions are binned inside their bounding box and no
+    images are generated.
+
+    >>> index = NeighbourIndex(positions, lattice, 3.0)
+    >>> rows, translations, dists = index.query(p, 2.5)
+    >>> i, j, translations, dists = index.pairs_within(2.0)
+  """
+
+  def __init__(self, positions, lattice=None, cutoff=3.0):
+    self.positions = numpy.array(positions, dtype=float).reshape(-1, 3)
+    self.cutoff = float(cutoff)
+
+    if lattice is not None:
+      self.periodic = True
+      self.lattice = numpy.array(lattice, dtype=float)
+      self.origin = numpy.zeros(3)
+    else:
+      self.periodic = False
+      self.lattice = None
+
+      if len(self.positions) > 0:
+        lo = self.positions.min(axis=0)
+        hi = self.positions.max(axis=0)
+      else:
+        lo = hi = numpy.zeros(3)
+
+      self.origin = lo
+      box = numpy.diag(numpy.maximum(hi - lo, self.cutoff) * (1.0 + 1e-8))
+
+    frame = self.lattice if self.periodic else box
+    self.inv_frame = numpy.linalg.inv(frame)
+    self.frame = frame
+
+    # |b_k|, the spacing between lattice planes is 1/|b_k|
+    self.recip_norm = numpy.sqrt((self.inv_frame**2).sum(axis=0))
+
+    frac = numpy.dot(self.positions - self.origin, self.inv_frame)
+
+    if self.periodic:
+      self.cell_shift = numpy.floor(frac).astype(int)
+      frac = frac - self.cell_shift
+    else:
+      self.cell_shift = numpy.zeros(frac.shape, dtype=int)
+
+    self.nbins = self._num_bins(len(self.positions))
+
+    bins = numpy.clip(numpy.floor(frac * self.nbins).astype(int), 0, self.nbins - 1)
+    self.bins = bins
+
+    flat = self._flat(bins)
+    self.order = numpy.argsort(flat, kind='mergesort')
+    self.counts = numpy.bincount(flat, minlength=int(numpy.prod(self.nbins)))
+    self.starts = numpy.cumsum(self.counts) - self.counts
+
+  def _num_bins(self, num_atoms):
+    nbins = numpy.maximum(1, numpy.floor(1.0 / (self.recip_norm * self.cutoff))).astype(int)
+
+    # Don't let bins vastly outnumber atoms
+    max_bins = max(27, 2 * num_atoms)
+    total = numpy.prod(nbins.astype(float))
+
+    if total > max_bins:
+      scale = (total / max_bins) ** (1.0/3.0)
+      nbins = numpy.maximum(1, numpy.floor(nbins / scale)).astype(int)
+
+    return nbins
+
+  def _flat(self, bins):
+    return (bins[...,0] * self.nbins[1] + bins[...,1]) * self.nbins[2] + bins[...,2]
+
+  def _stencil(self, r, centre=None):
+    """
+      Bin offsets that can hold a point within r of a point in the central bin.
+    """
+    reach = numpy.ceil(r * self.recip_norm * self.nbins).astype(int)
+
+    lo = -reach
+    hi = reach
+
+    # Without periodicity only offsets landing inside the box are any use
+    if not self.periodic:
+      if centre is None:
+        centre = numpy.zeros(3, dtype=int)
+        lo = numpy.maximum(lo, 1 - self.nbins)
+      else:
+        lo = numpy.maximum(lo, -centre)
+
+      hi = numpy.minimum(hi, self.nbins - 1 - centre)
+
+    if (hi < lo).any():
+      return numpy.zeros((0, 3), dtype=int)
+
+    grid = numpy.mgrid[lo[0]:hi[0]+1, lo[1]:hi[1]+1, lo[2]:hi[2]+1]
+
+    return grid.reshape(3, -1).T
+
+  def _wrap(self, bins):
+    """
+      Map unwrapped bin coordinates onto (bin number, lattice translation, valid).
+    """
+    translation = bins // self.nbins
+    wrapped = bins - translation * self.nbins
+
+    if self.periodic:
+      valid = numpy.ones(len(bins), dtype=bool)
+    else:
+      valid = (translation == 0).all(axis=1)
+      translation = numpy.zeros_like(translation)
+
+    return self._flat(wrapped), translation, valid
+
+  def matches(self, positions, lattice):
+    """
+      Was this index built for these positions and lattice?
+    """
+    if (lattice is None) != (self.lattice is None):
+      return False
+
+    if lattice is not None and not numpy.array_equal(lattice, self.lattice):
+      return False
+
+    return numpy.array_equal(positions, self.positions)
+
+  def query(self, p, r):
+    """
+      Find every periodic image of every position within r of p.
+
+      Returns (rows, translations, distances) where the image of positions[rows[n]]
+      is positions[rows[n]] + dot(translations[n], lattice).
+    """
+    p = numpy.asarray(p, dtype=float)
+
+    fp = numpy.dot(p - self.origin, self.inv_frame)
+    centre = numpy.floor(fp * self.nbins).astype(int)
+
+    flat, translation, valid = self._wrap(centre + self._stencil(r, centre))
+    flat, translation = flat[valid], translation[valid]
+
+    counts = self.counts[flat]
+    rows = self.order[_ragged_arange(self.starts[flat], counts)]
+    translations = numpy.repeat(translation, counts, axis=0) - self.cell_shift[rows]
+
+    images = self.positions[rows] + self._translate(translations)
+    dists = numpy.sqrt(((images - p)**2).sum(axis=1))
+
+    found = dists <= r
+
+    return rows[found], translations[found], dists[found]
+
+  def pairs_within(self, r, chunk=1000000):
+    """
+      Find all pairs of positions, including periodic images, separated by at most r.
+
+      Returns (i, j, translations, distances) with positions[j] + dot(translations, lattice)
+      being the image of j near i. Every pair is given once: i < j, or i == j for the
+      images of an atom with itself.
+    """
+    found_i = []
+    found_j = []
+    found_t = []
+    found_d = []
+
+    num_atoms = len(self.positions)
+
+    # Work through the atoms in batches of roughly chunk candidate pairs
+    if num_atoms > 0:
+      step = max(1, chunk // max(1, int(self.counts.max())))
+    else:
+      step = 1
+
+    for offset in self._stencil(r):
+      for start in range(0, num_atoms, step):
+        i_rows = numpy.arange(start, min(start + step, num_atoms))
+
+        flat, translation, valid = self._wrap(self.bins[i_rows] + offset)
+        i_rows, flat, translation = i_rows[valid], flat[valid], translation[valid]
+
+        counts = self.counts[flat]
+
+        i = numpy.repeat(i_rows, counts)
+        j = self.order[_ragged_arange(self.starts[flat], counts)]
+        t = numpy.repeat(translation + self.cell_shift[i_rows], counts, axis=0) - self.cell_shift[j]
+
+        # Each unordered pair once
+        keep = (i < j) | ((i == j) & self._positive(t))
+        i, j, t = i[keep], j[keep], t[keep]
+
+        d = self.positions[j] + self._translate(t) - self.positions[i]
+        dists = numpy.sqrt((d**2).sum(axis=1))
+
+        within = dists <= r
+
+        found_i.append(i[within])
+        found_j.append(j[within])
+        found_t.append(t[within])
+        found_d.append(dists[within])
+
+    if len(found_i) == 0:
+      return (numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int),
+              numpy.zeros((0, 3), dtype=int), numpy.zeros(0))
+
+    i = numpy.concatenate(found_i)
+    j = numpy.concatenate(found_j)
+    t = numpy.concatenate(found_t)
+    dists = numpy.concatenate(found_d)
+
+    order = numpy.lexsort((dists, j, i))
+
+    return i[order], j[order], t[order], dists[order]
+
+  def _translate(self, translations):
+    if self.periodic:
+      return numpy.dot(translations, self.lattice)
+    else:
+      return numpy.zeros(translations.shape)
+
+  @staticmethod
+  def _positive(t):
+    """
+      Is each translation lexicographically greater than zero?
+    """
+    first = numpy.where(t[:,0] != 0, t[:,0], numpy.where(t[:,1] != 0, t[:,1], t[:,2]))
+    return first > 0
@@ -6,6 +6,8 @@ USER_EMAIL = "tim.green@materials.ox.ac.uk"
 
 PLATFORM = os.getenv('CASTEPY_PLATFORM')
 
+CACHE_PATH = os.getenv('CASTEPY_CACHE', os.path.join(os.path.expanduser("~"), ".castepy", "cache.sqlite"))
+
 cluster_pspot_dir = {'hector': "/home/e89/e89/green/work/ncp_pspot",
 	             'archer': None,
                      'ironman': "/home/green/scratch/ncp_pspot",
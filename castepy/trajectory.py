@@ -0,0 +1,238 @@
+import os
+import re
+import numpy
+
+from castepy.atoms import Atoms
+from castepy.input.cell import Cell
+from castepy.output.sections import CastepIndex
+from castepy.output.forces import ForcesResult
+
+number = r"([-+0-9.Ee]+)"
+
+#            x  H            1         0.663433   0.696390   0.549180   x
+re_position_line = re.compile(r"^[ \t]+x[ \t]+([A-Za-z]\S*)[ \t]+([0-9]+)[ \t]+" +
+                              r"[ \t]+".join([number] * 3) + r"[ \t]+x[ \t]*\r?$", re.M)
+re_energy = re.compile(r"=\s*" + number + r"\s+eV")
+
+class Trajectory(object):
+  """
+    A sequence of structures of the same atoms, e.g. the steps of a geometry
+    optimisation or an MD run, held as arrays.
+
+      species     (N,) species of each atom, shared by every frame
+      indices     (N,) index of each atom within its species
+      positions   (nframes, N, 3) Cartesian positions in A
+      lattices    (nframes, 3, 3) lattice vectors as rows in A, or None if not periodic
+      energies    (nframes,) energies in eV, NaN where unknown
+      forces      (nframes, N, 3) forces in eV/A, or None
+
+    The arrays can equally be memory maps, see save and load, so a trajectory larger
+    than memory can be worked through a frame at a time. An AtomsView of a frame is
+    only made when it's asked for.
+
+    >>> traj = Trajectory.from_castep("relax.castep")
+    >>> traj[-1].within(traj[-1].C1, 2.0)
+    >>> traj[::10].positions.mean(axis=0)
+  """
+
+  arrays = ['species', 'indices', 'positions', 'lattices', 'energies', 'forces']
+
+  def __init__(self, species, indices, positions, lattices=None, energies=None, forces=None):
+    self.species = numpy.asarray(species, dtype=str)
+    self.indices = numpy.asarray(indices, dtype=int)
+    self.positions = positions
+    self.lattices = lattices
+    self.forces = forces
+
+    if energies is None:
+      energies = numpy.empty(len(positions))
+      energies.fill(numpy.nan)
+
+    self.energies = energies
+
+  @classmethod
+  def from_cells(klass, cells):
+    """
+      Stack the structures of a sequence of Cells, which must hold the same atoms in
+      the same order.
+    """
+    cells = list(cells)
+
+    if len(cells) == 0:
+      raise ValueError("No cells")
+
+    ions = cells[0].ions
+    positions = numpy.array([cell.ions.positions for cell in cells])
+    lattices = numpy.array([cell.ions.lattice for cell in cells])
+
+    for n, cell in enumerate(cells):
+      if not (numpy.array_equal(cell.ions.species_array, ions.species_array) and
+              numpy.array_equal(cell.ions.indices_array, ions.indices_array)):
+        raise ValueError("Cell %d has different atoms" % n)
+
+    return klass(ions.species_array, ions.indices_array, positions, lattices)
+
+  @classmethod
+  def from_castep(klass, castep, force_title=None):
+    """
+      Every structure printed in a .castep file, given its path or CastepIndex, as
+      the steps of a geometry optimisation are. Each frame takes the lattice printed
+      before it, and the energy and forces printed after it and before the next.
+      force_title picks which forces box to use if there's more than one per step,
+      e.g. "Constrained Forces".
+    """
+    if isinstance(castep, CastepIndex):
+      index = castep
+    else:
+      index = CastepIndex(castep)
+
+    num_frames = index.count('positions')
+
+    if num_frames == 0:
+      raise ValueError("No atomic positions in %s" % index.path)
+
+    species = indices = None
+    frac = None
+
+    for frame in range(num_frames):
+      lines = re_position_line.findall(index.text('positions', frame))
+
+      if frac is None:
+        species = [line[0] for line in lines]
+        indices = [int(line[1]) for line in lines]
+        frac = numpy.zeros((num_frames, len(lines), 3))
+      elif len(lines) != frac.shape[1]:
+        raise ValueError("Frame %d has %d atoms, expected %d" % (frame, len(lines), frac.shape[1]))
+
+      frac[frame] = numpy.array([line[2:] for line in lines], dtype=float)
+
+    frame_starts = [start for start, end in index.sections['positions']]
+
+    def frame_of(kind):
+      """
+        The frame each section of a kind belongs to, the last one started before it, or -1
+      """
+      return numpy.searchsorted(frame_starts, [start for start, end in index.sections[kind]]) - 1
+
+    lattices = numpy.zeros((num_frames, 3, 3))
+    lattice_starts = [start for start, end in index.sections['lattice']]
+
+    if len(lattice_starts) == 0:
+      raise ValueError("No lattice in %s" % index.path)
+
+    for frame, start in enumerate(frame_starts):
+      n = max(0, numpy.searchsorted(lattice_starts, start) - 1)
+      lines = index.text('lattice', n).split("\n")[1:4]
+      lattices[frame] = numpy.array([line.split()[:3] for line in lines], dtype=float)
+
+    positions = numpy.einsum('fni,fij->fnj', frac, lattices)
+
+    energies = numpy.empty(num_frames)
+    energies.fill(numpy.nan)
+
+    for n, frame in enumerate(frame_of('energy')):
+      m = re_energy.search(index.text('energy', n))
+      if frame >= 0 and m is not None:
+        energies[frame] = float(m.group(1))
+
+    forces = None
+    force_result = ForcesResult.load(index)
+
+    if force_result.num_steps > 0:
+      forces = numpy.empty((num_frames, len(species), 3))
+      forces.fill(numpy.nan)
+
+      for n, frame in enumerate(frame_of('forces')):
+        if frame >= 0 and force_title in (None, force_result.titles[n]):
+          forces[frame] = force_result.forces[n]
+
+    return klass(species, indices, positions, lattices, energies, forces)
+
+  def save(self, dir):
+    """
+      Write the arrays as .npy files in dir, to be memory mapped by load.
+    """
+    if not os.path.isdir(dir):
+      os.makedirs(dir)
+
+    for name in self.arrays:
+      values = getattr(self, name)
+      path = os.path.join(dir, name + ".npy")
+
+      if values is not None:
+        numpy.save(path, values)
+      elif os.path.exists(path):
+        os.remove(path)
+
+  @classmethod
+  def load(klass, dir, mmap_mode='r'):
+    """
+      A trajectory saved in dir, memory mapped unless mmap_mode is None.
+    """
+    arrays = {}
+
+    for name in klass.arrays:
+      path = os.path.join(dir, name + ".npy")
+
+      if os.path.exists(path):
+        arrays[name] = numpy.load(path, mmap_mode=None if name in ('species', 'indices') else mmap_mode)
+      else:
+        arrays[name] = None
+
+    return klass(**arrays)
+
+  @property
+  def num_atoms(self):
+    return len(self.species)
+
+  def __len__(self):
+    return len(self.positions)
+
+  def lattice(self, n):
+    return None if self.lattices is None else numpy.asarray(self.lattices[n])
+
+  def frame(self, n):
+    """
+      An AtomsView of frame n. Its positions are a copy, changing them doesn't change
+      the trajectory.
+    """
+    return Atoms.from_arrays(self.species, self.indices, numpy.array(self.positions[n]),
+                             lattice=self.lattice(n))
+
+  def cell(self, n):
+    """
+      A Cell of frame n, e.g. to write out as a .cell file.
+    """
+    if self.lattices is None:
+      raise ValueError("Frames without a lattice can't be made into a Cell")
+
+    cell = Cell()
+
+    cell.lattice_units = "ang"
+    cell.lattice_type = "LATTICE_CART"
+    cell.ions_units = "ang"
+    cell.ions_type = "POSITIONS_ABS"
+    cell.basis = numpy.identity(3)
+
+    cell.lattice = self.lattice(n)
+    cell.ions = self.frame(n)
+
+    return cell
+
+  def __getitem__(self, idx):
+    """
+      An integer gives the AtomsView of that frame, a slice or array of frames a
+      Trajectory of them. Slices share the arrays, memory maps included.
+    """
+    if isinstance(idx, (int, long, numpy.integer)):
+      return self.frame(idx)
+
+    def take(values):
+      return None if values is None else values[idx]
+
+    return Trajectory(self.species, self.indices, self.positions[idx],
+                      take(self.lattices), self.energies[idx], take(self.forces))
+
+  def __iter__(self):
+    for n in range(len(self)):
+      yield self.frame(n)
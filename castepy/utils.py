@@ -1,6 +1,14 @@
 import os
 import settings
 
+try:
+  from os import scandir
+except ImportError:
+  try:
+    from scandir import scandir
+  except ImportError:
+    scandir = None
+
 def calc_from_path(path):
   """
     Given a file from a calculation (e.g. foo/bar.cell), infer the calculation directory and name (foo, bar)
@@ -33,5 +41,37 @@ def find_all_calcs(dir):
   
   return calcs
 
+def dir_entries(dir):
+  """
+    (name, path, is_dir) for every entry of dir, using scandir where available so
+    that no extra stat is needed per entry.
+  """
+  if scandir is not None:
+    for entry in scandir(dir):
+      yield entry.name, entry.path, entry.is_dir()
+  else:
+    for f in os.listdir(dir):
+      path = os.path.join(dir, f)
+      yield f, path, os.path.isdir(path)
+
+def scan_calcs(dir):
+  """
+    Find every calculation (any seedname with a .cell file) below dir, giving a sorted
+    list of (dir, name) pairs.
+  """
+  calcs = []
+  to_visit = [dir]
+
+  while to_visit:
+    current = to_visit.pop()
+
+    for f, path, is_dir in dir_entries(current):
+      if is_dir:
+        to_visit.append(path)
+      elif f.endswith(".cell"):
+        calcs.append((current, f[:-5]))
+
+  return sorted(calcs)
+
 def path(s):
   return os.path.join(settings.CASTEPY_ROOT, s)
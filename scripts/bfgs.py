@@ -4,6 +4,8 @@
 import os, sys
 import re
 
+from castepy.output.sections import CastepIndex
+
 # |  dE/ion   |   4.399379E-004 |   5.000000E-006 |         eV | No  | <-- BFGS
 
 step_parts = re.compile("^ \|\s+(.*?)\s+\|\s+([0-9A-Z\.\-\+]+)\s+\|\s+([0-9A-Z\.\-\+]+)\s+\|\s+(.*?)\s+\|\s+(.*?)\s+\| <-- BFGS", re.M)
@@ -27,7 +29,7 @@ def read_castep_file(castep_file):
   return steps
 
 if __name__ == "__main__":
-  steps = read_castep_file(open(sys.argv[1]).read())
+  steps = read_castep_file(CastepIndex(sys.argv[1]).text('bfgs'))
 
   print "#N", " ".join([str(s['param']) for s in steps[0]])
   for i, step in enumerate(steps):
@@ -1,16 +1,15 @@
 #!python
 import sys
-from numpy import array
-from castepy.cell import Cell
+from castepy.input.cell import Cell
+from castepy.trajectory import Trajectory
 
 c1 = Cell(open(sys.argv[1]).read())
 c2 = Cell(open(sys.argv[2]).read())
 t = float(sys.argv[3])
 
-for ion1 in c1.ions:
-  ion2 = c2.ions.get_species(ion1.s, ion1.i)
+traj = Trajectory.from_cells([c1, c2])
 
-  ion1.p = (1.0-t)*array(ion1.p) + t*array(ion2.p)
+# Keep every other block and keyword of the first cell
+c1.ions.positions[:] = (1.0-t)*traj.positions[0] + t*traj.positions[1]
 
 print c1
-
@@ -1,20 +1,20 @@
 #!python
 import sys
-from castepy.cell import Cell
+from castepy.input.cell import Cell
+from castepy.trajectory import Trajectory
 
 def get_val(s):
   return float(s.split('-')[3][:-5])
 
-cells = []
-for f in sorted(sys.argv[1:], key=get_val):
+files = sorted(sys.argv[1:], key=get_val)
+for f in files:
   print >>sys.stderr, f, get_val(f)
-  cell = Cell(open(f).read())
-  cells.append(cell)
 
-for t, cell in enumerate(cells):
-  print len(cell.ions)
-  print float(t)
+traj = Trajectory.from_cells(Cell(open(f).read()) for f in files)
 
-  for ion in cell.ions:
-    print "%s %f %f %f" % (ion.s, ion.p[0], ion.p[1], ion.p[2])
+for t, positions in enumerate(traj.positions):
+  print traj.num_atoms
+  print float(t)
 
+  for s, (x, y, z) in zip(traj.species, positions):
+    print "%s %f %f %f" % (s, x, y, z)
@@ -37,6 +37,7 @@ setup(name='Castepy',
       author_email='timothy.green@gmail.com',
       url='',
       packages=['castepy','castepy.input', 'castepy.output', 'castepy.tasks'],
+      requires=['numpy (>=1.10, <1.17)'],
       package_data={'castepy': relative_find('castepy', 'templates'),},
       scripts=[os.path.join('scripts', f) for f in os.listdir('scripts')],
       )
@@ -1,8 +1,23 @@
 import unittest
 
 from unit_tests.test_cell import *
+from unit_tests.test_atoms import *
 from unit_tests.test_bonds import *
 from unit_tests.test_util import *
+from unit_tests.test_cache import *
+from unit_tests.test_sections import *
+from unit_tests.test_follow import *
+from unit_tests.test_tensors import *
+from unit_tests.test_nmr import *
+from unit_tests.test_bands import *
+from unit_tests.test_dos import *
+from unit_tests.test_forces import *
+from unit_tests.test_geometry import *
+from unit_tests.test_trajectory import *
+from unit_tests.test_geom import *
+from unit_tests.test_analysis import *
+from unit_tests.test_calc import *
+from unit_tests.test_export import *
 
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,138 @@
+import os
+import unittest
+import numpy
+
+from castepy.analysis import RDF, Coordination, AngleDistribution, accumulate, frames
+from castepy.output.geom import GeomFile
+from castepy.trajectory import Trajectory
+
+test_data = os.path.join(os.path.dirname(__file__), "../test_data")
+
+def diamond(n=2, a=5.43):
+  basis = numpy.array([[0, 0, 0], [0, .5, .5], [.5, 0, .5], [.5, .5, 0]])
+  basis = numpy.vstack((basis, basis + .25))
+
+  grid = numpy.array([(i, j, k) for i in range(n) for j in range(n) for k in range(n)])
+  positions = (grid[:,None,:] + basis[None]).reshape(-1, 3) * a
+
+  return numpy.array(['Si'] * len(positions)), positions, numpy.identity(3) * a * n
+
+class TestAnalysis(unittest.TestCase):
+  def test_rdf_ideal_gas(self):
+    numpy.random.seed(0)
+    species = numpy.array(['Si'] * 200 + ['O'] * 200)
+    lattice = numpy.identity(3) * 15.0
+
+    rdf = RDF(r_max=7.0, bins=70)
+
+    for n in range(10):
+      rdf.add(species, numpy.random.rand(400, 3) * 15.0, lattice)
+
+    self.assertEqual(rdf.num_frames, 10)
+    self.assertAlmostEqual(rdf.g()[10:].mean(), 1.0, places=1)
+    self.assertAlmostEqual(rdf.g('Si', 'O')[10:].mean(), 1.0, places=1)
+
+  def test_small_cell(self):
+    # r_max beyond the cell, so atoms see their own images
+    rdf = RDF(r_max=4.0, bins=40)
+    rdf.add(numpy.array(['Si']), numpy.zeros((1, 3)), numpy.identity(3) * 3.0)
+
+    first = numpy.searchsorted(rdf.r, 3.0)
+    self.assertAlmostEqual(rdf.coordination()[first], 6.0)
+    self.assertAlmostEqual(rdf.g()[first], 6.0 * 27.0 / (4.0 / 3.0 * numpy.pi * (3.1**3 - 3.0**3)))
+
+    # An ideal gas of two atoms tends to 1, not N/(N-1)
+    numpy.random.seed(2)
+    gas = RDF(r_max=12.0, bins=24)
+
+    for n in range(100):
+      gas.add(numpy.array(['Si', 'Si']), numpy.random.rand(2, 3) * 3.0, numpy.identity(3) * 3.0)
+
+    shells = numpy.diff(gas.edges**3)[12:]
+    self.assertTrue(abs((gas.g()[12:] * shells).sum() / shells.sum() - 1.0) < 0.05)
+
+  def test_diamond(self):
+    species, positions, lattice = diamond()
+
+    rdf = RDF(r_max=4.0, bins=400)
+    coordination = Coordination()
+    angles = AngleDistribution(bins=180)
+
+    accumulate(Trajectory(species, range(1, len(species) + 1), positions[None], lattice[None]),
+               [rdf, coordination, angles])
+
+    # First shell at a sqrt(3)/4
+    self.assertAlmostEqual(rdf.r[rdf.counts[0,0].nonzero()[0][0]], 5.43 * numpy.sqrt(3) / 4, places=2)
+    self.assertEqual(rdf.coordination('Si', 'Si')[300], 4.0)
+
+    self.assertEqual(coordination.mean('Si'), 4.0)
+    self.assertEqual(coordination.distribution('Si', 'Si')[4], 1.0)
+
+    distribution = angles.distribution('Si', 'Si', 'Si')
+    self.assertEqual(angles.theta[distribution.argmax()], 109.5)
+    self.assertAlmostEqual(distribution.sum(), 1.0)
+
+  def test_pair_order(self):
+    # Angles at O between Si and H are counted whichever way round they're asked for
+    species = numpy.array(['Si', 'O', 'H'])
+    positions = numpy.array([[0.0, 0.0, 0.0], [1.6, 0.0, 0.0], [2.2, 0.75, 0.0]])
+
+    angles = AngleDistribution(bins=18)
+    angles.add(species, positions, None)
+
+    self.assertEqual(angles.histogram.sum(), 1)
+    self.assertEqual(angles.distribution('Si', 'O', 'H')[12], 0.1)
+    self.assertEqual(angles.distribution('H', 'O', 'Si')[12], 0.1)
+    self.assertEqual(angles.distribution('H', 'Si', 'O').sum(), 0.0)
+
+    coordination = Coordination()
+    coordination.add(species, positions, None)
+    self.assertEqual(coordination.mean('O'), 2.0)
+    self.assertEqual(coordination.mean('O', 'H'), 1.0)
+
+  def test_workers(self):
+    numpy.random.seed(1)
+    species, positions, lattice = diamond()
+
+    num_frames = 10
+    traj = Trajectory(species, range(1, len(species) + 1),
+                      positions[None] + numpy.random.normal(0.0, 0.05, (num_frames,) + positions.shape),
+                      numpy.array([lattice] * num_frames))
+
+    def analyses():
+      return [RDF(r_max=5.0, bins=50), Coordination(), AngleDistribution(bins=36)]
+
+    serial = accumulate(traj, analyses())
+    pooled = accumulate(traj, analyses(), workers=2, chunksize=3)
+
+    for a, b in zip(serial, pooled):
+      self.assertEqual(b.num_frames, num_frames)
+      self.assertEqual(b.species.tolist(), a.species.tolist())
+
+    self.assertTrue(numpy.allclose(pooled[0].counts, serial[0].counts))
+    self.assertTrue(numpy.allclose(pooled[0].g(), serial[0].g()))
+    self.assertEqual(pooled[1].histogram.tolist(), serial[1].histogram.tolist())
+    self.assertEqual(pooled[2].histogram.tolist(), serial[2].histogram.tolist())
+
+  def test_merge(self):
+    md = GeomFile(os.path.join(test_data, "water.md"))
+
+    whole = RDF(r_max=3.0)
+    accumulate(md, [whole])
+
+    parts = [RDF(r_max=3.0), RDF(r_max=3.0)]
+    parts[0].add(*next(frames(md.frame(0))))
+    accumulate(md.frames(1), [parts[1]])
+    parts[0].merge(parts[1])
+
+    self.assertEqual(parts[0].num_frames, len(md))
+    self.assertTrue(numpy.allclose(parts[0].counts, whole.counts))
+    self.assertTrue(numpy.allclose(parts[0].g('O', 'H'), whole.g('O', 'H')))
+
+    other = RDF()
+    other.add(numpy.array(['C']), numpy.zeros((1, 3)), numpy.identity(3) * 5.0)
+    self.assertRaises(ValueError, whole.merge, other)
+    self.assertRaises(ValueError, whole.add, numpy.array(['C']), numpy.zeros((1, 3)), numpy.identity(3) * 5.0)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,183 @@
+import unittest
+import itertools
+import pickle
+import numpy
+
+from castepy.atom import Atom
+from castepy.atoms import AtomsView, species_indices
+from castepy.periodic import minimum_image, reduce_lattice
+
+class TestAtomsArray(unittest.TestCase):
+  lattice = numpy.array([[5.0, 0.0, 0.0],
+                         [2.0, 4.0, 0.0],
+                         [1.0, 1.0, 3.0]])
+
+  def setUp(self):
+    numpy.random.seed(0)
+    self.positions = numpy.dot(numpy.random.random((20, 3)), self.lattice)
+    self.species = ['C', 'H', 'H', 'O'] * 5
+    self.indices = species_indices(self.species)
+
+  def test_species_indices(self):
+    self.assertEqual(list(species_indices(['H', 'C', 'H', 'O', 'C'])), [1, 1, 2, 1, 2])
+
+  def test_views(self):
+    """
+      Atoms created from the arrays are views that write back to the arrays.
+    """
+    atoms = AtomsView.from_arrays(self.species, self.indices, self.positions, lattice=self.lattice)
+
+    self.assertEqual(len(atoms), 20)
+    self.assertEqual(len(atoms.species('H')), 10)
+    self.assertEqual(atoms.H3, atoms.get('H', 3))
+    self.assertEqual(atoms.species('H')[2], atoms.H3)
+    self.assertNotEqual(atoms.H3, atoms.H4)
+    self.assertEqual(len(set([atoms.H3, atoms.get('H', 3), atoms.H4])), 2)
+
+    atoms.H3.bonds = []
+    self.assertEqual(atoms[('H', 3)].bonds, [])
+    self.assertRaises(AttributeError, getattr, atoms.H4, 'bonds')
+
+    atoms.H3.label = "H_methyl"
+    self.assertEqual(atoms.labels_array[5], "H_methyl")
+    self.assertEqual(atoms.H3.species, "H")
+
+    atoms.H3.position[0] = -1.0
+    self.assertEqual(atoms.positions[5][0], -1.0)
+
+    atoms.H4.position = [1.0, 2.0, 3.0]
+    self.assertEqual(atoms.positions[6].tolist(), [1.0, 2.0, 3.0])
+
+    copied = atoms.copy()
+    copied.H3.position[0] = 1.0
+    self.assertEqual(atoms.H3.position[0], -1.0)
+
+  def test_pickle(self):
+    atoms = AtomsView.from_arrays(self.species, self.indices, self.positions, lattice=self.lattice)
+    atoms.H3.label = "Hx"
+
+    copied = pickle.loads(pickle.dumps(atoms))
+
+    self.assertTrue(numpy.allclose(copied.positions, atoms.positions))
+    self.assertEqual(copied.H3.label, "Hx")
+
+  def test_within(self):
+    """
+      Array and list backed views find the same images as a brute force search.
+    """
+    array_atoms = AtomsView.from_arrays(self.species, self.indices, self.positions, lattice=self.lattice)
+    list_atoms = AtomsView([Atom(s, i, p) for s, i, p in zip(self.species, self.indices, self.positions)],
+                           self.lattice)
+
+    p = numpy.array([1.0, 2.0, 0.5])
+    r = 6.0
+
+    expected = []
+    for s, i, pos in zip(self.species, self.indices, self.positions):
+      for t in itertools.product(range(-6, 7), repeat=3):
+        image = pos + numpy.dot(t, self.lattice)
+
+        if numpy.linalg.norm(image - p) <= r:
+          expected.append((s, i, tuple(numpy.round(image, 6))))
+
+    for atoms in [array_atoms, list_atoms]:
+      found = [(a.species, a.index, tuple(numpy.round(a.position, 6))) for a in atoms.within(p, r)]
+      self.assertEqual(sorted(found), sorted(expected))
+
+  def test_within_list(self):
+    """
+      A list backed view keeps its positions between queries until atoms are added.
+    """
+    atoms = AtomsView([Atom(s, i, p) for s, i, p in zip(self.species, self.indices, self.positions)],
+                      self.lattice)
+
+    p = numpy.array([1.0, 2.0, 0.5])
+    found = len(atoms.within(p, 3.0))
+    positions = atoms._get_list_arrays()[0]
+
+    self.assertEqual(len(atoms.within(p, 3.0)), found)
+    self.assertTrue(atoms._get_list_arrays()[0] is positions)
+
+    atoms.add(Atom('H', 11, p))
+    self.assertEqual(len(atoms.positions), 21)
+    self.assertEqual(len(atoms.within(p, 3.0)), found + 1)
+
+  def test_pairs_within(self):
+    """
+      Bulk pair search gives every pair of images once, periodic or not.
+    """
+    for lattice in [self.lattice, None]:
+      atoms = AtomsView.from_arrays(self.species, self.indices, self.positions, lattice=lattice)
+      r = 3.5
+
+      i, j, t, d = atoms.pairs_within(r)
+      found = sorted(zip(i, j, [tuple(x) for x in t]))
+
+      if lattice is not None:
+        translations = list(itertools.product(range(-5, 6), repeat=3))
+      else:
+        translations = [(0, 0, 0)]
+
+      expected = []
+      for a in range(len(self.positions)):
+        for b in range(a, len(self.positions)):
+          for tr in translations:
+            if a == b and not tr > (0, 0, 0):
+              continue
+
+            image = self.positions[b]
+            if lattice is not None:
+              image = image + numpy.dot(tr, lattice)
+
+            if numpy.linalg.norm(image - self.positions[a]) <= r:
+              expected.append((a, b, tr))
+
+      self.assertEqual(found, sorted(expected))
+
+class TestMinimumImage(unittest.TestCase):
+  def test_cart(self):
+    lattice = numpy.array([(5.0, 0.0, 0.0),
+                           (0.0, 5.0, 0.0),
+                           (0.0, 0.0, 10.0),])
+
+    tests = [((0.0, 0.0, 0.0), (1.0, 1.0, 1.0), 3.0**0.5, (0.0, 0.0, 0.0)),
+             ((0.0, 0.0, 0.0), (4.0, 4.0, 9.0), 3.0**0.5, (5.0, 5.0, 10.0)),
+             ((0.0, 0.0, 0.0), (5.0, 0.0, 0.0), 0.0, (5.0, 0.0, 0.0))]
+
+    atoms = AtomsView([], lattice)
+
+    for a, b, dist, image in tests:
+      d, p = atoms.least_mirror(a, b)
+
+      self.assertAlmostEqual(d, dist)
+      self.assertTrue(numpy.allclose(p, image))
+
+    a, b, dists, images = [numpy.array(x) for x in zip(*tests)]
+    d, p = atoms.least_mirror(a, b)
+
+    self.assertTrue(numpy.allclose(d, dists))
+    self.assertTrue(numpy.allclose(p, images))
+
+  def test_skewed(self):
+    """
+      A badly skewed description of a cubic lattice still gives the true minimum image.
+    """
+    lattice = numpy.dot([[1, 3, -2], [0, 1, 4], [0, 0, 1]], numpy.identity(3) * 4.0)
+
+    reduced, transform = reduce_lattice(lattice)
+    self.assertTrue(numpy.allclose(numpy.dot(transform, lattice), reduced))
+    self.assertTrue(numpy.allclose(numpy.abs(reduced).sum(axis=1), 4.0))
+
+    numpy.random.seed(1)
+    a = numpy.random.random((50, 3)) * 20.0
+    b = numpy.random.random((50, 3)) * 20.0
+
+    d, p = minimum_image(lattice, a, b)
+
+    delta = (b - a) - 4.0 * numpy.round((b - a) / 4.0)
+
+    self.assertTrue(numpy.allclose(d, numpy.sqrt((delta**2).sum(axis=1))))
+    self.assertTrue(numpy.allclose(numpy.round((p - a) / 4.0) * 4.0, p - a))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+import numpy
+
+from castepy.output.bands import BandsResult, parse_bands
+
+class TestBands(unittest.TestCase):
+  si_path = "test_data/si.bands"
+  fe_path = "test_data/fe.bands"
+
+  def test_load(self):
+    bands = BandsResult.load(self.si_path)
+
+    self.assertEqual(bands.eigenvalues.shape, (1, 5, 8))
+    self.assertEqual(bands.k_index.tolist(), [1, 2, 3, 4, 5])
+    self.assertEqual(bands.fermi_energy, [0.211372])
+    self.assertEqual(bands.num_electrons, [8.0])
+    self.assertTrue(numpy.allclose(bands.weights, 0.2))
+    self.assertTrue(numpy.allclose(bands.kpoints[:,0], [-0.25, -0.15, -0.05, 0.05, 0.15]))
+    self.assertTrue(numpy.allclose(bands.unit_cell[0], [-5.13, 5.13, 5.13]))
+
+    # Bands of each k-point are in ascending order
+    self.assertTrue((numpy.diff(bands.eigenvalues, axis=2) >= 0).all())
+
+  def test_spins(self):
+    bands = BandsResult.load(self.fe_path)
+
+    self.assertEqual(bands.eigenvalues.shape, (2, 3, 5))
+    self.assertEqual(bands.fermi_energy, [0.25, 0.27])
+    self.assertEqual(bands.num_electrons, [4.0, 3.0])
+    self.assertEqual(bands.eigenvalues[0,2,0], -0.17450581)
+
+  def test_kpoint_range(self):
+    bands = BandsResult.load(self.si_path)
+    part = BandsResult.load(self.si_path, kpoints=(2, 4))
+
+    self.assertEqual(part.k_index.tolist(), [2, 3])
+    self.assertTrue(numpy.array_equal(part.eigenvalues, bands.eigenvalues[:,1:3]))
+    self.assertTrue(numpy.array_equal(part.kpoints, bands.kpoints[1:3]))
+
+  def test_memmap(self):
+    tmp_dir = tempfile.mkdtemp()
+    out = os.path.join(tmp_dir, "si.npy")
+
+    try:
+      bands = BandsResult.load(self.si_path, out=out)
+      mapped = numpy.load(out, mmap_mode='r')
+
+      self.assertTrue(numpy.array_equal(mapped, BandsResult.load(self.si_path).eigenvalues))
+      del bands, mapped
+    finally:
+      os.remove(out)
+      os.rmdir(tmp_dir)
+
+  def test_parse_bands(self):
+    result = parse_bands(open(self.fe_path).read())
+
+    self.assertEqual(len(result['kpoints']), 3)
+    self.assertEqual(result['kpoints'][2]['spins'][0]['bands'][0], -0.17450581)
+    self.assertEqual(len(result['kpoints'][0]['spins']), 2)
+
+if __name__ == "__main__":
+  unittest.main()
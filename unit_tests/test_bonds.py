@@ -1,6 +1,10 @@
+import math
 import unittest
+import numpy
 import castepy.input.cell as cell
-from castepy.output.bonds import BondsResult, parse_bonds
+from castepy.output.bonds import BondsResult, parse_bonds, add_bonds, bond_neighbours, bond_angle
+from castepy.atoms import AtomsView
+from castepy.radii import bond_cutoffs
 
 class TestBonds(unittest.TestCase):
   calc1_path = "test_data/ethanol/ethanol"
@@ -48,6 +52,131 @@ class TestBonds(unittest.TestCase):
     self.assertTrue(('C',2) in bonds.common(('C',1),('O',1)))
     self.assertTrue(('O',1) in bonds.common(('H',6),('C',2)))
 
+  def test_ethanol_graph(self):
+    """
+      Shells, components and paths over the bond graph.
+    """
+    castep_file = open("%s.castep" % self.calc1_path).read()
+    bonds = BondsResult.load(castep_file).next()
+
+    c1 = bonds.row(('C',1))
+    first, second = bonds.shells([c1], 2)
+
+    self.assertEqual(set(bonds.keys(first)), set([('C',2), ('H',1), ('H',2), ('H',3)]))
+    self.assertEqual(set(bonds.keys(second)), set([('O',1), ('H',4), ('H',5)]))
+    self.assertEqual(bonds.degree()[bonds.row(('O',1))], 2)
+    self.assertEqual(bonds.row(('N',1)), -1)
+
+    self.assertEqual(bonds.components()[0], 1)
+    self.assertEqual(bonds.keys(bonds.path(c1, bonds.row(('H',6)))), [('C',1), ('C',2), ('O',1), ('H',6)])
+    self.assertTrue(bonds.ring(c1) is None)
+
+  def test_rings(self):
+    """
+      A ring, a separate molecule and a bond between periodic images.
+    """
+    ring = [(('C',i), ('C',i % 6 + 1), 1.0, 1.4) for i in range(1, 7)]
+    other = [(('O',1), ('H',1), 0.6, 1.0), (('O',1), ('H',2), 0.6, 1.0), (('H',2), ('O',1), 0.6, 1.0)]
+    bonds = BondsResult(ring + other)
+
+    num, labels = bonds.components()
+    self.assertEqual(num, 2)
+    self.assertEqual(len(set(labels[bonds.rows([('C',1), ('C',4)])])), 1)
+    self.assertNotEqual(labels[bonds.row(('C',1))], labels[bonds.row(('O',1))])
+
+    self.assertEqual(len(bonds.ring(bonds.row(('C',3)))), 6)
+    self.assertTrue(bonds.ring(bonds.row(('C',3)), max_size=5) is None)
+    self.assertEqual(len(bonds.ring(bonds.row(('H',2)))), 2)
+    self.assertTrue(bonds.path(bonds.row(('C',1)), bonds.row(('O',1))) is None)
+
+    self.assertEqual(bonds.common(('C',1), ('C',3)), set([('C',2)]))
+
+  def test_ethanol_add_bonds(self):
+    """
+      Annotate the cell's ions with bonds, each carrying the bonded atom's nearest image.
+    """
+    c = cell.Cell(open("%s.cell" % self.calc1_path).read())
+    add_bonds(c.ions, open("%s.castep" % self.calc1_path).read())
+
+    self.assertEqual(len(c.ions.bonds), 8)
+    self.assertEqual(set(str(ion) for ion in bond_neighbours(c.ions.C1)), set(["C2", "H1", "H2", "H3"]))
+    self.assertEqual(set(str(ion) for ion in bond_neighbours(c.ions.C1, 3)), set(["H6"]))
+
+    for ion2, p, pop, r in c.ions.C1.bonds:
+      self.assertAlmostEqual(c.ions.C1.dist(p), r, places=4)
+
+  def test_empty_graph(self):
+    """
+      Queries of a graph with every bond filtered out.
+    """
+    castep_file = open("%s.castep" % self.calc1_path).read()
+    bonds = BondsResult.load(castep_file, tol=10.0).next()
+
+    self.assertEqual(len(bonds.bonds), 0)
+    self.assertEqual(bonds.common(('C',1), ('O',1)), set())
+    self.assertEqual(bonds.row(('C',1)), -1)
+    self.assertEqual(bonds.rows([('C',1), ('H',2)]).tolist(), [-1, -1])
+
+    c = cell.Cell(open("%s.cell" % self.calc1_path).read())
+    add_bonds(c.ions, castep_file, pop_tol=10.0)
+
+    self.assertEqual(len(c.ions.bonds), 0)
+    self.assertEqual(bond_neighbours(c.ions.C1), set())
+
+  def test_geometric_bonds(self):
+    """
+      Covalent radius bonds match the population analysis for ethanol.
+    """
+    c = cell.Cell(open("%s.cell" % self.calc1_path).read())
+    castep_bonds = BondsResult.load(open("%s.castep" % self.calc1_path).read()).next()
+
+    bonds = BondsResult.from_geometry(c.ions)
+
+    self.assertEqual(set(frozenset(bond[:2]) for bond in bonds.bonds),
+                     set(frozenset(bond[:2]) for bond in castep_bonds.bonds))
+    self.assertTrue(numpy.isnan(bonds.population).all())
+
+    add_bonds(c.ions, bonds)
+    self.assertEqual(len(c.ions.C1.bonds), 4)
+
+  def test_geometric_periodic(self):
+    """
+      Bonds across the cell boundary and cutoff overrides.
+    """
+    ions = AtomsView.from_arrays(['Si', 'O'], [1, 1], [[0.2, 0, 0], [1.8, 0, 0]], lattice=numpy.eye(3) * 3.2)
+
+    bonds = BondsResult.from_geometry(ions)
+    self.assertEqual(len(bonds), 2)
+    self.assertTrue(numpy.allclose(bonds.length, 1.6))
+    self.assertEqual(len(bonds.ring(0)), 2)
+
+    # Each bond keeps its own image of O, one either side of Si
+    add_bonds(ions, bonds)
+    mirrors = sorted(p[0] for _, p, _, _ in ions.Si1.bonds)
+    self.assertTrue(numpy.allclose(mirrors, [-1.4, 1.8]))
+
+    for ion in ions:
+      for ion2, p, pop, r in ion.bonds:
+        self.assertAlmostEqual(ion.dist(p), r)
+
+    bonds = BondsResult.from_geometry(ions, cutoffs={('O', 'Si'): 1.0})
+    self.assertEqual(len(bonds), 0)
+
+    self.assertRaises(KeyError, bond_cutoffs, ['Xx'])
+
+  def test_periodic_angle(self):
+    """
+      Bond angles use the bonded image of each atom, here O1's across the cell boundary.
+    """
+    ions = AtomsView.from_arrays(['Si', 'O', 'O'], [1, 1, 2], [[0.2, 0, 0], [2.6, 0.5, 0], [0.2, 1.6, 0]],
+                                 lattice=numpy.diag([4.0, 10.0, 10.0]))
+
+    add_bonds(ions, BondsResult.from_geometry(ions))
+
+    expected = math.acos(0.5 / math.sqrt(1.6**2 + 0.5**2))
+    self.assertAlmostEqual(bond_angle(ions.O1, ions.O2, ions), expected)
+    self.assertAlmostEqual(bond_angle(ions.O2, ions.O1, ions), expected)
+
 if __name__ == "__main__":
   unittest.main()
 
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from castepy import cache
+from castepy.cache import ResultCache
+from castepy.output.energy import SCFResult
+
+class TestResultCache(unittest.TestCase):
+  castep_path = "test_data/ethanol/ethanol.castep"
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, "ethanol.castep")
+    shutil.copy(self.castep_path, self.path)
+
+    self.cache = ResultCache(os.path.join(self.dir, "cache.sqlite"))
+    self.calls = 0
+
+  def tearDown(self):
+    self.cache.close()
+    shutil.rmtree(self.dir)
+
+  def load_scf(self):
+    self.calls += 1
+    return list(SCFResult.load(open(self.path).read()))
+
+  def test_hit(self):
+    scf = self.cache.get(self.path, "scf", self.load_scf)
+    cached = self.cache.get(self.path, "scf", self.load_scf)
+
+    self.assertEqual(self.calls, 1)
+    self.assertEqual(str(scf[0]), str(cached[0]))
+
+    # Reopening the database finds the entry too
+    self.cache.close()
+    self.cache.get(self.path, "scf", self.load_scf)
+    self.assertEqual(self.calls, 1)
+
+  def test_invalidate(self):
+    self.cache.get(self.path, "scf", self.load_scf)
+
+    # A hit hashes the file
+    self.cache.get(self.path, "scf", self.load_scf)
+
+    # Same contents, new mtime: found by hash
+    st = os.stat(self.path)
+    os.utime(self.path, (st.st_atime, st.st_mtime + 10))
+    self.cache.get(self.path, "scf", self.load_scf)
+    self.assertEqual(self.calls, 1)
+
+    with open(self.path, "a") as f:
+      f.write("\n")
+
+    self.cache.get(self.path, "scf", self.load_scf)
+    self.assertEqual(self.calls, 2)
+
+  def test_evict(self):
+    for n in range(5):
+      self.cache.get(self.path, "array%d" % n, lambda: numpy.random.random(1000))
+
+    entry_size = self.cache.size() / 5
+
+    self.cache.evict(entry_size * 2)
+    self.assertTrue(self.cache.size() <= entry_size * 2)
+
+    # Most recently used are kept
+    self.cache.get(self.path, "array4", self.load_scf)
+    self.assertEqual(self.calls, 0)
+
+  def test_shared(self):
+    # A hit in one connection doesn't keep another waiting to write
+    self.cache.get(self.path, "scf", self.load_scf)
+
+    other = ResultCache(self.cache.path, timeout=0.5)
+    self.cache.get(self.path, "scf", self.load_scf)
+
+    other.put(self.path, "other", [1, 2, 3])
+    self.assertEqual(self.cache.get(self.path, "other", self.load_scf), [1, 2, 3])
+    self.assertEqual(self.calls, 1)
+    other.close()
+
+  def test_hash_once(self):
+    hashed = []
+    file_hash = cache.file_hash
+
+    def counting_hash(path):
+      hashed.append(path)
+      return file_hash(path)
+
+    cache.file_hash = counting_hash
+
+    try:
+      # Storing doesn't read the file
+      for product in ["a", "b", "c"]:
+        self.cache.put(self.path, product, product)
+
+      self.assertEqual(len(hashed), 0)
+
+      for product in ["a", "b", "c"]:
+        self.assertEqual(self.cache.get(self.path, product, self.load_scf), product)
+    finally:
+      cache.file_hash = file_hash
+
+    self.assertEqual(len(hashed), 1)
+    self.assertEqual(self.calls, 0)
+
+  def test_running_size(self):
+    for n in range(3):
+      self.cache.put(self.path, "array%d" % n, numpy.random.random(1000))
+
+    # Replacing an entry counts only the new one
+    self.cache.put(self.path, "array0", numpy.random.random(10))
+    self.assertEqual(self.cache._total, self.cache.size())
+
+    self.cache.max_size = self.cache.size() - 1
+    self.cache.put(self.path, "array3", numpy.random.random(10))
+    self.assertTrue(self.cache.size() <= self.cache.max_size)
+    self.assertEqual(self.cache._total, self.cache.size())
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from castepy.calc import CastepCalc, load_calcs
+
+class TestCalc(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    shutil.copytree("test_data/ethanol", os.path.join(self.dir, "ethanol"))
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_load_calcs(self):
+    serial, errors = load_calcs(self.dir, workers=1)
+    self.assertEqual(errors, [])
+
+    calcs, errors = load_calcs(self.dir, workers=2, chunksize=1)
+    self.assertEqual(errors, [])
+
+    self.assertEqual([(calc.dir, calc.name) for calc in calcs],
+                     [(calc.dir, calc.name) for calc in serial])
+    self.assertEqual([calc.params.task for calc in calcs], [['magres'], ['geometryoptimisation']])
+    self.assertEqual([len(calc.cell.ions) for calc in calcs], [9, 9])
+
+  def test_missing_file(self):
+    calc = CastepCalc(os.path.join(self.dir, "ethanol"), "ethanol")
+
+    self.assertRaises(CastepCalc.MissingFile, getattr, calc, 'bands')
+    self.assertFalse(hasattr(calc, 'magres_file'))
+
+    calc.load(["cell", "bands"])
+    self.assertEqual(len(calc.cell.ions), 9)
+
+  def test_lazy(self):
+    calc = CastepCalc(os.path.join(self.dir, "ethanol"), "ethanol")
+    self.assertEqual(calc._cache, {})
+
+    energy = calc.energy
+    self.assertEqual(sorted(calc._cache), ['energy'])
+    self.assertTrue(calc.energy is energy)
+
+    # Only the bonds sections are read, through the index
+    calc.bonds
+    self.assertEqual(sorted(calc._cache), ['bonds', 'castep_index', 'energy'])
+
+    calc.load(["params"])
+    self.assertFalse('cell' in calc._cache)
+
+  def test_modified(self):
+    calc = CastepCalc(os.path.join(self.dir, "ethanol"), "ethanol")
+    path = calc.path('castep')
+
+    energy = calc.energy
+    index = calc.castep_index
+
+    # Touched: loaded again
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + 10))
+
+    self.assertFalse(calc.energy is energy)
+    self.assertEqual(calc.energy, energy)
+    self.assertFalse(calc.castep_index is index)
+
+    # Rewritten: the new contents are parsed
+    text = open(path).read().replace("Final energy =  -848.4756960926", "Final energy =  -900.0000000000")
+
+    with open(path, "w") as f:
+      f.write(text)
+    os.utime(path, (st.st_atime, st.st_mtime + 20))
+
+    self.assertAlmostEqual(calc.energy[0], -900.0)
+
+    # Removed
+    os.remove(path)
+    self.assertRaises(CastepCalc.MissingFile, getattr, calc, 'energy')
+    self.assertFalse('energy' in calc._cache)
+
+  def test_cell_modified(self):
+    calc = CastepCalc(os.path.join(self.dir, "ethanol"), "ethanol")
+    path = calc.path('cell')
+
+    self.assertEqual(len(calc.cell.ions), 9)
+
+    lines = open(path).read().split("\n")
+    st = os.stat(path)
+
+    with open(path, "w") as f:
+      f.write("\n".join(line for line in lines if not line.startswith("O ")))
+    os.utime(path, (st.st_atime, st.st_mtime + 10))
+
+    self.assertEqual(len(calc.cell.ions), 8)
+
+if __name__ == "__main__":
+  unittest.main()
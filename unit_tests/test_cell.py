@@ -1,4 +1,5 @@
 import unittest
+import mmap
 import numpy
 import castepy.input.cell as cell
 
@@ -34,6 +35,100 @@ class TestCell(unittest.TestCase):
     
     self.assertEqual(len(c.ions.within(C1, 1.5)), 4)
 
+  def test_file_sources(self):
+    """
+      Parsing from a string, an open file and an mmap should agree.
+    """
+    c1 = cell.Cell(open(self.cell1_path).read())
+    c2 = cell.Cell(open(self.cell1_path))
+
+    with open(self.cell1_path) as f:
+      c3 = cell.Cell(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    for c in [c2, c3]:
+      self.assertEqual(c1.blocks, c.blocks)
+      self.assertEqual(c1.otherdict, c.otherdict)
+
+  def test_tokenize(self):
+    tokens = list(cell.tokenize_cell("%block Foo\n 1 2\n\n%endblock foo\nfix_all_cell : true\nsymmetry_generate\n"))
+
+    self.assertEqual(tokens, [('block', 'FOO', ['1 2']),
+                              ('keyword', 'fix_all_cell', 'true'),
+                              ('keyword', 'symmetry_generate', None)])
+
+  def test_positions_frac(self):
+    """
+      Fractional positions are converted to cartesian, with per-species indices and labels.
+    """
+    c = cell.Cell("%block LATTICE_CART\n"
+                  "4 0 0\n1 5 0\n0 1 6\n"
+                  "%endblock LATTICE_CART\n"
+                  "%block POSITIONS_FRAC\n"
+                  "H 0.5 0.0 0.0\n"
+                  "C:Ca 0.0 0.5 0.5\n"
+                  "H:Hb 0.0 0.0 0.5\n"
+                  "%endblock POSITIONS_FRAC\n")
+
+    self.assertEqual(c.ions_type, 'POSITIONS_ABS')
+    self.assertEqual([(a.species, a.index, a.label) for a in c.ions],
+                     [('H', 1, 'H'), ('C', 1, 'Ca'), ('H', 2, 'Hb')])
+
+    self.assertTrue(numpy.allclose(c.ions.H2.position, [0.0, 0.5, 3.0]))
+    self.assertTrue(numpy.allclose(c.ions.C1.position, [0.5, 3.0, 3.0]))
+
+  def test_find_unique_ions(self):
+    """
+      Duplicates, including those related by a lattice translation, are dropped.
+    """
+    c = cell.Cell("%block LATTICE_CART\n"
+                  "4 0 0\n0 4 0\n0 0 4\n"
+                  "%endblock LATTICE_CART\n"
+                  "%block POSITIONS_FRAC\n"
+                  "Si 0.0 0.0 0.0\n"
+                  "O 0.5 0.5 0.5\n"
+                  "Si 1.0 0.0 1.0\n"
+                  "O 0.5 0.5 0.501\n"
+                  "O 0.25 0.5 0.5\n"
+                  "%endblock POSITIONS_FRAC\n")
+
+    unique, duplicates = c.find_unique_ions()
+
+    self.assertEqual([str(a) for a in unique], ["Si1", "O1", "O3"])
+    self.assertEqual([(str(a), str(b)) for a, b, d in duplicates], [("Si1", "Si2"), ("O1", "O2")])
+
+    # The ions' own neighbour index isn't left binned at tol
+    self.assertEqual(c.ions.neighbour_index(3.0).cutoff, 3.0)
+
+  def test_supercell(self):
+    c = cell.Cell(open(self.cell1_path).read())
+
+    s = c.supercell(2, 1, 3)
+
+    self.assertTrue(numpy.allclose(s.lattice, numpy.diag([12.0, 6.0, 18.0])))
+    self.assertEqual(len(s.ions), 6 * 9)
+    self.assertEqual(len(s.ions.species('H')), 36)
+    self.assertEqual(sorted(a.index for a in s.ions.species('C')), range(1, 13))
+
+    # The first ion is followed by its images
+    self.assertTrue(numpy.allclose(s.ions.H2.position - s.ions.H1.position, [0.0, 0.0, 6.0]))
+    self.assertTrue(numpy.allclose(s.ions.H7.position, c.ions.H2.position))
+
+    s2 = cell.Cell(str(s))
+    self.assertEqual(len(s2.ions), len(s.ions))
+
+  def test_supercell_matrix(self):
+    c = cell.Cell(open(self.cell1_path).read())
+    c.ions.H1.label = "Hx"
+
+    s = c.supercell([[1, 1, 0], [-1, 1, 0], [0, 0, 1]])
+
+    self.assertTrue(numpy.allclose(s.lattice, [[6.0, 6.0, 0.0], [-6.0, 6.0, 0.0], [0.0, 0.0, 6.0]]))
+    self.assertEqual(len(s.ions), 2 * 9)
+    self.assertEqual([a.label for a in s.ions.species('H')][:3], ["Hx", "Hx", "H"])
+
+    with self.assertRaises(ValueError):
+      c.supercell([[1, 1, 0], [1, 1, 0], [0, 0, 1]])
+
   def test_lattice_abc(self):
     c = cell.Cell(open(self.cell2_path).read())
 
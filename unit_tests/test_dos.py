@@ -0,0 +1,85 @@
+import unittest
+import numpy
+
+from castepy import constants
+from castepy.output.bands import BandsResult
+from castepy.output.dos import dos, band_gap, band_edges, fermi_analysis, kpath
+
+class TestDos(unittest.TestCase):
+  si_path = "test_data/si.bands"
+  fe_path = "test_data/fe.bands"
+
+  def setUp(self):
+    self.si = BandsResult.load(self.si_path)
+    self.fe = BandsResult.load(self.fe_path)
+
+  def test_dos(self):
+    for shape in ['gaussian', 'lorentzian']:
+      energies, d = dos(self.si, width=0.05, shape=shape)
+      step = energies[1] - energies[0]
+
+      self.assertEqual(d.shape, (1, len(energies)))
+
+      # Two electrons per band, the lorentzian's tails run off the grid
+      self.assertAlmostEqual(d.sum() * step, 16.0, delta=0.01 if shape == 'gaussian' else 0.5)
+
+    # Same in chunks of one k-point
+    energies, d = dos(self.si, width=0.05)
+    _, chunked = dos(self.si, energies, width=0.05, chunk=1)
+    self.assertTrue(numpy.allclose(chunked, d))
+
+    energies, d = dos(self.fe, width=0.1)
+    self.assertAlmostEqual(d[0].sum() * (energies[1] - energies[0]), 5.0, places=2)
+
+  def test_band_gap(self):
+    gap = band_gap(self.si)
+
+    e = self.si.eigenvalues[0] * constants.hartree_ev
+    vbm = e[:,:4].max(axis=1)
+    cbm = e[:,4:].min(axis=1)
+
+    self.assertFalse(gap['metal'])
+    self.assertAlmostEqual(gap['gap'], cbm.min() - vbm.max())
+    self.assertAlmostEqual(gap['direct_gap'], (cbm - vbm).min())
+    self.assertEqual(gap['vbm_k'], numpy.argmax(vbm))
+    self.assertEqual(gap['cbm_k'], numpy.argmin(cbm))
+
+    self.assertTrue(numpy.array_equal(band_edges(self.si, chunk=2)[0][0], vbm))
+
+  def test_fermi_at_vbm(self):
+    # CASTEP's Fermi energy is rounded, so can be just below the valence band maximum
+    expected = band_gap(self.si)
+    vbm = numpy.nanmax(self.si.eigenvalues[0,:,:4])
+
+    for fermi_energy in [vbm, vbm - 4e-7]:
+      self.si.fermi_energy = [fermi_energy]
+
+      gap = band_gap(self.si)
+      self.assertFalse(gap['metal'])
+      self.assertAlmostEqual(gap['gap'], expected['gap'])
+      self.assertAlmostEqual(fermi_analysis(self.si)['num_electrons'][0], 8.0)
+
+    self.assertTrue(band_gap(self.si, tol=0.0)['metal'])
+
+  def test_fermi(self):
+    fermi = fermi_analysis(self.si)
+
+    self.assertAlmostEqual(fermi['num_electrons'][0], 8.0)
+    self.assertFalse(fermi['crossing'].any())
+
+    fermi = fermi_analysis(self.fe, chunk=1)
+    e = self.fe.eigenvalues * constants.hartree_ev
+    ef = numpy.array(self.fe.fermi_energy) * constants.hartree_ev
+
+    crossing = (e.min(axis=1) < ef[:,None]) & (e.max(axis=1) > ef[:,None])
+    self.assertTrue(numpy.array_equal(fermi['crossing'], crossing))
+    self.assertEqual(fermi['metal'], crossing.any())
+
+  def test_kpath(self):
+    path = kpath(self.si)
+
+    self.assertEqual(path[0], 0.0)
+    self.assertTrue((numpy.diff(path) > 0).all())
+
+if __name__ == "__main__":
+  unittest.main()
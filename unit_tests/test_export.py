@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+
+from castepy.export import calc_tables, export_calcs, read_tables, write_tables
+from castepy.calc import load_calcs
+
+class TestExport(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_round_trip(self):
+    path = os.path.join(self.dir, "test_data")
+    errors = export_calcs("test_data", path, workers=1)
+
+    # The one cell file that can't be parsed at all
+    self.assertEqual([(dir, name) for dir, name, _ in errors], [("test_data", "lattice_wrong_shape")])
+
+    calcs, _ = load_calcs("test_data", ["cell", "energy", "mulliken", "bonds", "magres"], workers=1)
+    tables = calc_tables(calcs)
+    read = read_tables(path, mmap_mode='r')
+
+    self.assertEqual(sorted(read), ['atoms', 'bonds', 'calcs'])
+    self.assertTrue(isinstance(read['atoms']['position'], numpy.memmap))
+
+    for table in tables:
+      self.assertEqual(sorted(read[table]), sorted(tables[table]))
+
+      for col, values in tables[table].items():
+        self.assertEqual(read[table][col].shape, values.shape)
+
+        if values.dtype.kind == 'f':
+          self.assertTrue(numpy.allclose(read[table][col], values, equal_nan=True))
+        else:
+          self.assertEqual(read[table][col].tolist(), values.tolist())
+
+    # A cell without ions still has its row
+    calcs_table = read['calcs']
+    self.assertEqual(calcs_table['name'].tolist(), ['lattice_not_implemented', 'ethanol', 'ethanol'])
+    self.assertEqual(calcs_table['num_atoms'].tolist(), [0, 9, 9])
+    self.assertEqual(len(read['atoms']['species']), 18)
+
+    atoms = read['atoms']
+    self.assertEqual(atoms['species'][atoms['calc'] == 1].tolist().count('H'), 6)
+    self.assertFalse(numpy.isnan(atoms['mulliken_charge'][atoms['calc'] == 1]).any())
+
+    bonds = read['bonds']
+    self.assertTrue((bonds['calc'] == 1).any())
+    self.assertTrue((bonds['length'] > 0.9).all())
+
+  def test_empty(self):
+    path = os.path.join(self.dir, "empty")
+
+    write_tables(path, calc_tables([]))
+    read = read_tables(path)
+
+    self.assertEqual(len(read['calcs']['name']), 0)
+    self.assertEqual(read['atoms']['position'].shape, (0, 3))
+    self.assertEqual(read['bonds']['population'].dtype, float)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from castepy.output.follow import CastepFollower, follow_calcs
+from castepy.output.finished import castep_finished, calc_states, directory_states
+from castepy.output.energy import SCFResult
+
+class TestFollower(unittest.TestCase):
+  castep_path = "test_data/ethanol/ethanol.castep"
+
+  def setUp(self):
+    self.castep_file = open(self.castep_path).read()
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, "ethanol.castep")
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_follow_growing(self):
+    """
+      Polling a file as it's written gives every event exactly once.
+    """
+    follower = CastepFollower(self.path)
+    events = []
+
+    with open(self.path, "w") as f:
+      for start in range(0, len(self.castep_file), 777):
+        f.write(self.castep_file[start:start+777])
+        f.flush()
+
+        events += follower.poll()
+
+        if start == 0:
+          self.assertFalse(castep_finished(self.dir, "ethanol"))
+
+    steps = [value for kind, value in events if kind == 'scf']
+    self.assertEqual(steps, SCFResult.load(self.castep_file).next().steps)
+
+    self.assertEqual([value for kind, value in events if kind == 'energy'], [(-848.4756960926, 'eV')])
+    self.assertEqual(events[-1], ('finished', None))
+    self.assertTrue(follower.finished)
+    self.assertTrue(castep_finished(self.dir, "ethanol"))
+
+    self.assertEqual(follower.poll(), [])
+
+  def test_follow_calcs(self):
+    shutil.copy(self.castep_path, self.path)
+
+    seen = []
+    events = list(follow_calcs([self.path], interval=0.0, callback=lambda *event: seen.append(event)))
+
+    self.assertEqual(seen, events)
+    self.assertEqual(events[-1], (self.path, 'finished', None))
+
+class TestCalcStates(unittest.TestCase):
+  castep_path = "test_data/ethanol/ethanol.castep"
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    sub_dir = os.path.join(self.dir, "sub")
+    os.mkdir(sub_dir)
+
+    for name in ["done", "broken", "fresh", "run", "run.1"]:
+      open(os.path.join(self.dir, name + ".cell"), "w").close()
+
+    shutil.copy(self.castep_path, os.path.join(self.dir, "done.castep"))
+
+    open(os.path.join(self.dir, "broken.castep"), "w").write(open(self.castep_path).read()[:10000])
+    open(os.path.join(self.dir, "broken.0001.err"), "w").write("Error")
+
+    open(os.path.join(self.dir, "fresh.0001.err"), "w").close()
+    open(os.path.join(self.dir, "run.1.0002.err"), "w").write("Error")
+
+    open(os.path.join(sub_dir, "nested.cell"), "w").close()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_calc_states(self):
+    expected = [(self.dir, "broken", "error"),
+                (self.dir, "done", "finished"),
+                (self.dir, "fresh", "fresh"),
+                (self.dir, "run", "fresh"),
+                (self.dir, "run.1", "error"),
+                (os.path.join(self.dir, "sub"), "nested", "fresh")]
+
+    self.assertEqual(calc_states(self.dir), expected)
+    self.assertEqual(calc_states(self.dir, workers=4), expected)
+
+    self.assertEqual(directory_states(self.dir, ["done"]), {"done": "finished"})
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+
+from castepy.output.sections import CastepIndex
+from castepy.output.forces import ForcesResult
+
+relax_steps = """
+ ******************* Constrained Forces *******************
+ *                                                        *
+ *               Cartesian components (eV/A)              *
+ * ------------------------------------------------------ *
+ *                         x            y            z    *
+ *                                                        *
+ * Si        1      0.00000(cons'd)  0.00000(cons'd)  0.00000(cons'd) *
+ * Si        2     -0.30000      0.40000      0.00000(cons'd) *
+ * O         1      0.10000     -0.20000      0.20000     *
+ *                                                        *
+ **********************************************************
+
+ ***************** Stress Tensor *****************
+ *                                               *
+ *          Cartesian components (GPa)           *
+ * --------------------------------------------- *
+ *             x             y             z     *
+ *                                               *
+ *  x     -1.500000      0.100000      0.000000  *
+ *  y      0.100000     -1.500000      0.000000  *
+ *  z      0.000000      0.000000     -3.000000  *
+ *                                               *
+ *  Pressure:    2.0000                          *
+ *                                               *
+ *************************************************
+
+ ******************* Constrained Forces *******************
+ *                                                        *
+ *               Cartesian components (eV/A)              *
+ * ------------------------------------------------------ *
+ *                         x            y            z    *
+ *                                                        *
+ * Si        1      0.00000(cons'd)  0.00000(cons'd)  0.00000(cons'd) *
+ * Si        2     -0.03000      0.04000      0.00000(cons'd) *
+ * O         1      0.01000      0.00000      0.00000     *
+ *                                                        *
+ **********************************************************
+
+ ***************** Stress Tensor *****************
+ *                                               *
+ *          Cartesian components (GPa)           *
+ * --------------------------------------------- *
+ *             x             y             z     *
+ *                                               *
+ *  x     -0.500000      0.000000      0.000000  *
+ *  y      0.000000     -0.500000      0.000000  *
+ *  z      0.000000      0.000000     -0.500000  *
+ *                                               *
+ *  Pressure:    0.5000                          *
+ *                                               *
+ *************************************************
+"""
+
+class TestForces(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def test_ethanol(self):
+    forces = ForcesResult.load("test_data/ethanol/ethanol.castep")
+
+    self.assertEqual(forces.forces.shape, (1, 9, 3))
+    self.assertEqual(forces.titles, ["Forces"])
+    self.assertEqual((forces.species[0], forces.indices[0]), ("H", 1))
+    self.assertTrue(numpy.allclose(forces.forces[0,0], [-0.15013, -0.02447, -0.10400]))
+    self.assertFalse(forces.constrained.any())
+    self.assertEqual(forces.stress.shape, (0, 3, 3))
+
+    norms = forces.norms()[0]
+    self.assertAlmostEqual(forces.max_force()[0], norms.max())
+    self.assertEqual(forces.worst(n=1)[0], numpy.argmax(norms))
+
+  def test_steps(self):
+    path = os.path.join(self.tmp, "relax.castep")
+
+    with open(path, "w") as f:
+      f.write(relax_steps)
+
+    forces = ForcesResult.load(CastepIndex(path))
+
+    self.assertEqual(forces.num_steps, 2)
+    self.assertEqual(forces.titles, ["Constrained Forces"] * 2)
+    self.assertEqual(forces.species.tolist(), ["Si", "Si", "O"])
+    self.assertEqual(forces.constrained[0].tolist(), [[True] * 3, [False, False, True], [False] * 3])
+
+    self.assertTrue(numpy.allclose(forces.max_force(), [0.5, 0.05]))
+    self.assertTrue(numpy.allclose(forces.rms_force(), numpy.sqrt([(0.25 + 0.09) / 3, (0.0025 + 0.0001) / 3])))
+    self.assertEqual(forces.worst(step=0).tolist(), [1, 2, 0])
+
+    self.assertTrue(numpy.allclose(forces.stress[0].diagonal(), [-1.5, -1.5, -3.0]))
+    self.assertAlmostEqual(forces.stress[0,0,1], 0.1)
+    self.assertTrue(numpy.allclose(forces.pressure, [2.0, 0.5]))
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+
+from castepy import constants
+from castepy.cache import ResultCache
+from castepy.output.geom import GeomFile
+from castepy.trajectory import Trajectory
+
+class TestGeomFile(unittest.TestCase):
+  geom_path = "test_data/relax.geom"
+  md_path = "test_data/water.md"
+
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def test_geom(self):
+    geom = GeomFile(self.geom_path)
+
+    self.assertEqual(len(geom), 2)
+
+    frames = list(geom)
+    self.assertEqual([frame.time for frame in frames], [0.0, 1.0])
+    self.assertAlmostEqual(frames[0].energy, -1.1397110682538914E+001 * constants.hartree_ev)
+    self.assertTrue(numpy.allclose(frames[1].lattice, numpy.eye(3) * 10.1 * constants.bohr_angstrom))
+    self.assertTrue(numpy.allclose(frames[0].positions[1], 2.5 * constants.bohr_angstrom))
+    self.assertAlmostEqual(frames[0].forces[0,0], 0.01 * constants.hartree_ev / constants.bohr_angstrom)
+    self.assertAlmostEqual(frames[0].stress[0,0], 1e-4 * constants.atomic_pressure_gpa)
+    self.assertEqual(frames[0].species.tolist(), ['Si', 'Si'])
+    self.assertTrue(frames[0].velocities is None)
+
+    self.assertTrue(numpy.allclose(geom.frame(-1).positions, frames[1].positions))
+
+  def test_md(self):
+    md = GeomFile(self.md_path)
+
+    self.assertEqual(len(md), 2)
+    frame = md.frame(1)
+
+    self.assertAlmostEqual(frame.time, 0.002, places=6)
+    self.assertAlmostEqual(frame.temperature, 600.0, places=2)
+    self.assertEqual(len(frame.energies), 3)
+    self.assertEqual(frame.indices.tolist(), [1, 1, 2])
+    self.assertAlmostEqual(frame.velocities[0,0], 1e-4 * constants.bohr_angstrom / constants.atomic_time_ps)
+
+    self.assertEqual([f.time for f in md.frames(step=2)], [md.frame(0).time])
+
+  def test_trajectory(self):
+    md = GeomFile(self.md_path)
+    out = os.path.join(self.tmp, "traj")
+
+    traj = md.trajectory(out=out)
+    self.assertTrue(isinstance(traj.positions, numpy.memmap))
+    self.assertTrue(numpy.allclose(traj.positions[1], md.frame(1).positions))
+
+    loaded = Trajectory.load(out)
+    self.assertEqual(loaded.species.tolist(), ['O', 'H', 'H'])
+    self.assertTrue(numpy.allclose(loaded.energies, [md.frame(0).energy, md.frame(1).energy]))
+    self.assertTrue(numpy.allclose(loaded.forces, traj.forces))
+
+  def test_growing(self):
+    """
+      Frames are only indexed once they're completely written, and cached offsets are used.
+    """
+    text = open(self.md_path).read()
+    path = os.path.join(self.tmp, "run.md")
+    cut = text.index("<-- V", text.index("8.2682746672E+001"))
+
+    with open(path, "w") as f:
+      f.write(text[:cut])
+
+    cache = ResultCache(os.path.join(self.tmp, "cache.db"))
+
+    md = GeomFile(path, cache)
+    self.assertEqual(len(md), 1)
+
+    with open(path, "a") as f:
+      f.write(text[cut:])
+
+    md.update()
+    self.assertEqual(len(md), 2)
+    self.assertAlmostEqual(md.frame(1).temperature, 600.0, places=2)
+
+    self.assertEqual(GeomFile(path, cache).offsets, md.offsets)
+    cache.close()
+
+    # Cut within the first time line
+    cut = text.index("4.1341373336E+001") + 5
+
+    with open(path, "w") as f:
+      f.write(text[:cut])
+
+    md = GeomFile(path)
+    self.assertEqual(len(md), 0)
+
+    with open(path, "a") as f:
+      f.write(text[cut:])
+
+    md.update()
+    self.assertEqual(len(md), 2)
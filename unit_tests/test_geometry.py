@@ -0,0 +1,89 @@
+import math
+import unittest
+import numpy
+
+import castepy.input.cell as cell
+from castepy.atoms import AtomsView
+from castepy.output.bonds import BondsResult, add_bonds, bond_angle
+from castepy import geometry
+
+class TestGeometry(unittest.TestCase):
+  calc_path = "test_data/ethanol/ethanol"
+
+  def setUp(self):
+    self.cell = cell.Cell(open("%s.cell" % self.calc_path).read())
+    self.castep_file = open("%s.castep" % self.calc_path).read()
+
+  def names(self, rows):
+    ions = self.cell.ions
+    return ["%s%d" % (ions.species_array[r], ions.indices_array[r]) for r in rows]
+
+  def test_ethanol_angles(self):
+    """
+      Every angle at once agrees with bond_angle, for population and geometric bonds.
+    """
+    ions = self.cell.ions
+    add_bonds(ions, self.castep_file)
+
+    bonds = BondsResult.load(self.castep_file).next()
+    triplets, theta = geometry.angles(bonds, ions)
+
+    self.assertEqual(len(theta), 13)
+
+    angles = dict((tuple(self.names(t)), a) for t, a in zip(triplets, theta))
+    key = [k for k in angles if k[1] == 'C2' and set([k[0], k[2]]) == set(['C1', 'O1'])][0]
+    self.assertAlmostEqual(angles[key], bond_angle(ions.C1, ions.O1, ions))
+
+    _, geometric = geometry.angles(BondsResult.from_geometry(ions), ions)
+    self.assertTrue(numpy.allclose(sorted(geometric), sorted(theta)))
+
+  def test_ethanol_dihedrals(self):
+    ions = self.cell.ions
+    bonds = BondsResult.load(self.castep_file).next()
+
+    quadruplets, phi = geometry.dihedrals(bonds, ions)
+
+    self.assertEqual(len(phi), 12)
+    dihedrals = dict((tuple(self.names(q)), p) for q, p in zip(quadruplets, phi))
+
+    # Staggered: every H-C-C-H near +-60 or 180 degrees
+    for names, p in dihedrals.items():
+      d = abs(math.degrees(p))
+      self.assertTrue(min(abs(d - 60), abs(d - 180)) < 10, names)
+
+  def test_dihedral_sign(self):
+    phi = 0.7
+    positions = [[1, 0, 0], [0, 0, 0], [0, 0, 1.5], [math.cos(phi), math.sin(phi), 1.5]]
+    ions = AtomsView.from_arrays(['C'] * 4, [1, 2, 3, 4], positions)
+
+    bonds = BondsResult([(('C',1), ('C',2), 1.0, 1.0), (('C',3), ('C',2), 1.0, 1.5),
+                         (('C',3), ('C',4), 1.0, 1.0)])
+
+    quadruplets, dihedrals = geometry.dihedrals(bonds, ions)
+    self.assertEqual(len(dihedrals), 1)
+
+    # The same either way round
+    self.assertEqual(set([quadruplets[0][0], quadruplets[0][3]]), set([0, 3]))
+    self.assertAlmostEqual(dihedrals[0], phi)
+
+    triplets, angles = geometry.angles(bonds, ions)
+    self.assertTrue(numpy.allclose(angles, math.pi / 2))
+
+  def test_periodic_frames(self):
+    """
+      A bond to each of two images of the same atom, over several snapshots.
+    """
+    lattice = numpy.eye(3) * 3.2
+    ions = AtomsView.from_arrays(['Si', 'O'], [1, 1], [[0.2, 0, 0], [1.8, 0, 0]], lattice=lattice)
+    bonds = BondsResult.from_geometry(ions)
+
+    triplets, angles = geometry.angles(bonds, ions)
+    self.assertTrue(numpy.allclose(angles, math.pi))
+
+    frames = ions.positions[None] + numpy.array([[[0, 0, 0], [0, 0.1, 0]]] * 5)
+    rows = geometry.atom_rows(bonds, ions)
+    triplets, angles = geometry.angles(bonds, frames, lattice, rows)
+
+    self.assertEqual(angles.shape, (5, 2))
+    self.assertTrue((angles < math.pi - 0.05).all())
+    self.assertEqual(geometry.bond_vectors(bonds, frames, lattice, rows).shape, (5, 2, 3))
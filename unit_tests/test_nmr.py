@@ -0,0 +1,144 @@
+import unittest
+import numpy
+
+import castepy.input.cell as cell
+from castepy.atoms import AtomsView
+from castepy.output.nmr import MagresResult
+from magres.format import MagresFile
+
+def magres_file(data_dict):
+  magres_file = MagresFile()
+  magres_file.data_dict = data_dict
+  return magres_file
+
+def read_magres(path):
+  """
+    The data_dict of a .magres file of lattice, atom, ms and efg lines.
+  """
+  atoms = {'atom': []}
+  magres = {'ms': [], 'efg': []}
+
+  for line in open(path):
+    fields = line.split()
+
+    if not fields:
+      continue
+    elif fields[0] == 'lattice':
+      atoms['lattice'] = [map(float, fields[1:10])]
+    elif fields[0] == 'atom':
+      atoms['atom'].append({'species': fields[1], 'label': fields[1], 'index': int(fields[2]),
+                            'position': map(float, fields[3:6])})
+    elif fields[0] in magres:
+      value = 'sigma' if fields[0] == 'ms' else 'V'
+      magres[fields[0]].append({'atom': {'label': fields[1], 'index': int(fields[2])},
+                                value: map(float, fields[3:12])})
+
+  return {'atoms': atoms, 'magres': magres}
+
+def site(label, index):
+  return {'label': label, 'index': index}
+
+class TestMagresResult(unittest.TestCase):
+  calc_path = "test_data/ethanol/ethanol"
+
+  def setUp(self):
+    ms = numpy.diag([10.0, 20.0, 30.0])
+
+    self.data_dict = {'atoms': {'lattice': [numpy.identity(3).ravel() * 10.0],
+                                'atom': [{'species': 'H', 'label': 'H', 'index': 1, 'position': [0.5, 0.0, 0.0]},
+                                         {'species': 'H', 'label': 'H', 'index': 2, 'position': [9.5, 0.0, 0.0]},
+                                         {'species': 'C', 'label': 'C', 'index': 1, 'position': [5.0, 5.0, 5.0]}]},
+                      'magres': {'units': [['ms', 'ppm'], ['isc', '10^19.T^2.J^-1']],
+                                 'ms': [{'atom': site('H', 1), 'sigma': ms.tolist()},
+                                        {'atom': site('C', 1), 'sigma': (ms * 2).tolist()}],
+                                 'isc': [{'atom1': site('H', 1), 'atom2': site('H', 2), 'K': numpy.identity(3).tolist()},
+                                         {'atom1': site('H', 1), 'atom2': site('C', 1), 'K': (numpy.identity(3) * 2).tolist()},
+                                         {'atom1': site('H', 1), 'atom2': site('O', 1), 'K': (numpy.identity(3) * 3).tolist()}]}}
+
+  def test_arrays(self):
+    magres = MagresResult(magres_file(self.data_dict))
+
+    # O1 is only in the magres block, so has no position
+    self.assertEqual(magres.sites, [('H', 1), ('H', 2), ('C', 1), ('O', 1)])
+    self.assertEqual(magres.species_array.tolist(), ['H', 'H', 'C', 'O'])
+    self.assertEqual(magres.row('C', 1), 2)
+    self.assertTrue(numpy.isnan(magres.positions[3]).all())
+    self.assertTrue(numpy.allclose(magres.lattice, numpy.identity(3) * 10.0))
+
+    self.assertEqual(sorted(magres.tensor_data), ['isc', 'ms'])
+
+    rows, stack = magres.tensor_data['ms']
+    self.assertEqual(rows.tolist(), [0, 2])
+    self.assertEqual(stack.shape, (2, 3, 3))
+    self.assertTrue(numpy.allclose(magres.properties('ms')['iso'], [20.0, 40.0]))
+
+    rows, stack = magres.tensor_data['isc']
+    self.assertEqual(rows.tolist(), [[0, 1], [0, 2], [0, 3]])
+    self.assertTrue(numpy.allclose(magres.properties('isc')['iso'], [1.0, 2.0, 3.0]))
+
+  def test_select(self):
+    magres = MagresResult(magres_file(self.data_dict))
+
+    self.assertEqual(magres.select('ms').tolist(), [True, True])
+    self.assertEqual(magres.select('ms', 'C').tolist(), [False, True])
+
+    # Minimum image across the cell boundary
+    distances = magres.distances('isc')
+    self.assertAlmostEqual(distances[0], 1.0)
+    self.assertAlmostEqual(distances[1], numpy.sqrt(4.5**2 + 5.0**2 + 5.0**2))
+    self.assertTrue(numpy.isnan(distances[2]))
+
+    self.assertEqual(magres.select('isc', 'C').tolist(), [False, True, False])
+    self.assertEqual(magres.select('isc', ('H', 'H')).tolist(), [True, False, False])
+    self.assertEqual(magres.select('isc', ('C', 'H')).tolist(), [False, True, False])
+    self.assertEqual(magres.select('isc', max_dr=2.0).tolist(), [True, False, False])
+    self.assertEqual(magres.select('isc', 'H', max_dr=10.0).tolist(), [True, True, False])
+
+  def test_sites(self):
+    magres = MagresResult(magres_file(self.data_dict))
+
+    ions = AtomsView.from_arrays(['H', 'H', 'C', 'N'], [1, 2, 1, 1], numpy.zeros((4, 3)))
+    magres.annotate(ions)
+
+    self.assertTrue(ions.magres is magres)
+    self.assertEqual(ions.magres_rows.tolist(), [0, 1, 2, -1])
+    self.assertFalse(hasattr(ions.N1, 'magres'))
+
+    h1, h2, c1 = ions.H1.magres, ions.H2.magres, ions.C1.magres
+
+    self.assertTrue('ms' in h1)
+    self.assertFalse('ms' in h2)
+    self.assertFalse('efg' in h1)
+    self.assertTrue(numpy.allclose(c1['ms'], numpy.diag([20.0, 40.0, 60.0])))
+    self.assertAlmostEqual(c1['ms_prop']['iso'], 40.0)
+
+    # A view into the result's stack
+    self.assertTrue(numpy.may_share_memory(h1['ms'], magres.tensor_data['ms'][1]))
+
+    self.assertEqual(sorted(h1['isc']), [('C', 1), ('H', 2), ('O', 1)])
+    self.assertTrue(numpy.allclose(h1['isc'][('C', 1)], numpy.identity(3) * 2))
+    self.assertAlmostEqual(h1['isc_prop'][('O', 1)]['iso'], 3.0)
+    self.assertEqual(h2['isc'], {})
+
+  def test_ethanol(self):
+    data_dict = read_magres("test_data/ethanol.magres")
+    magres = MagresResult(magres_file(data_dict))
+
+    self.assertEqual(len(magres.sites), 9)
+    self.assertEqual(magres.select('ms', 'H').sum(), 6)
+    self.assertAlmostEqual(magres.properties('ms')['iso'][magres.row('C', 1)], (149.9382 + 160.5165 + 157.705) / 3.0)
+    self.assertAlmostEqual(magres.properties('efg')['iso'][magres.row('O', 1)], 0.0, places=3)
+
+    c = cell.Cell(open("%s.cell" % self.calc_path).read())
+    magres.annotate(c.ions)
+
+    self.assertEqual(c.ions.magres_rows.tolist(), range(9))
+    self.assertTrue(numpy.allclose(magres.positions, c.ions.positions, atol=1e-5))
+
+    for ion in c.ions:
+      self.assertTrue(numpy.allclose(ion.magres['ms'], magres.tensor_data['ms'][1][magres.row(ion.species, ion.index)]))
+
+    self.assertAlmostEqual(c.ions.O1.magres['ms_prop']['iso'], (245.7602 + 288.4162 + 266.9611) / 3.0)
+
+if __name__ == "__main__":
+  unittest.main()
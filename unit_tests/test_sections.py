@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from castepy.output.sections import CastepIndex, tail_search
+from castepy.output.energy import TotalEnergyResult, SCFResult
+from castepy.output.bonds import BondsResult
+from castepy.output.mulliken import MullikenResult
+
+class TestCastepIndex(unittest.TestCase):
+  castep_path = "test_data/ethanol/ethanol.castep"
+
+  def setUp(self):
+    self.castep_file = open(self.castep_path).read()
+
+  def test_sections(self):
+    """
+      Parsing the indexed sections gives the same results as the whole file.
+    """
+    index = CastepIndex(self.castep_path)
+
+    self.assertEqual(index.count('energy'), 1)
+    self.assertEqual(index.count('finished'), 1)
+    self.assertEqual(index.count('forces'), 1)
+
+    self.assertEqual(map(str, SCFResult.load(index.text('scf'))),
+                     map(str, SCFResult.load(self.castep_file)))
+
+    self.assertEqual(MullikenResult.load(index.text('mulliken'))[0].charges,
+                     MullikenResult.load(self.castep_file)[0].charges)
+
+    bonds = BondsResult.load(index.text('bonds', -1)).next()
+    self.assertEqual(bonds.bonds, BondsResult.load(self.castep_file).next().bonds)
+
+    self.assertTrue(index.text('forces').rstrip().endswith("*"))
+    self.assertEqual(index.text('bfgs'), "")
+    self.assertEqual(index.text('stress', 3), "")
+
+  def test_last_energy(self):
+    energies = list(TotalEnergyResult.load(self.castep_file))
+
+    self.assertEqual(TotalEnergyResult.load_last(self.castep_path), energies[-1])
+    self.assertEqual(tail_search(self.castep_path, "^ *Final energy", chunk=64).start() > 0, True)
+    self.assertEqual(tail_search(self.castep_path, "no such line", chunk=4096), None)
+
+  def test_update(self):
+    """
+      Indexing a file as it's written gives the same sections as indexing it whole.
+    """
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+      path = os.path.join(tmp_dir, "ethanol.castep")
+      index = None
+
+      with open(path, "w") as f:
+        for start in range(0, len(self.castep_file), 5000):
+          f.write(self.castep_file[start:start+5000])
+          f.flush()
+
+          if index is None:
+            index = CastepIndex(path)
+          else:
+            index.update()
+
+      self.assertEqual(index.sections, CastepIndex(self.castep_path).sections)
+    finally:
+      shutil.rmtree(tmp_dir)
+
+if __name__ == "__main__":
+  unittest.main()
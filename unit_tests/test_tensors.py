@@ -0,0 +1,67 @@
+import unittest
+import numpy
+
+from castepy.output.tensors import tensor_properties, euler_angles, site_properties
+
+def rotation(alpha, beta, gamma):
+  def Rz(a):
+    return numpy.array([[numpy.cos(a), -numpy.sin(a), 0], [numpy.sin(a), numpy.cos(a), 0], [0, 0, 1]])
+
+  def Ry(a):
+    return numpy.array([[numpy.cos(a), 0, numpy.sin(a)], [0, 1, 0], [-numpy.sin(a), 0, numpy.cos(a)]])
+
+  return numpy.dot(Rz(alpha), numpy.dot(Ry(beta), Rz(gamma)))
+
+class TestTensors(unittest.TestCase):
+  def test_haeberlen(self):
+    """
+      Rotated diagonal tensors give back their principal values and orientation.
+    """
+    numpy.random.seed(1)
+
+    angles = numpy.random.uniform([-numpy.pi, 0, -numpy.pi], [numpy.pi, numpy.pi, numpy.pi], (50, 3))
+    R = numpy.array([rotation(*a) for a in angles])
+
+    # xx, yy, zz in Haeberlen order about iso = 11
+    principal = numpy.array([9.0, 10.0, 14.0])
+    tensors = numpy.einsum('nij,j,nkj->nik', R, principal, R)
+
+    props = tensor_properties(tensors)
+
+    iso = principal.mean()
+    self.assertTrue(numpy.allclose(props['iso'], iso))
+    self.assertTrue(numpy.allclose(props['evals'], principal))
+    self.assertTrue(numpy.allclose(props['red_aniso'], principal[2] - iso))
+    self.assertTrue(numpy.allclose(props['aniso'], principal[2] - (principal[0] + principal[1]) / 2.0))
+    self.assertTrue(numpy.allclose(props['asym'], (principal[1] - principal[0]) / (principal[2] - iso)))
+    self.assertTrue(numpy.allclose(props['span'], 5.0))
+    self.assertTrue(numpy.allclose(props['skew'], 3.0 * (10.0 - iso) / 5.0))
+
+    # Principal axes match up to sign
+    overlap = numpy.abs(numpy.einsum('nij,nij->nj', props['evecs'], R))
+    self.assertTrue(numpy.allclose(overlap, 1.0))
+
+    self.assertEqual(set(site_properties(props, 3)), set(props))
+
+  def test_euler(self):
+    numpy.random.seed(2)
+
+    angles = numpy.random.uniform([-numpy.pi, 0, -numpy.pi], [numpy.pi, numpy.pi, numpy.pi], (100, 3))
+    R = numpy.array([rotation(*a) for a in angles])
+
+    self.assertTrue(numpy.allclose(euler_angles(R), angles))
+
+    # Gimbal lock still gives the same rotation
+    for beta in [0.0, numpy.pi]:
+      r = rotation(0.3, beta, 0.4)
+      self.assertTrue(numpy.allclose(rotation(*euler_angles(r)[0]), r))
+
+  def test_spherical(self):
+    props = tensor_properties(numpy.identity(3) * 5.0)
+
+    self.assertEqual(props['iso'][0], 5.0)
+    self.assertEqual(props['asym'][0], 0.0)
+    self.assertEqual(props['skew'][0], 0.0)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+
+import castepy.input.cell as cell
+from castepy.atoms import AtomsView
+from castepy.trajectory import Trajectory
+
+relax_steps = """
+        Real Lattice(A)                      Reciprocal Lattice(1/A)
+   4.0000000   0.0000000   0.0000000        1.5707963   0.0000000   0.0000000
+   0.0000000   4.0000000   0.0000000        0.0000000   1.5707963   0.0000000
+   0.0000000   0.0000000   4.0000000        0.0000000   0.0000000   1.5707963
+
+            xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+            x  Element    Atom        Fractional coordinates of atoms  x
+            x            Number           u          v          w      x
+            x----------------------------------------------------------x
+            x  O            1         0.000000   0.000000   0.000000   x
+            x  H            1         0.250000   0.000000   0.000000   x
+            xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+
+Final energy, E             =  -100.5 eV
+
+ ******************* Forces *******************
+ *                                            *
+ *        Cartesian components (eV/A)         *
+ * ------------------------------------------ *
+ *                  x            y          z *
+ *                                            *
+ * O         1      0.10000      0.00000      0.00000 *
+ * H         1     -0.10000      0.00000      0.00000 *
+ *                                            *
+ **********************************************
+
+        Real Lattice(A)                      Reciprocal Lattice(1/A)
+   5.0000000   0.0000000   0.0000000        1.2566371   0.0000000   0.0000000
+   0.0000000   5.0000000   0.0000000        0.0000000   1.2566371   0.0000000
+   0.0000000   0.0000000   5.0000000        0.0000000   0.0000000   1.2566371
+
+            xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+            x  Element    Atom        Fractional coordinates of atoms  x
+            x            Number           u          v          w      x
+            x----------------------------------------------------------x
+            x  O            1         0.000000   0.000000   0.000000   x
+            x  H            1         0.200000   0.000000   0.000000   x
+            xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+"""
+
+class TestTrajectory(unittest.TestCase):
+  calc_path = "test_data/ethanol/ethanol"
+
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def test_ethanol(self):
+    traj = Trajectory.from_castep("%s.castep" % self.calc_path)
+    c = cell.Cell(open("%s.cell" % self.calc_path).read())
+
+    self.assertEqual(len(traj), 1)
+    self.assertEqual(traj.species.tolist(), c.ions.species_array.tolist())
+    self.assertTrue(numpy.allclose(traj.positions[0], c.ions.positions, atol=1e-5))
+    self.assertTrue(numpy.allclose(traj.lattices[0], c.ions.lattice))
+    self.assertAlmostEqual(traj.energies[0], -848.47569609)
+    self.assertTrue(numpy.allclose(traj.forces[0,0], [-0.15013, -0.02447, -0.10400]))
+
+    self.assertEqual(str(traj[0].C1), str(c.ions.C1))
+    self.assertTrue(numpy.allclose(traj.cell(0).ions.positions, traj.positions[0]))
+
+  def test_steps(self):
+    path = os.path.join(self.tmp, "relax.castep")
+
+    with open(path, "w") as f:
+      f.write(relax_steps)
+
+    traj = Trajectory.from_castep(path)
+
+    self.assertEqual(len(traj), 2)
+    self.assertTrue(numpy.allclose(traj.positions[:,1,0], [1.0, 1.0]))
+    self.assertTrue(numpy.allclose(traj.lattices[:,0,0], [4.0, 5.0]))
+    self.assertEqual(traj.energies[0], -100.5)
+    self.assertTrue(numpy.isnan(traj.energies[1]))
+    self.assertTrue(numpy.allclose(traj.forces[0,:,0], [0.1, -0.1]))
+    self.assertTrue(numpy.isnan(traj.forces[1]).all())
+
+  def test_from_cells(self):
+    c1 = cell.Cell(open("%s.cell" % self.calc_path).read())
+    c2 = cell.Cell(open("%s.cell" % self.calc_path).read())
+
+    self.assertEqual(len(Trajectory.from_cells([c1, c2])), 2)
+
+    # Same species in the same order, but not the same atoms
+    indices = c2.ions.indices_array.copy()
+    indices[:2] = indices[1::-1]
+    c2.ions = AtomsView.from_arrays(c2.ions.species_array, indices, c2.ions.positions, lattice=c2.ions.lattice)
+
+    self.assertRaises(ValueError, Trajectory.from_cells, [c1, c2])
+
+  def test_save_slice(self):
+    c = cell.Cell(open("%s.cell" % self.calc_path).read())
+    traj = Trajectory.from_cells([c] * 5)
+    traj.positions[:] += numpy.arange(5)[:,None,None]
+
+    traj.save(self.tmp)
+    loaded = Trajectory.load(self.tmp)
+
+    self.assertTrue(isinstance(loaded.positions, numpy.memmap))
+    self.assertTrue(loaded.forces is None)
+
+    part = loaded[1::2]
+    self.assertEqual(len(part), 2)
+    self.assertTrue(isinstance(part.positions, numpy.memmap))
+    self.assertTrue(numpy.allclose(part.positions[:,0], c.ions.positions[0] + [[1], [3]]))
+    self.assertTrue(numpy.allclose([frame.positions[0,0] for frame in part], [c.ions.positions[0,0] + 1, c.ions.positions[0,0] + 3]))
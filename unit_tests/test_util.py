@@ -10,6 +10,14 @@ class CalcFromPathTest(unittest.TestCase):
     for input, expected in self.tests_pass:
       self.assertEqual(utils.calc_from_path(input), expected)
 
+class ScanCalcsTest(unittest.TestCase):
+  def test_test_data(self):
+    self.assertEqual(utils.scan_calcs("test_data"),
+                     [('test_data', 'lattice_not_implemented'),
+                      ('test_data', 'lattice_wrong_shape'),
+                      ('test_data/ethanol', 'ethanol'),
+                      ('test_data/ethanol/test_relax', 'ethanol')])
+
 if __name__ == "__main__":
   unittest.main()
 